@@ -6,11 +6,30 @@ import multiprocessing
 
 from seqscan.data.trajectory import Trajectory
 from seqscan.data.point import Point
-from seqscan.seqscan import SeqScan
+from seqscan.data.row_filter import RowFilter
+from seqscan.data.run_summary import RunSummary
+from seqscan.data.trajectory_table import TrajectoryTable
+from seqscan.seqscan import SeqScan, TimeBudgetExceeded, convert_time_to_s
+from seqscan.pipeline import prefetch, AsyncWriter
+from seqscan.scheduling import lpt_batches, timed_task, admit, WorkerUsage
+from seqscan.preflight import PreflightReport, table_costs, unit_cost
+from seqscan.shards import Shard, shard_path, merge_shards, append_journal, journal_entry
+from seqscan.sharding import ShardSpec, write_manifest
+from seqscan.checkpoint import RunManifest, run_manifest_path, file_fingerprint, COMPLETE
+from seqscan.cache import ResultCache, DEFAULT_MAX_BYTES
+from seqscan.snapshot import Snapshot
+from seqscan.online import OnlineSeqScan
+from seqscan.stream import EventWriter
+from seqscan.sweep import sweep
+from seqscan.graph_store import GraphStore
+from seqscan.estimate import estimate as estimate_parameters, trajectory_arrays
+from seqscan.approx import ApproximationReport, approximate_result, compare
 
 from datetime import datetime
 
 import json
+import random
+import time
 
 with open('.\config.json') as f:
     config = json.load(f)
@@ -25,87 +44,473 @@ Y_COLUMN = config["CSV_columns"]["Y_COLUMN"]
 
 TIME_UNIT = config["UNITS"]["TIME"]
 
+# number of input files loaded ahead of the one being clustered, in folder mode
+PREFETCH_DEPTH = 2
+# number of outputs waiting for the background writer before clustering blocks
+WRITER_QUEUE_SIZE = 8
+
+# what becomes of a trajectory over its time budget, see cluster_trajectory()
+STRAGGLER_REQUEUE = "requeue"
+STRAGGLER_DEGRADE = "degrade"
+
+# rows read at a time from a trajectory processed out of core
+DEFAULT_WINDOW_ROWS = 100000
+# trajectories drawn from a bulk input to estimate its parameters
+DEFAULT_SAMPLE_TAGS = 50
+
+
+# State of a pool worker, set once per process by _init_worker: a mainRun
+# holding the run parameters and, in file mode, the shared trajectory table.
+_worker = None
+_worker_table = None
+_worker_shm = None
+
+
+def _init_worker(params, table_descriptor=None):
+    global _worker, _worker_table, _worker_shm
+    _worker = mainRun()
+    _worker.__dict__.update(params)
+    if table_descriptor is not None:
+        _worker_table, _worker_shm = TrajectoryTable.attach(table_descriptor)
+
+
+def _run_trajectory_batch(task):
+    """Pool task: clusters the trajectories of the shared table given by their
+    offsets (index, tag, start, stop) into the files of a Shard.
+    Returns (pid, busy seconds, shard)."""
+    shard, runs = task
+    batch = ((index, _worker_table.slice_trajectory(tag, start, stop)) for index, tag, start, stop in runs)
+    return timed_task(_worker.process_trajectory_batch, (shard, batch))
+
+
+def _run_file_batch(task):
+    """Pool task: clusters a list of (index, file), recording them in the
+    journal if not None. Returns (pid, busy seconds, summaries)."""
+    return timed_task(lambda task: _worker.process_file_batch(*task), task)
 
 
 class mainRun():
 
-    def read_multi_traj_from_csv(self, path):
+    def read_multi_table_from_csv(self, path, row_filter=None):
+        """Reads a multi-trajectory csv file into a TrajectoryTable."""
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         col_list = [TAG_COLUMN, X_COLUMN, Y_COLUMN, TIME_COLUMN]
-        df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.read_csv(path, usecols=col_list, tag_column=TAG_COLUMN, time_column=TIME_COLUMN)[col_list]
         df.sort_values(by=[TAG_COLUMN, TIME_COLUMN])
-        data_list = df.values.tolist()
-        points_list = list()
-        self.list_trajectories = list()
-
-        tag1 = data_list[0][0]
-        for l in data_list:
-            # print(l)
-            if l[0] == tag1:
-                p = Point(l[1], l[2], datetime.strptime(l[3], TIMESTAMP_FORMAT))
-                points_list.append(p)
-
-            else:
-                trajectory = Trajectory(points_list, tag_id=tag1)
-                self.list_trajectories.append(trajectory)
-                tag1 = l[0]
-                points_list = list()
-                p = Point(l[1], l[2], datetime.strptime(l[3], TIMESTAMP_FORMAT))
-                points_list.append(p)
-
-        trajectory = Trajectory(points_list, tag_id=tag1)
-        self.list_trajectories.append(trajectory)
-
-    def read_single_traj_from_csv(self, path):
+        return TrajectoryTable.from_frame(df, TAG_COLUMN, X_COLUMN, Y_COLUMN, TIME_COLUMN, TIMESTAMP_FORMAT)
+
+    def read_multi_traj_from_csv(self, path, row_filter=None):
+        table = self.read_multi_table_from_csv(path, row_filter)
+        self.list_trajectories = [table.trajectory(i) for i in range(len(table))]
+
+    def read_single_traj_from_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         tag_id=None
         col_list = [X_COLUMN, Y_COLUMN, TIME_COLUMN]
-        df = pd.read_csv(path)#, usecols=col_list)
-        if TAG_COLUMN in df.columns:
+        # single read: the tag column is loaded together with the coordinates, when present
+        df = pd.read_csv(path, usecols=lambda c: c == TAG_COLUMN or c in col_list)
+        if TAG_COLUMN in df.columns and len(df) > 0:
             tag_id=df[TAG_COLUMN].iloc[0]
 
-        df = pd.read_csv(path , usecols=col_list)[col_list]
-        df.sort_values(by=[TIME_COLUMN])
-        data_list = df.values.tolist()
-        points_list = list()
-        # self.list_trajectories=list()
-
-        for l in data_list:
-            p = Point(l[0], l[1], datetime.strptime(l[2], TIMESTAMP_FORMAT))
-            points_list.append(p)
+        df = row_filter.filter_frame(df[col_list], time_column=TIME_COLUMN)
+        points_list = self.points_from_frame(df)
 
         trajectory = Trajectory(points_list, tag_id=tag_id)
-        # self.list_trajectories.append(trajectory)
         return trajectory
 
-    def process_single_file(self, f):
-        print('ok')
+    def points_from_frame(self, df):
+        """Converts the X, Y and TIME columns of df to a list of Point.
+
+        Timestamps are parsed in one vectorized call instead of one strptime
+        per row.
+        """
+        timestamps = pd.to_datetime(df[TIME_COLUMN], format=TIMESTAMP_FORMAT).dt.to_pydatetime()
+        return [Point(x, y, t) for x, y, t in zip(df[X_COLUMN].tolist(), df[Y_COLUMN].tolist(), timestamps)]
+
+    def load_single_file(self, f):
+        return self.read_single_traj_from_csv(f, self.row_filter)
+
+    def output_paths_of(self, f):
         f_output = os.path.basename(f)
         out_classification = self.output_folder + 'output_' + f_output
         out_symbolic = self.output_folder_symbolic + 'output_symbolic' + f_output
-        self.run_ss_single_mode(self.eps, self.delta, self.n, f, out_classification, out_symbolic)
-        del f_output
+        return out_classification, out_symbolic
+
+    def process_file_batch(self, files, journal=None):
+        """Clusters a list of (index, file), loading the next files and writing
+        the previous ones while clustering. Returns the RunSummary of each file.
+
+        With a journal, each file is recorded there once its outputs are written.
+        """
+        summaries = []
+        with AsyncWriter(WRITER_QUEUE_SIZE) as writer:
+            for (index, f), trajectory in prefetch(files, lambda item: self.load_single_file(item[1]),
+                                                   PREFETCH_DEPTH):
+                out_classification, out_symbolic = self.output_paths_of(f)
+                summary = self.run_ss_on_trajectory(self.eps, self.delta, self.n, trajectory, out_classification,
+                                                    out_symbolic, input_path_f=f, writer=writer, index=index)
+                if summary is not None:
+                    summaries.append(summary)
+                    if journal is not None and summary.status != RunSummary.CANCELLED:
+                        entry = journal_entry(summary, files=[out_classification, out_symbolic])
+                        writer.call(lambda entry=entry: append_journal(journal, entry))
+        return summaries
+
+    def process_single_file(self, f):
+        print('ok')
+        out_classification, out_symbolic = self.output_paths_of(f)
+        self.run_ss_single_mode(self.eps, self.delta, self.n, f, out_classification, out_symbolic,
+                                row_filter=self.row_filter)
+
+    def run_ss_single_mode(self, eps, delta, n, input_path_f, output_path, output_path_symbolic, time_range=None,
+                           row_filter=None, max_processors=1, cache_dir=None, cache_size=DEFAULT_MAX_BYTES,
+                           snapshot=None, window_rows=None, max_context=None, graph_dir=None, approximate=False,
+                           stationary_tolerance=None, min_interval=None, min_displacement=None):
+        """Runs SeqScan on a single trajectory file.
+
+        With max_processors > 1 the trajectory is split where clustering
+        cannot carry over and its segments are clustered in parallel, with the
+        same results as a sequential run.
+
+        With a cache_dir, results are cached there (see seqscan/cache.py), up
+        to cache_size bytes, and reruns of the same trajectory and parameters
+        read them back.
+
+        With a snapshot path, the state reached at the end of the trajectory
+        is saved there (see seqscan/snapshot.py): once points are appended to
+        the trajectory, resume_single_mode() only processes the new ones. The
+        options it does not support raise ValueError.
+
+        With window_rows, the trajectory is processed out of core, see
+        run_ss_windowed(); the options it does not support raise ValueError.
+
+        With a graph_dir, the neighbor graph of the trajectory is stored there
+        (see seqscan/graph_store.py) and later runs with the same or a smaller
+        eps read it back instead of searching the neighborhoods.
+
+        With approximate=True, the faster approximate engine of
+        seqscan/approx.py is run instead of the exact one.
+
+        With a stationary_tolerance (in units of eps), the runs of consecutive
+        positions within that distance are collapsed into weighted points
+        before clustering, see seqscan/stationary.py.
+
+        With a min_interval (in the time unit of the configuration) or a
+        min_displacement (in units of eps), the bursts of the trajectory are
+        thinned before clustering (see Trajectory.thin()); the outputs still
+        have one row per input row.
+        """
+        self.approximate = approximate
+        self.stationary_tolerance = stationary_tolerance
+        self.min_interval = min_interval
+        self.min_displacement = min_displacement
+        if window_rows is not None:
+            self.reject_options("window_rows", max_processors=max_processors > 1, cache_dir=cache_dir is not None,
+                                snapshot=snapshot is not None, graph_dir=graph_dir is not None,
+                                approximate=approximate, stationary_tolerance=stationary_tolerance is not None,
+                                min_interval=bool(min_interval), min_displacement=bool(min_displacement))
+            return self.run_ss_windowed(eps, delta, n, input_path_f, output_path, output_path_symbolic,
+                                        time_range=time_range, row_filter=row_filter, window_rows=window_rows,
+                                        max_context=max_context)
+        if snapshot is not None:
+            self.reject_options("snapshot", max_processors=max_processors > 1, cache_dir=cache_dir is not None,
+                                graph_dir=graph_dir is not None, approximate=approximate,
+                                stationary_tolerance=stationary_tolerance is not None,
+                                min_interval=bool(min_interval), min_displacement=bool(min_displacement))
+        if cache_dir is not None:
+            self.result_cache = ResultCache(cache_dir, cache_size)
+        if graph_dir is not None:
+            self.graph_store = GraphStore(graph_dir)
+        if row_filter is None:
+            row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+
+        trajectory = self.read_single_traj_from_csv(input_path_f, row_filter)
+        if snapshot is not None:
+            return self.snapshot_trajectory(eps, delta, n, trajectory, output_path, output_path_symbolic, snapshot)
+        return self.run_ss_on_trajectory(eps, delta, n, trajectory, output_path, output_path_symbolic,
+                                         input_path_f=input_path_f, max_processors=max_processors)
+
+    @staticmethod
+    def reject_options(mode, **options):
+        """Raises ValueError for the options mode does not support, given
+        by name, that are set (true)."""
+        unsupported = [name for name, value in options.items() if value]
+        if unsupported:
+            raise ValueError("%s does not support %s" % (mode, ", ".join(unsupported)))
+
+    def run_ss_sweep(self, input_path_f, eps_values, delta_values, n_values, output_path=None, time_range=None,
+                     max_processors=1):
+        """Runs SeqScan on a single trajectory file with every combination of
+        the eps, delta and n values, sharing the spatial work of the runs (see
+        seqscan/sweep.py), and compares them.
+
+        Returns the comparison table, one row per setting (delta in the time
+        unit of the configuration), also written to output_path when given.
+        """
+        row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+        trajectory = self.read_single_traj_from_csv(input_path_f, row_filter)
+        presences = {self.convert_time_to_s(delta): delta for delta in delta_values}
+        table = sweep(trajectory, eps_values, n_values, list(presences), max_processors=max_processors)
+        table.insert(2, "delta", table["presence"].map(presences))
+        if output_path is not None:
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            table.to_csv(output_path, index=False)
+        return table
+
+    def run_ss_windowed(self, eps, delta, n, input_path_f, output_path, output_path_symbolic, time_range=None,
+                        row_filter=None, window_rows=DEFAULT_WINDOW_ROWS, max_context=None):
+        """Runs SeqScan on a single trajectory file too large to be loaded.
+
+        The file, sorted by time, is read window_rows rows at a time (the next
+        window is parsed while the current one is clustered) and its points
+        are pushed to an incremental scan (see seqscan/online.py), whose
+        labels and stops are written as soon as they are final. Only the
+        points of the active time context are held, instead of the whole
+        trajectory; max_context (seconds) bounds them further by cutting the
+        trajectory when no stop ends for that long. The outputs are the same
+        as run_ss_single_mode() without max_context.
+
+        Raises:
+            ValueError if the rows of the file are not sorted by time
+        """
+        if row_filter is None:
+            row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+        for directory in (os.path.dirname(output_path), os.path.dirname(output_path_symbolic)):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        col_list = [X_COLUMN, Y_COLUMN, TIME_COLUMN]
+        windows = pd.read_csv(input_path_f, usecols=lambda c: c == TAG_COLUMN or c in col_list,
+                              chunksize=max(1, window_rows))
+        writer = EventWriter(output_path, output_path_symbolic)
+        scan = None
+        points = 0
+        run_start = time.perf_counter()
+        for window, rows in prefetch(windows, lambda df: self.rows_from_frame(row_filter, df)):
+            if scan is None:
+                tag_id = window[TAG_COLUMN].iloc[0] if TAG_COLUMN in window.columns and len(window) > 0 else None
+                scan = OnlineSeqScan(eps, n, self.convert_time_to_s(delta), tag_id=tag_id, max_context=max_context)
+            writer(scan.extend(rows))
+            points += len(rows)
+        if scan is None:
+            scan = OnlineSeqScan(eps, n, self.convert_time_to_s(delta))
+        writer(scan.close())
+        if writer.labels == 0:
+            # empty trajectory: the outputs still get their header
+            SeqScan(Trajectory(tag_id=scan.tag_id), output_path, output_path_symbolic).exportEvents([])
+
+        print(scan.tag_id, ': ', points, ' points, ', writer.stops, ' stops, out of core')
+        return RunSummary(0, scan.tag_id, points, writer.stops, time.perf_counter() - run_start, output_path)
+
+    def rows_from_frame(self, row_filter, df):
+        """The (x, y, timestamp) of the rows of df selected by row_filter."""
+        df = row_filter.filter_frame(df[[X_COLUMN, Y_COLUMN, TIME_COLUMN]], time_column=TIME_COLUMN)
+        timestamps = pd.to_datetime(df[TIME_COLUMN], format=TIMESTAMP_FORMAT).dt.to_pydatetime()
+        return list(zip(df[X_COLUMN].tolist(), df[Y_COLUMN].tolist(), timestamps))
+
+    def snapshot_trajectory(self, eps, delta, n, trajectory, output_path, output_path_symbolic, snapshot):
+        """Runs SeqScan on trajectory, saving its final state to snapshot."""
+        for directory in (os.path.dirname(output_path), os.path.dirname(output_path_symbolic)):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        seqscan = SeqScan(trajectory, output_path, output_path_symbolic, silent=False)
+        run_start = time.perf_counter()
+        result = seqscan.run_snapshot(eps, n, self.convert_time_to_s(delta), snapshot)
+        return RunSummary(0, trajectory.tag_id, len(result), len(seqscan.clusters), time.perf_counter() - run_start,
+                          output_path)
+
+    def resume_single_mode(self, input_path_f, output_path, output_path_symbolic, snapshot, whole=False):
+        """Carries on a run_ss_single_mode() that saved snapshot, with the
+        points appended to its trajectory since, and the same parameters.
+
+        input_path_f holds the new points only or, with whole=True, the whole
+        trajectory, whose points already in the snapshot are skipped. The
+        outputs of the earlier run are completed so as to be those of a run
+        on the whole trajectory. Returns the RunSummary of the rows rewritten.
+        """
+        trajectory = self.read_single_traj_from_csv(input_path_f, RowFilter(ts_format=TIMESTAMP_FORMAT))
+        if whole:
+            skipped = Snapshot.load(snapshot).points
+            trajectory = Trajectory(list(trajectory)[skipped:], tag_id=trajectory.tag_id)
+        seqscan = SeqScan(trajectory, output_path, output_path_symbolic, silent=False)
+        run_start = time.perf_counter()
+        result = seqscan.resume(snapshot)
+        print(trajectory.tag_id, ': ', len(trajectory), ' new points, ', len(result), ' rows rewritten')
+        return RunSummary(0, trajectory.tag_id, len(result), len(seqscan.clusters), time.perf_counter() - run_start,
+                          output_path)
+
+    def run_ss_on_trajectory(self, eps, delta, n, trajectory, output_path, output_path_symbolic, input_path_f=None,
+                             writer=None, index=0, max_processors=1):
+        if len(trajectory) == 0:
+            print('No rows of ', input_path_f, ' match the requested time_range')
+            return
 
-    def run_ss_single_mode(self, eps, delta, n, input_path_f, output_path, output_path_symbolic):
         directory = os.path.dirname(output_path)
         # Create directories if they do not exist
         os.makedirs(directory, exist_ok=True)
         directory = os.path.dirname(output_path_symbolic)
         os.makedirs(directory, exist_ok=True)
 
-        trajectory = self.read_single_traj_from_csv(input_path_f)
-        seqscan = SeqScan(trajectory, output_path, output_path_symbolic, silent=False, multi_mode=0)
-        seqscan.run(eps, n, self.convert_time_to_s(delta))
-        del seqscan
-
-    def process_one_trajectory_of_multi(self, traj):
-        seqscan = SeqScan(traj, self.output_file, self.output_file_symbolic, silent=False, multi_mode=2)
-        seqscan.run(self.eps, self.n, self.convert_time_to_s(self.delta))
-        del seqscan
+        return self.cluster_trajectory(trajectory, eps, delta, n, output_path, output_path_symbolic,
+                                       writing_mode=0, writer=writer, index=index, max_processors=max_processors)
+
+    def cluster_trajectory(self, trajectory, eps, delta, n, output_path, output_path_symbolic, writing_mode=0,
+                           writer=None, index=None, max_processors=1):
+        """Runs SeqScan on trajectory and returns its RunSummary, or None if it failed.
+
+        The annotated trajectory is only kept in the summary when full results
+        were requested (return_results), so that workers send back a few
+        numbers instead of every point.
+
+        With a time_budget, a trajectory still running when it is spent is
+        cancelled: with straggler="requeue" nothing is written and the summary
+        has status CANCELLED, for the caller to run it again at the end; with
+        straggler="degrade" it is run again at once in SeqScan's degraded mode
+        on thinned points, with status DEGRADED.
+        """
+        seqscan = SeqScan(trajectory, output_path, output_path_symbolic, silent=False, multi_mode=writing_mode,
+                          writer=writer, cache=getattr(self, 'result_cache', None),
+                          graphs=getattr(self, 'graph_store', None))
+        run_start = time.perf_counter()
+        status = RunSummary.OK
+        try:
+            if getattr(self, 'approximate', False):
+                result = seqscan.run_approximate(eps, n, self.convert_time_to_s(delta))
+                return RunSummary(index, trajectory.tag_id, len(result), len(seqscan.clusters),
+                                  time.perf_counter() - run_start, output_path,
+                                  result=result if getattr(self, 'return_results', False) else None)
+            result = seqscan.run(eps, n, self.convert_time_to_s(delta), max_processors=max_processors,
+                                 time_budget=getattr(self, 'time_budget', None), **self.prestage_params())
+        except TimeBudgetExceeded as exceeded:
+            if getattr(self, 'straggler', STRAGGLER_REQUEUE) == STRAGGLER_REQUEUE:
+                print(trajectory.tag_id, ' is over the time budget (', exceeded, '): requeued')
+                return RunSummary(index, trajectory.tag_id, len(trajectory), 0, time.perf_counter() - run_start, None,
+                                  status=RunSummary.CANCELLED)
+            print(trajectory.tag_id, ' is over the time budget (', exceeded, '): degraded mode, 1 point out of ',
+                  exceeded.thinning())
+            seqscan = SeqScan(trajectory, output_path, output_path_symbolic, silent=False, multi_mode=writing_mode,
+                              writer=writer)
+            result = seqscan.run(eps, n, self.convert_time_to_s(delta), thinning=exceeded.thinning(),
+                                 **self.prestage_params())
+            status = RunSummary.DEGRADED
+        runtime = time.perf_counter() - run_start
+        if result is None:
+            return None
+
+        return RunSummary(index, trajectory.tag_id, len(result), len(seqscan.clusters), runtime, output_path,
+                          result=result if getattr(self, 'return_results', False) else None, status=status)
+
+    def prestage_params(self):
+        """The arguments of SeqScan.run() reducing the points before clustering."""
+        min_interval = getattr(self, 'min_interval', None)
+        return {"stationary_tolerance": getattr(self, 'stationary_tolerance', None),
+                "min_interval": self.convert_time_to_s(min_interval) if min_interval is not None else None,
+                "min_displacement": getattr(self, 'min_displacement', None)}
+
+    def process_trajectory_batch(self, task):
+        """Clusters a batch of (index, trajectory) into the files of a Shard.
+
+        The first trajectory written to the shard also writes the headers.
+        """
+        shard, batch = task
+        with AsyncWriter(WRITER_QUEUE_SIZE) as writer:
+            for index, traj in batch:
+                summary = self.cluster_trajectory(traj, self.eps, self.delta, self.n, shard.path, shard.path_symbolic,
+                                                  writing_mode=shard.next_writing_mode(), writer=writer, index=index,
+                                                  max_processors=getattr(self, 'segment_processors', 1))
+                if summary is not None and summary.status == RunSummary.CANCELLED:
+                    shard.cancelled.append(index)
+                elif summary is not None:
+                    shard.has_header = True
+                    shard.add_unit(summary)
+                    if shard.journal is not None:
+                        writer.call(lambda summary=summary: shard.checkpoint(summary))
+                print(traj.tag_id, ' is done')
+        return shard
+
+    def worker_params(self):
+        """The attributes a pool worker needs, sent once per worker process
+        instead of pickling this instance with every task."""
+        names = ['eps', 'delta', 'n', 'return_results', 'row_filter', 'output_folder', 'output_folder_symbolic',
+                 'result_cache', 'graph_store', 'time_budget', 'straggler', 'approximate', 'stationary_tolerance',
+                 'min_interval', 'min_displacement']
+        return {name: getattr(self, name) for name in names if hasattr(self, name)}
 
     def run_ss_multi_mode(self, eps, delta, n, input_folder=None, output_folder=None, input_file=None, output_file=None,
-                          max_processors=1):
+                          max_processors=1, input_tags=None, time_range=None, return_results=False, shard=None,
+                          resume=False, cache_dir=None, cache_size=DEFAULT_MAX_BYTES, memory_budget=None,
+                          time_budget=None, straggler=STRAGGLER_REQUEUE, graph_dir=None, approximate=False,
+                          stationary_tolerance=None, min_interval=None, min_displacement=None):
+        """Runs SeqScan over many trajectories.
+
+        Returns the RunSummary of every trajectory, in input order. With
+        return_results=True the summaries also carry the annotated
+        trajectories, which then have to be sent back by the workers.
+
+        With shard="i/N" only the tags (input_file) or files (input_folder)
+        of shard i are processed, see seqscan/sharding.py: the outputs go to
+        <output_file>.shard<i>of<N>.csv (or to output_folder) together with a
+        manifest, and merge_manifests() rebuilds the single-node outputs.
+
+        With resume=True the run keeps a manifest of its progress next to its
+        outputs (see seqscan/checkpoint.py): started again after a crash with
+        the same parameters, it skips the trajectories or files already done.
+
+        With a cache_dir, SeqScan results are cached there by content (see
+        seqscan/cache.py), up to cache_size bytes: later runs over the same
+        trajectories and parameters read them back instead of clustering.
+
+        With a memory_budget (bytes), a preflight estimates the peak memory of
+        every trajectory (see preflight()) and workers are only given tasks
+        while the estimates of the running ones fit the budget; trajectories
+        needing more than half of it run alone.
+
+        With a time_budget (seconds), a trajectory whose clustering takes
+        longer is cancelled, then with straggler="requeue" run again without
+        budget once all the others are done, or with straggler="degrade" run
+        again at once on thinned points. The status of each trajectory is in
+        its RunSummary and stragglers are listed at the end of the run.
+
+        With a graph_dir, the neighbor graphs of the trajectories are stored
+        there (see seqscan/graph_store.py): later runs read them back, memory-
+        mapped and shared by the workers, and the preflight uses them.
+
+        With approximate=True, the faster approximate engine of
+        seqscan/approx.py is run instead of the exact one, see
+        approximation_report() for its accuracy.
+
+        With a stationary_tolerance (in units of eps), the runs of consecutive
+        positions within that distance are collapsed into weighted points
+        before clustering, see seqscan/stationary.py.
+
+        With a min_interval (in the time unit of the configuration) or a
+        min_displacement (in units of eps), the bursts of the trajectories are
+        thinned before clustering, see Trajectory.thin().
+        """
         self.eps = eps
         self.delta = delta
         self.n = n
+        self.return_results = return_results
+        self.approximate = approximate
+        self.stationary_tolerance = stationary_tolerance
+        self.min_interval = min_interval
+        self.min_displacement = min_displacement
+        self.row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
+        self.result_cache = ResultCache(cache_dir, cache_size) if cache_dir is not None else None
+        self.graph_store = GraphStore(graph_dir) if graph_dir is not None else None
+        if straggler not in (STRAGGLER_REQUEUE, STRAGGLER_DEGRADE):
+            print('straggler must be ', STRAGGLER_REQUEUE, ' or ', STRAGGLER_DEGRADE)
+            return
+        self.time_budget = time_budget
+        self.straggler = straggler
+        self.next_shard = 0
+        self.shard = ShardSpec.parse(shard)
+        shard_params = {"eps": eps, "delta": delta, "n": n, "input_tags": input_tags, "time_range": time_range}
+        run_params = dict(shard_params, shard=str(self.shard), config=config)
 
         if input_file is None and input_folder is None:
             print('Please specify if input_file or input_folder')
@@ -141,44 +546,357 @@ class mainRun():
             file_name = "symbolic_" + os.path.basename(output_file)
             directory = os.path.dirname(output_file)
             self.output_file_symbolic = os.path.join(directory, file_name)
-
-            self.read_multi_traj_from_csv(input_file)
-            trajectory1 = self.list_trajectories[0]
-            seqscan = SeqScan(trajectory1, self.output_file, self.output_file_symbolic, silent=False, multi_mode=1)
-            seqscan.run(eps, n, self.convert_time_to_s(delta))
-            print(trajectory1.tag_id, ' is done')
-
-            if self.parallelism:
-                with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
-                    res = ex.map(self.process_one_trajectory_of_multi, self.list_trajectories[1:])
-                return list(res)
-            else:
-                for traj in self.list_trajectories[1:]:
-                    self.process_one_trajectory_of_multi(traj)
-                    print(traj.tag_id, ' is done')
+            if self.shard is not None:
+                targets = {"classification": self.output_file, "symbolic": self.output_file_symbolic}
+                self.output_file = self.shard.output_path(self.output_file)
+                self.output_file_symbolic = self.shard.output_path(self.output_file_symbolic)
+
+            table = self.read_multi_table_from_csv(input_file, self.row_filter)
+            if len(table) == 0:
+                print('No rows of ', input_file, ' match the requested input_tags/time_range')
+                return
+            selected = [i for i, (tag, start, stop) in enumerate(table.runs)
+                        if self.shard is None or self.shard.owns(tag)]
+
+            # a lone trajectory is split into segments clustered in parallel instead
+            self.segment_processors = self.max_processors if len(selected) == 1 else 1
+
+            manifest = None
+            todo = selected
+            if resume:
+                # every task writes to a shard with a journal, merged at the end
+                manifest = RunManifest.open(run_manifest_path(output_file=self.output_file), "seqscan", "file",
+                                            input_file, run_params, [self.output_file, self.output_file_symbolic])
+                todo = manifest.plan([{"index": i, "tag": table.runs[i][0], "fingerprint": table.fingerprint(i)}
+                                      for i in selected])
+                if len(todo) < len(selected):
+                    print(len(selected) - len(todo), ' trajectories already done, ', len(todo), ' to go')
+
+            self.preflight_report = None
+            if memory_budget is not None and todo:
+                self.preflight_report = PreflightReport(table_costs(table, todo, eps, config["is_cartesian"],
+                                                                    self.graph_store),
+                                                        self.max_processors, memory_budget)
+                self.preflight_report.report()
+
+            # a serial run writes straight to the outputs, unless units may be
+            # written out of order (requeued) or must be journaled
+            direct = manifest is None and time_budget is None
+            shards = self.cluster_table(table, todo, manifest, direct)
+            cancelled = sorted(i for s in shards for i in s.cancelled)
+            if cancelled:
+                print(len(cancelled), ' trajectories over the time budget are run again')
+                self.time_budget = None
+                shards += self.cluster_table(table, cancelled, manifest, False)
+                self.time_budget = time_budget
+            summaries = sorted((u for s in shards for u in s.units), key=lambda u: u.index)
+            for u in summaries:
+                if u.index in cancelled:
+                    u.status = RunSummary.REQUEUED
+            self.report_stragglers(summaries)
+
+            if manifest is None and not (len(shards) == 1 and shards[0].path == self.output_file):
+                merge_shards(shards, self.output_file, self.output_file_symbolic)
+            elif manifest is not None:
+                manifest.collect()
+                if manifest.status != COMPLETE:
+                    merge_shards(manifest.done_shards(self.output_file, self.output_file_symbolic), self.output_file,
+                                 self.output_file_symbolic, remove=False)
+                    manifest.complete()
+                summaries = self.resumed_summaries(manifest, summaries, self.output_file)
+
+            if self.shard is not None:
+                write_manifest(self.shard.manifest_path(output_file=output_file), "seqscan", self.shard, "file",
+                               input_file, shard_params, targets,
+                               {"classification": self.output_file, "symbolic": self.output_file_symbolic},
+                               [{"index": u.index, "tag": u.tag_id,
+                                 "lines": {"classification": u.points, "symbolic": u.stops}} for u in summaries])
+            return summaries
 
 
         elif input_folder is not None:
             self.output_folder = output_folder
             self.output_folder_symbolic = output_folder + '/symbolic/'
-            csv_input_files = glob.glob(os.path.join(input_folder, "*.csv"))
+            csv_input_files = [f for f in glob.glob(os.path.join(input_folder, "*.csv"))
+                               if self.row_filter.accepts_file(f, TAG_COLUMN)]
+            files = [(i, f) for i, f in enumerate(csv_input_files)
+                     if self.shard is None or self.shard.owns(os.path.basename(f))]
+
+            manifest = None
+            todo = files
+            if resume:
+                manifest = RunManifest.open(run_manifest_path(output_folder=output_folder, shard=self.shard),
+                                            "seqscan", "folder", input_folder, run_params)
+                planned = set(manifest.plan([{"index": i, "file": os.path.basename(f),
+                                              "fingerprint": file_fingerprint(f)} for i, f in files]))
+                todo = [(i, f) for i, f in files if i in planned]
+                if len(todo) < len(files):
+                    print(len(files) - len(todo), ' files already done, ', len(todo), ' to go')
+
+            self.preflight_report = None
+            if memory_budget is not None and todo:
+                self.preflight_report = PreflightReport(self.file_costs(todo, eps), self.max_processors, memory_budget)
+                self.preflight_report.report()
+
+            summaries = self.cluster_files(todo, manifest)
+            cancelled = set(s.index for s in summaries if s.status == RunSummary.CANCELLED)
+            if cancelled:
+                print(len(cancelled), ' files over the time budget are run again')
+                summaries = [s for s in summaries if s.status != RunSummary.CANCELLED]
+                self.time_budget = None
+                requeued = self.cluster_files([(i, f) for i, f in todo if i in cancelled], manifest)
+                self.time_budget = time_budget
+                for s in requeued:
+                    s.status = RunSummary.REQUEUED
+                summaries += requeued
+            summaries = sorted(summaries, key=lambda s: s.index)
+            self.report_stragglers(summaries)
+
+            if manifest is not None:
+                manifest.collect()
+                manifest.complete()
+                summaries = self.resumed_summaries(manifest, summaries)
+
+            if self.shard is not None:
+                names = dict(files)
+                write_manifest(self.shard.manifest_path(output_folder=output_folder), "seqscan", self.shard, "folder",
+                               input_folder, shard_params, {"folder": output_folder}, {},
+                               [{"index": s.index, "file": os.path.basename(names[s.index]),
+                                 "files": list(self.output_paths_of(names[s.index]))} for s in summaries])
+            return summaries
+
+
+    def approximation_report(self, eps, delta, n, input_path_f=None, input_file=None, input_folder=None,
+                             input_tags=None, time_range=None, output_path=None):
+        """Runs the exact and the approximate engines (see seqscan/approx.py)
+        on the trajectories of a single trajectory file, a multi-trajectory
+        file or a folder, without writing their outputs, and compares them.
+
+        Returns the ApproximationReport, with one row per trajectory (agreement
+        of the point labels, stops found and matched, offsets of their ends in
+        seconds, runtimes), also written to output_path when given.
+        """
+        row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
+        if input_path_f is not None:
+            trajectories = [self.read_single_traj_from_csv(input_path_f, row_filter)]
+        elif input_file is not None:
+            table = self.read_multi_table_from_csv(input_file, row_filter)
+            trajectories = (table.trajectory(i) for i in range(len(table)))
+        elif input_folder is not None:
+            trajectories = (self.read_single_traj_from_csv(f, row_filter)
+                            for f in sorted(glob.glob(os.path.join(input_folder, "*.csv")))
+                            if row_filter.accepts_file(f, TAG_COLUMN))
+        else:
+            print('Please specify input_path_f, input_file or input_folder')
+            return
 
-            if self.parallelism:
-                with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
-                    res = ex.map(self.process_single_file, csv_input_files)
-                return list(res)
-            else:
-                for f in csv_input_files:
-                    self.process_single_file(f)
+        presence = self.convert_time_to_s(delta)
+        rows = []
+        for trajectory in trajectories:
+            if len(trajectory) == 0:
+                continue
+            start = time.perf_counter()
+            exact = SeqScan(trajectory, None, None).result(eps, n, presence)
+            exact_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            approximate = approximate_result(sorted(trajectory, key=lambda p: p.timestamp), eps, n, presence,
+                                             config["is_cartesian"])
+            row = compare(exact, approximate)
+            row.update(tag=trajectory.tag_id, exact_seconds=exact_seconds,
+                       approx_seconds=time.perf_counter() - start)
+            rows.append(row)
+
+        report = ApproximationReport(rows)
+        report.report()
+        if output_path is not None:
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            report.save(output_path)
+        return report
+
+    def estimate_parameters(self, input_path_f=None, input_file=None, input_folder=None, max_tags=DEFAULT_SAMPLE_TAGS,
+                            input_tags=None, time_range=None, output_path=None, seed=0):
+        """Suggests eps, n and delta ranges for a dataset from its k-distance
+        profile and its sampling (see seqscan/estimate.py), instead of many
+        full runs: a single trajectory file (input_path_f), or up to max_tags
+        trajectories drawn from a multi-trajectory file or a folder.
+
+        Returns the ParameterEstimate, deltas in the time unit of the
+        configuration: grid() gives the settings worth a run_ss_sweep().
+        The suggestions are also written to output_path when given.
+        """
+        row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
+        rng = random.Random(seed)
+        trajectories = []
+        if input_path_f is not None:
+            trajectories.append(trajectory_arrays(self.read_single_traj_from_csv(input_path_f, row_filter)))
+        elif input_file is not None:
+            table = self.read_multi_table_from_csv(input_file, row_filter)
+            for i in sorted(rng.sample(range(len(table)), min(max_tags, len(table)))):
+                tag, start, stop = table.runs[i]
+                order = table.t[start:stop].argsort(kind='stable')
+                trajectories.append((table.x[start:stop][order], table.y[start:stop][order],
+                                     table.t[start:stop][order] / 1e6))
+        elif input_folder is not None:
+            files = [f for f in sorted(glob.glob(os.path.join(input_folder, "*.csv")))
+                     if row_filter.accepts_file(f, TAG_COLUMN)]
+            for f in rng.sample(files, min(max_tags, len(files))):
+                trajectories.append(trajectory_arrays(self.read_single_traj_from_csv(f, row_filter)))
+        else:
+            print('Please specify input_path_f, input_file or input_folder')
+            return
 
+        estimate = estimate_parameters(trajectories, config["is_cartesian"], seed=seed, time_unit=TIME_UNIT,
+                                       time_scale=self.convert_time_to_s(1))
+        estimate.report()
+        if output_path is not None:
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            estimate.save(output_path)
+        return estimate
+
+    def preflight(self, eps, input_file=None, input_folder=None, max_processors=1, input_tags=None, time_range=None,
+                  memory_budget=None, shard=None, graph_dir=None):
+        """Estimates the runtime and peak memory of run_ss_multi_mode over the
+        same inputs, without running SeqScan (see seqscan/preflight.py).
+
+        Returns a PreflightReport: report() prints its summary, save(path)
+        writes the estimates of every trajectory (or file) to a csv file.
+        With the graph_dir of earlier runs, the densities of the trajectories
+        whose neighbor graph is stored there are exact.
+        """
+        row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
+        shard = ShardSpec.parse(shard)
+        if input_file is not None:
+            table = self.read_multi_table_from_csv(input_file, row_filter)
+            selected = [i for i, (tag, start, stop) in enumerate(table.runs) if shard is None or shard.owns(tag)]
+            graphs = GraphStore(graph_dir) if graph_dir is not None else None
+            costs = table_costs(table, selected, eps, config["is_cartesian"], graphs)
+        else:
+            files = [(i, f) for i, f in enumerate(glob.glob(os.path.join(input_folder, "*.csv")))
+                     if row_filter.accepts_file(f, TAG_COLUMN) and (shard is None or shard.owns(os.path.basename(f)))]
+            costs = self.file_costs(files, eps)
+        return PreflightReport(costs, max_processors, memory_budget)
+
+    def file_costs(self, files, eps):
+        """TrajectoryCost of each (index, file), from its coordinates only,
+        in file order."""
+        costs = []
+        for i, f in files:
+            df = pd.read_csv(f, usecols=[X_COLUMN, Y_COLUMN])
+            costs.append(unit_cost(i, os.path.basename(f), df[X_COLUMN].to_numpy(), df[Y_COLUMN].to_numpy(), eps,
+                                   config["is_cartesian"]))
+        return costs
+
+    def plan_batches(self, units, size):
+        """Groups units, (index, ...) tuples, into tasks with lpt_batches()
+        and returns the tasks, each in index order, with their estimated peak
+        memory. With a preflight report, heavy units are tasks of their own;
+        without, the memory is None."""
+        report = getattr(self, 'preflight_report', None)
+        if report is None:
+            return [sorted(batch) for batch in lpt_batches(units, size, self.max_processors)], None
+        costs = report.by_index()
+        heavy = sorted((u for u in units if costs[u[0]].heavy), key=lambda u: -costs[u[0]].peak_bytes)
+        light = [u for u in units if not costs[u[0]].heavy]
+        batches = [[u] for u in heavy] + [sorted(batch) for batch in lpt_batches(light, size, self.max_processors)]
+        return batches, [max(costs[u[0]].peak_bytes for u in batch) for batch in batches]
+
+    def pool_results(self, executor, function, tasks, memory=None):
+        """Results of the tasks on executor: in order with executor.map(), or
+        as they complete when admitted within the memory budget."""
+        if memory is None:
+            return executor.map(function, tasks)
+        return admit(executor, function, tasks, memory, self.preflight_report.memory_budget, self.max_processors)
+
+    def cluster_table(self, table, todo, manifest=None, direct=False):
+        """Clusters the trajectories of table of indices todo and returns the
+        Shards they were written to. Unless direct (a serial run writing
+        straight to the outputs), the shards are left for the caller to merge.
+        """
+        if not todo:
+            return []
+        if self.parallelism and len(todo) > 1:
+            # the points go to shared memory once; tasks only carry the offsets
+            # of their trajectories, and every task writes its own shard, merged
+            # back in input order. Largest trajectories are scheduled first,
+            # small ones are batched together.
+            units = [(i,) + tuple(table.runs[i]) for i in todo]
+            batches, memory = self.plan_batches(units, lambda u: u[3] - u[2])
+            tasks = [(self.new_shard(manifest), batch) for batch in batches]
+            shm, descriptor = table.to_shared_memory()
+            usage = WorkerUsage()
+            shards = []
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_processors, initializer=_init_worker,
+                                         initargs=(self.worker_params(), descriptor)) as ex:
+                    for pid, busy, shard in self.pool_results(ex, _run_trajectory_batch, tasks, memory):
+                        usage.record(pid, busy, len(shard.units))
+                        shards.append(shard)
+            finally:
+                shm.close()
+                shm.unlink()
+            self.report_usage(usage)
+            return shards
+
+        units = ((i, table.trajectory(i)) for i in todo)
+        shard = Shard(self.output_file, self.output_file_symbolic) if direct else self.new_shard(manifest)
+        return [self.process_trajectory_batch((shard, units))]
+
+    def cluster_files(self, todo, manifest=None):
+        """Clusters the (index, file) of todo, each into its own output files,
+        and returns their RunSummary."""
+        if self.parallelism:
+            # a few batches per worker, so that each worker can prefetch its next
+            # files; largest files first, small files batched together
+            batches, memory = self.plan_batches(todo, lambda item: os.path.getsize(item[1]))
+            tasks = [(batch, manifest.new_shard() if manifest is not None else None) for batch in batches]
+            usage = WorkerUsage()
+            summaries = []
+            with ProcessPoolExecutor(max_workers=self.max_processors, initializer=_init_worker,
+                                     initargs=(self.worker_params(),)) as ex:
+                for pid, busy, batch in self.pool_results(ex, _run_file_batch, tasks, memory):
+                    usage.record(pid, busy, len(batch))
+                    summaries.extend(batch)
+            self.report_usage(usage)
+            return summaries
+        return self.process_file_batch(todo, manifest.new_shard() if manifest is not None else None)
+
+    def report_stragglers(self, summaries):
+        """Prints the trajectories that went over the time budget."""
+        stragglers = [s for s in summaries if s.status != RunSummary.OK]
+        if stragglers:
+            print('Trajectories over the time budget:')
+            for s in stragglers:
+                print('  ', s.tag_id, ': ', s.status, ', ', round(s.runtime, 3), 's')
+
+    def new_shard(self, manifest=None):
+        """Shard of the next task of a file mode run; registered in the run
+        manifest, with a journal, when the run is resumable."""
+        if manifest is not None:
+            return manifest.new_shard(self.output_file, self.output_file_symbolic)
+        self.next_shard += 1
+        return Shard(shard_path(self.output_file, self.next_shard - 1),
+                     shard_path(self.output_file_symbolic, self.next_shard - 1))
+
+    def resumed_summaries(self, manifest, summaries, output_path=None):
+        """RunSummary of every unit of a resumed run: the ones computed now,
+        which may carry results, and the ones of the earlier runs."""
+        by_index = {s.index: s for s in manifest.summaries(output_path)}
+        by_index.update((s.index, s) for s in summaries)
+        return [by_index[i] for i in sorted(by_index)]
+
+    def report_usage(self, usage):
+        """Prints the per-worker utilization of a parallel run and keeps it
+        in self.worker_usage."""
+        usage.stop()
+        usage.report()
+        self.worker_usage = usage
 
     def convert_time_to_s(self, delta):
-        unit=TIME_UNIT
-        if unit=="min":
-            return delta*60
-        if unit=="d":
-            return delta*3600*24
-        return delta
+        return convert_time_to_s(delta, TIME_UNIT)
 
 
 
@@ -0,0 +1,127 @@
+"""Command line for multi-node bulk runs.
+
+Every node runs the same command with its own --shard i/N; once all the
+shards are done, merge rebuilds the outputs of a single-node run:
+
+    python run_shard.py seqscan --eps 1000 --delta 10 --n 5 --input-file ./input/atc_7traj.csv --output-file ./output/seqscan_atc_7traj.csv --shard 0/2
+    python run_shard.py seqscan --eps 1000 --delta 10 --n 5 --input-file ./input/atc_7traj.csv --output-file ./output/seqscan_atc_7traj.csv --shard 1/2
+    python run_shard.py merge --output-file ./output/seqscan_atc_7traj.csv
+
+The statistics runners take the same options (without eps, delta and n).
+preflight estimates the runtime and memory of a seqscan run beforehand:
+
+    python run_shard.py preflight --eps 1000 --input-file ./input/atc_7traj.csv --max-processors 4 --report costs.csv
+"""
+
+import argparse
+import sys
+
+from seqscan.sharding import find_manifests, merge_manifests
+
+
+def run_command(args):
+    common = dict(input_folder=args.input_folder, output_folder=args.output_folder, input_file=args.input_file,
+                  output_file=args.output_file, max_processors=args.max_processors,
+                  input_tags=args.tags.split(',') if args.tags else None,
+                  time_range=(args.start, args.end) if args.start or args.end else None,
+                  shard=args.shard)
+
+    if args.command == 'seqscan':
+        from main_runSeqScan import mainRun
+        mainRun().run_ss_multi_mode(args.eps, args.delta, args.n, resume=args.resume, cache_dir=args.cache_dir,
+                                    memory_budget=megabytes(args.memory_budget), time_budget=args.time_budget,
+                                    straggler=args.straggler, **common)
+    elif args.command == 'statistics':
+        from run_statistics import RunStatistics
+        RunStatistics().run_statistics_multi_mode(**common)
+    elif args.command == 'stops_statistics':
+        from run_statistics_on_stops import RunStopsStatistics
+        RunStopsStatistics().run_statistics_multi_mode(**common)
+    elif args.command == 'moves_statistics':
+        from run_statistics_on_moves import RunMovesStatistics
+        RunMovesStatistics().run_statistics_multi_mode(**common)
+
+
+def preflight_command(args):
+    from main_runSeqScan import mainRun
+    report = mainRun().preflight(args.eps, input_file=args.input_file, input_folder=args.input_folder,
+                                 max_processors=args.max_processors,
+                                 input_tags=args.tags.split(',') if args.tags else None,
+                                 time_range=(args.start, args.end) if args.start or args.end else None,
+                                 memory_budget=megabytes(args.memory_budget), shard=args.shard)
+    report.report()
+    if args.report:
+        report.save(args.report)
+    return 0
+
+
+def megabytes(value):
+    return int(value * 2 ** 20) if value is not None else None
+
+
+def merge_command(args):
+    manifests = args.manifests or find_manifests(args.output_file, args.output_folder)
+    if not manifests:
+        print('No shard manifest found')
+        return 1
+    result = merge_manifests(manifests, output_file=args.output_file if args.manifests else None,
+                             output_folder=args.output_folder if args.manifests else None, remove=args.remove)
+    print('Merged', len(manifests), 'shards into', result)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sharded bulk runs and merge of their outputs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('seqscan', 'statistics', 'stops_statistics', 'moves_statistics'):
+        p = commands.add_parser(name)
+        if name == 'seqscan':
+            p.add_argument('--eps', type=float, required=True)
+            p.add_argument('--delta', type=float, required=True)
+            p.add_argument('--n', type=int, required=True)
+            p.add_argument('--resume', action='store_true', help='skip the trajectories done by an interrupted run')
+            p.add_argument('--cache-dir', help='cache of SeqScan results, reused across runs')
+            p.add_argument('--memory-budget', type=float, help='MB the trajectories being clustered may use together')
+            p.add_argument('--time-budget', type=float, help='seconds a trajectory may take before it is cancelled')
+            p.add_argument('--straggler', choices=('requeue', 'degrade'), default='requeue',
+                           help='what becomes of a trajectory over the time budget')
+        p.add_argument('--input-file')
+        p.add_argument('--output-file')
+        p.add_argument('--input-folder')
+        p.add_argument('--output-folder')
+        p.add_argument('--max-processors', type=int, default=1)
+        p.add_argument('--tags', help='comma separated tags to process')
+        p.add_argument('--start', help='first timestamp to process')
+        p.add_argument('--end', help='last timestamp to process')
+        p.add_argument('--shard', help='i/N: process the shard i of N')
+
+    p = commands.add_parser('preflight')
+    p.add_argument('--eps', type=float, required=True)
+    p.add_argument('--input-file')
+    p.add_argument('--input-folder')
+    p.add_argument('--max-processors', type=int, default=1)
+    p.add_argument('--tags', help='comma separated tags to process')
+    p.add_argument('--start', help='first timestamp to process')
+    p.add_argument('--end', help='last timestamp to process')
+    p.add_argument('--shard', help='i/N: estimate the shard i of N')
+    p.add_argument('--memory-budget', type=float, help='MB the trajectories being clustered may use together')
+    p.add_argument('--report', help='csv file of the estimates of every trajectory')
+
+    p = commands.add_parser('merge')
+    p.add_argument('manifests', nargs='*', help='shard manifests; found next to the outputs when omitted')
+    p.add_argument('--output-file')
+    p.add_argument('--output-folder')
+    p.add_argument('--remove', action='store_true', help='delete the shard outputs once merged')
+
+    args = parser.parse_args(argv)
+    if args.command == 'merge':
+        return merge_command(args)
+    if args.command == 'preflight':
+        return preflight_command(args)
+    run_command(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,6 +9,8 @@ from tools.statistics_trajectories import StatisticsTrajectories
 
 from seqscan.data.trajectory import Trajectory
 from seqscan.data.point import Point
+from seqscan.data.row_filter import RowFilter
+from seqscan.sharding import ShardSpec, write_manifest
 from seqscan.seqscan import SeqScan
 
 from datetime import datetime
@@ -31,12 +33,16 @@ Y_COLUMN=config["CSV_columns"]["Y_COLUMN"]
 class RunStatistics():
 
 
-    def read_multi_traj_from_csv(self, path):
+    def read_multi_traj_from_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         col_list = [TAG_COLUMN, X_COLUMN, Y_COLUMN, TIME_COLUMN ]
-        df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.read_csv(path, usecols=col_list, tag_column=TAG_COLUMN, time_column=TIME_COLUMN)[col_list]
         data_list= df.values.tolist()
         points_list=list()
         self.list_trajectories=list()
+        if len(data_list) == 0:
+            return
 
         tag1=data_list[0][0]
         for l in data_list:
@@ -55,7 +61,9 @@ class RunStatistics():
         trajectory = Trajectory( points_list, tag_id=tag1)
         self.list_trajectories.append(trajectory)
 
-    def read_single_traj_from_single_csv(self, path):
+    def read_single_traj_from_single_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         tag_id = None
         col_list = [X_COLUMN, Y_COLUMN, TIME_COLUMN]
         df = pd.read_csv(path)  # , usecols=col_list)
@@ -63,6 +71,7 @@ class RunStatistics():
             tag_id = df[TAG_COLUMN].iloc[0]
 
         df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.filter_frame(df, time_column=TIME_COLUMN)
         df.sort_values(by=[TIME_COLUMN])
         data_list = df.values.tolist()
         points_list = list()
@@ -78,7 +87,7 @@ class RunStatistics():
 
     def process_single_file_from_folder(self, f):
         f_output = os.path.basename(f)
-        self.run_statistics_single_mode(f, self.output_folder + 'output_' + f_output)
+        self.run_statistics_single_mode(f, self.output_folder + 'output_' + f_output, row_filter=self.row_filter)
         del f_output
 
     def process_one_trajectory_of_multi(self, traj):
@@ -86,14 +95,26 @@ class RunStatistics():
         stats.run()
         del stats
 
-    def run_statistics_single_mode(self,  input_path_f, output_path):
-        trajectory= self.read_single_traj_from_single_csv(input_path_f)
+    def run_statistics_single_mode(self,  input_path_f, output_path, time_range=None, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+        trajectory= self.read_single_traj_from_single_csv(input_path_f, row_filter)
+        if len(trajectory) == 0:
+            print('No rows of ', input_path_f, ' match the requested time_range')
+            return
         stats = StatisticsTrajectories(trajectory, output_path,  multi_mode=0)
         results=stats.run()
         results.stamp()
         del stats
 
-    def run_statistics_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None, max_processors=1):
+    def run_statistics_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None, max_processors=1,
+                                  input_tags=None, time_range=None, shard=None):
+        """With shard="i/N" only the tags (input_file) or files (input_folder)
+        of shard i are processed and a manifest is written for
+        seqscan.sharding.merge_manifests()."""
+        self.row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
+        self.shard = ShardSpec.parse(shard)
+        shard_params = {"input_tags": input_tags, "time_range": time_range}
 
         if input_file is None and input_folder is None:
             print('Please specify if input_file or input_folder')
@@ -125,32 +146,63 @@ class RunStatistics():
 
         if input_file is not None:
             self.output_file=output_file
-            self.read_multi_traj_from_csv(input_file)
+            self.read_multi_traj_from_csv(input_file, self.row_filter)
+            if len(self.list_trajectories) == 0:
+                print('No rows of ', input_file, ' match the requested input_tags/time_range')
+                return
+            if self.shard is not None:
+                # the index of each trajectory in the whole file orders the merged rows
+                units = [{"index": i, "tag": traj.tag_id} for i, traj in enumerate(self.list_trajectories)
+                         if self.shard.owns(traj.tag_id)]
+                self.list_trajectories = [self.list_trajectories[u["index"]] for u in units]
+                self.output_file = self.shard.output_path(output_file)
+                manifest_path = self.shard.manifest_path(output_file=output_file)
+                if len(self.list_trajectories) == 0:
+                    write_manifest(manifest_path, "statistics", self.shard, "file", input_file, shard_params,
+                                   {"statistics": output_file}, {}, units)
+                    return
             trajectory1=self.list_trajectories[0]
-            stats = StatisticsTrajectories(trajectory1, output_file,  multi_mode=1)
+            stats = StatisticsTrajectories(trajectory1, self.output_file,  multi_mode=1)
             stats.run()
 
             if self.parallelism:
                 with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
-                    res = ex.map(self.process_one_trajectory_of_multi, self.list_trajectories[1:])
-                return list(res)
+                    res = list(ex.map(self.process_one_trajectory_of_multi, self.list_trajectories[1:]))
             else:
+                res = None
                 for traj in self.list_trajectories[1:]:
                     self.process_one_trajectory_of_multi(traj)
 
+            if self.shard is not None:
+                write_manifest(manifest_path, "statistics", self.shard, "file", input_file, shard_params,
+                               {"statistics": output_file}, {"statistics": self.output_file}, units)
+            return res
+
 
         elif input_folder is not None:
             self.output_folder=output_folder
-            csv_input_files = glob.glob(os.path.join(input_folder, "*.csv"))
+            csv_input_files = [f for f in glob.glob(os.path.join(input_folder, "*.csv"))
+                               if self.row_filter.accepts_file(f, TAG_COLUMN)]
+            if self.shard is not None:
+                units = [{"index": i, "file": os.path.basename(f),
+                          "files": [self.output_folder + 'output_' + os.path.basename(f)]}
+                         for i, f in enumerate(csv_input_files) if self.shard.owns(os.path.basename(f))]
+                csv_input_files = [f for f in csv_input_files if self.shard.owns(os.path.basename(f))]
 
             if self.parallelism:
                 with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
-                    res = ex.map(self.process_single_file_from_folder, csv_input_files)
-                return list(res)
+                    res = list(ex.map(self.process_single_file_from_folder, csv_input_files))
             else:
+                res = None
                 for f in csv_input_files:
                     self.process_single_file_from_folder(f)
 
+            if self.shard is not None:
+                units = [u for u in units if os.path.exists(u["files"][0])]
+                write_manifest(self.shard.manifest_path(output_folder=output_folder), "statistics", self.shard, "folder",
+                               input_folder, shard_params, {"folder": output_folder}, {}, units)
+            return res
+
 
 
 if __name__ == '__main__':
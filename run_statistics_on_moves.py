@@ -6,6 +6,8 @@ import multiprocessing
 
 from tools.statistics_moves import StatisticsMoves
 from seqscan.data.stop_point import Stop_Point
+from seqscan.data.row_filter import RowFilter
+from seqscan.sharding import ShardSpec, write_manifest
 
 from seqscan.data.trajectory import Trajectory
 from seqscan.data.point import Point
@@ -34,9 +36,11 @@ IS_CARTESIAN=config["is_cartesian"]
 class RunMovesStatistics():
 
 
-    def read_single_stop_points_from_file(self, input_file):
+    def read_single_stop_points_from_file(self, input_file, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         seqscan_points = []
-        df = pd.read_csv(input_file)
+        df = row_filter.read_csv(input_file, time_column=TIME_COLUMN)
         if TAG_COLUMN in df.columns:
             for _, row in df.iterrows():
                 seqscan_point = Stop_Point(row[X_COLUMN], row[Y_COLUMN], row[TIME_COLUMN], row[CLASS_COLUMN],
@@ -49,9 +53,11 @@ class RunMovesStatistics():
                 seqscan_points.append(seqscan_point)
         return seqscan_points
 
-    def read_multiple_stop_points_from_file(self, input_file):
+    def read_multiple_stop_points_from_file(self, input_file, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         seqscan_points_dict = {}
-        df = pd.read_csv(input_file)
+        df = row_filter.read_csv(input_file, tag_column=TAG_COLUMN, time_column=TIME_COLUMN)
         if TAG_COLUMN in df.columns:
             for _, row in df.iterrows():
                 if row[TAG_COLUMN] not in seqscan_points_dict:
@@ -65,7 +71,7 @@ class RunMovesStatistics():
 
     def process_single_file_from_folder(self, f):
         f_output = os.path.basename(f)
-        self.run_statistics_single_mode(f, self.output_folder + 'output_' + f_output)
+        self.run_statistics_single_mode(f, self.output_folder + 'output_' + f_output, row_filter=self.row_filter)
         del f_output
 
     def process_one_trajectory_of_multi(self, traj):
@@ -74,15 +80,27 @@ class RunMovesStatistics():
         stats.run()
         del stats
 
-    def run_statistics_single_mode(self,  input_path_f, output_path):
-        trajectory= self.read_single_stop_points_from_file(input_path_f)
+    def run_statistics_single_mode(self,  input_path_f, output_path, time_range=None, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+        trajectory= self.read_single_stop_points_from_file(input_path_f, row_filter)
+        if len(trajectory) == 0:
+            print('No rows of ', input_path_f, ' match the requested time_range')
+            return
         tag_id = trajectory[0].tag_id
         stats = StatisticsMoves(trajectory, output_path,tag_id=tag_id,  multi_mode=0, is_cartesian=IS_CARTESIAN)
         results=stats.run()
         #results.stamp()
         del stats
 
-    def run_statistics_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None, max_processors=1):
+    def run_statistics_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None, max_processors=1,
+                                  input_tags=None, time_range=None, shard=None):
+        """With shard="i/N" only the tags (input_file) or files (input_folder)
+        of shard i are processed and a manifest is written for
+        seqscan.sharding.merge_manifests()."""
+        self.row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
+        self.shard = ShardSpec.parse(shard)
+        shard_params = {"input_tags": input_tags, "time_range": time_range}
 
         if input_file is None and input_folder is None:
             print('Please specify if input_file or input_folder')
@@ -114,34 +132,64 @@ class RunMovesStatistics():
 
         if input_file is not None:
             self.output_file=output_file
-            dict_list= self.read_multiple_stop_points_from_file(input_file)
+            dict_list= self.read_multiple_stop_points_from_file(input_file, self.row_filter)
+            if len(dict_list) == 0:
+                print('No rows of ', input_file, ' match the requested input_tags/time_range')
+                return
+            if self.shard is not None:
+                # the index of each tag in the whole file orders the merged rows
+                units = [{"index": i, "tag": tag} for i, tag in enumerate(dict_list) if self.shard.owns(tag)]
+                dict_list = {u["tag"]: dict_list[u["tag"]] for u in units}
+                self.output_file = self.shard.output_path(output_file)
+                manifest_path = self.shard.manifest_path(output_file=output_file)
+                if len(dict_list) == 0:
+                    write_manifest(manifest_path, "moves_statistics", self.shard, "file", input_file, shard_params,
+                                   {"statistics": output_file}, {}, units)
+                    return
             distinct_traj=list(dict_list.keys())
             trajectory1=dict_list[distinct_traj[0]]
-            stats = StatisticsMoves(trajectory1, output_file, tag_id=distinct_traj[0], multi_mode=1, is_cartesian=IS_CARTESIAN)
+            stats = StatisticsMoves(trajectory1, self.output_file, tag_id=distinct_traj[0], multi_mode=1, is_cartesian=IS_CARTESIAN)
             stats.run()
             remaining_trajectories=[value for key, value in dict_list.items() if key != distinct_traj[0]]
 
             if self.parallelism:
                 with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
-                    res = ex.map(self.process_one_trajectory_of_multi, remaining_trajectories)
-                return list(res)
+                    res = list(ex.map(self.process_one_trajectory_of_multi, remaining_trajectories))
             else:
+                res = None
                 for traj in remaining_trajectories:
                     self.process_one_trajectory_of_multi(traj)
 
+            if self.shard is not None:
+                write_manifest(manifest_path, "moves_statistics", self.shard, "file", input_file, shard_params,
+                               {"statistics": output_file}, {"statistics": self.output_file}, units)
+            return res
+
 
         elif input_folder is not None:
             self.output_folder=output_folder
-            csv_input_files = glob.glob(os.path.join(input_folder, "*.csv"))
+            csv_input_files = [f for f in glob.glob(os.path.join(input_folder, "*.csv"))
+                               if self.row_filter.accepts_file(f, TAG_COLUMN)]
+            if self.shard is not None:
+                units = [{"index": i, "file": os.path.basename(f),
+                          "files": [self.output_folder + 'output_' + os.path.basename(f)]}
+                         for i, f in enumerate(csv_input_files) if self.shard.owns(os.path.basename(f))]
+                csv_input_files = [f for f in csv_input_files if self.shard.owns(os.path.basename(f))]
 
             if self.parallelism:
                 with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
-                    res = ex.map(self.process_single_file_from_folder, csv_input_files)
-                return list(res)
+                    res = list(ex.map(self.process_single_file_from_folder, csv_input_files))
             else:
+                res = None
                 for f in csv_input_files:
                     self.process_single_file_from_folder(f)
 
+            if self.shard is not None:
+                units = [u for u in units if os.path.exists(u["files"][0])]
+                write_manifest(self.shard.manifest_path(output_folder=output_folder), "moves_statistics", self.shard, "folder",
+                               input_folder, shard_params, {"folder": output_folder}, {}, units)
+            return res
+
 
 
 
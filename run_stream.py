@@ -0,0 +1,67 @@
+"""Command line for stop detection on a live stream of points of many tags.
+
+Points are csv lines with the columns of the input files, read from a file
+followed as it grows or from the clients of a Unix socket:
+
+    python run_stream.py --eps 1000 --delta 10 --n 5 --file ./input/feed.csv --output-file ./output/stream.csv
+    python run_stream.py --eps 1000 --delta 10 --n 5 --socket /tmp/seqscan.sock --output-file ./output/stream.csv
+
+Labels and stops are appended to the outputs as soon as they are final; the
+states of idle tags are spilled to --spill-dir beyond --max-tags.
+"""
+
+import argparse
+import os
+import sys
+
+from seqscan.stream import StreamRouter, EventWriter, csv_records, follow_file, socket_records, DEFAULT_MAX_TAGS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Online SeqScan on a stream of points of many tags')
+    parser.add_argument('--eps', type=float, required=True)
+    parser.add_argument('--delta', type=float, required=True)
+    parser.add_argument('--n', type=int, required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help='csv file followed as it grows')
+    source.add_argument('--socket', help='Unix socket to listen on')
+    parser.add_argument('--output-file', required=True)
+    parser.add_argument('--spill-dir', help='where idle tag states are spilled (default: next to the output)')
+    parser.add_argument('--max-tags', type=int, default=DEFAULT_MAX_TAGS, help='tag states kept in memory')
+    parser.add_argument('--max-context', type=float, help='seconds of points a tag state may span')
+    parser.add_argument('--no-follow', action='store_true', help='stop at the end of --file')
+    parser.add_argument('--idle-timeout', type=float, help='stop after that many seconds without a new line')
+    parser.add_argument('--connections', type=int, help='stop after that many socket connections')
+    args = parser.parse_args(argv)
+
+    from main_runSeqScan import mainRun
+    presence = mainRun().convert_time_to_s(args.delta)
+
+    if args.file:
+        if args.no_follow:
+            lines = open(args.file, newline='')
+        else:
+            lines = follow_file(args.file, idle_timeout=args.idle_timeout)
+        records = csv_records(lines)
+    else:
+        records = socket_records(args.socket, connections=args.connections)
+
+    output_symbolic = os.path.join(os.path.dirname(args.output_file), "symbolic_" + os.path.basename(args.output_file))
+    spill_dir = args.spill_dir or os.path.splitext(args.output_file)[0] + '.spill'
+    router = StreamRouter(args.eps, args.n, presence, spill_dir, max_tags=args.max_tags, max_context=args.max_context)
+    writer = EventWriter(args.output_file, output_symbolic)
+    try:
+        count = router.run(records, writer)
+    except KeyboardInterrupt:
+        print('Interrupted: ending the streams')
+        count = None
+        for events in router.close():
+            if events:
+                writer(events)
+    print(count, 'points,', writer.labels, 'labels,', writer.stops, 'stops,', router.spills, 'spills,',
+          router.reloads, 'reloads')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,7 @@ from datetime import datetime
 
 from seqscan.data.stop import Stop
 from seqscan.data.symbolic_trajectory import Symbolic_Trajectory
+from seqscan.data.row_filter import RowFilter
 from tools.plot_symbolic_trajectories import PlotSymbolicTrajectories
 
 
@@ -36,12 +37,17 @@ else:
 class RunSymbolicPlotter():
 
 
-    def read_multi_traj_from_csv(self, path):
+    def read_multi_traj_from_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         col_list = [TAG_COLUMN, STOP_ID_COLUMN,START_TIME_COLUMN, END_TIME_COLUMN, CENTROID_X_COLUMN, CENTROID_Y_COLUMN]
-        df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.read_csv(path, usecols=col_list, tag_column=TAG_COLUMN, time_column=START_TIME_COLUMN,
+                                 end_column=END_TIME_COLUMN)[col_list]
         data_list = df.values.tolist()
         stops_list = list()
         self.list_symbolic_trajectories = list()
+        if len(data_list) == 0:
+            return
 
         tag1 = data_list[0][0]
         for l in data_list:
@@ -62,9 +68,12 @@ class RunSymbolicPlotter():
         symbolic_trajectory = Symbolic_Trajectory(stops_list, tag_id=tag1)
         self.list_symbolic_trajectories.append(symbolic_trajectory)
 
-    def read_single_traj_from_single_csv(self, path):
+    def read_single_traj_from_single_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         col_list = [STOP_ID_COLUMN,START_TIME_COLUMN, END_TIME_COLUMN, CENTROID_X_COLUMN, CENTROID_Y_COLUMN]
-        df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.read_csv(path, usecols=col_list, time_column=START_TIME_COLUMN,
+                                 end_column=END_TIME_COLUMN)[col_list]
         data_list = df.values.tolist()
         stops_list = list()
 
@@ -80,7 +89,7 @@ class RunSymbolicPlotter():
         print('processing ', f)
 
         f_output = str(os.path.splitext(os.path.basename(f))[0]) + '.png'
-        self.plot_symbolic_single_mode(f, self.output_folder + 'output_' + f_output)
+        self.plot_symbolic_single_mode(f, self.output_folder + 'output_' + f_output, row_filter=self.row_filter)
         del f_output
 
     def process_one_trajectory_of_multi(self, symbolic_traj):
@@ -89,13 +98,19 @@ class RunSymbolicPlotter():
         plot.plot()
         del plot
 
-    def plot_symbolic_single_mode(self, input_path_f, output_path):
-        symbolic_trajectory = self.read_single_traj_from_single_csv(input_path_f)
+    def plot_symbolic_single_mode(self, input_path_f, output_path, time_range=None, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+        symbolic_trajectory = self.read_single_traj_from_single_csv(input_path_f, row_filter)
+        if symbolic_trajectory.length == 0:
+            print('No stops of ', input_path_f, ' match the requested time_range')
+            return
         plot = PlotSymbolicTrajectories(symbolic_trajectory, output_path, multi_mode=0)
         plot.plot()
 
     def plot_symbolic_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None,
-                        max_processors=1):
+                        max_processors=1, input_tags=None, time_range=None):
+        self.row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
 
         if input_file is None and input_folder is None:
             print('Please specify if input_file or input_folder')
@@ -130,7 +145,10 @@ class RunSymbolicPlotter():
 
         if input_file is not None:
             self.output_folder = output_folder
-            self.read_multi_traj_from_csv(input_file)
+            self.read_multi_traj_from_csv(input_file, self.row_filter)
+            if len(self.list_symbolic_trajectories) == 0:
+                print('No stops of ', input_file, ' match the requested input_tags/time_range')
+                return
             symbolic_trajectory1 = self.list_symbolic_trajectories[0]
             output_file1 = output_folder + '/' + str(symbolic_trajectory1.tag_id) + '.png'
             plot = PlotSymbolicTrajectories(symbolic_trajectory1, output_file1, multi_mode=1)
@@ -147,7 +165,8 @@ class RunSymbolicPlotter():
 
         elif input_folder is not None:
             self.output_folder = output_folder
-            csv_input_files = glob.glob(os.path.join(input_folder, "*.csv"))
+            csv_input_files = [f for f in glob.glob(os.path.join(input_folder, "*.csv"))
+                               if self.row_filter.accepts_file(f, TAG_COLUMN)]
 
             if self.parallelism:
                 with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
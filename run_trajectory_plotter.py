@@ -9,6 +9,7 @@ from tools.plot_trajectories import PlotTrajectories
 
 from seqscan.data.trajectory import Trajectory
 from seqscan.data.point import Point
+from seqscan.data.row_filter import RowFilter
 
 from datetime import datetime
 
@@ -30,12 +31,16 @@ Y_COLUMN=config["CSV_columns"]["Y_COLUMN"]
 class RunPlotter():
 
 
-    def read_multi_traj_from_csv(self, path):
+    def read_multi_traj_from_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         col_list = [TAG_COLUMN, X_COLUMN, Y_COLUMN, TIME_COLUMN ]
-        df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.read_csv(path, usecols=col_list, tag_column=TAG_COLUMN, time_column=TIME_COLUMN)[col_list]
         data_list= df.values.tolist()
         points_list=list()
         self.list_trajectories=list()
+        if len(data_list) == 0:
+            return
 
         tag1=data_list[0][0]
         for l in data_list:
@@ -54,9 +59,11 @@ class RunPlotter():
         trajectory = Trajectory( points_list, tag_id=tag1)
         self.list_trajectories.append(trajectory)
 
-    def read_single_traj_from_single_csv(self, path):
+    def read_single_traj_from_single_csv(self, path, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(ts_format=TIMESTAMP_FORMAT)
         col_list = [ X_COLUMN, Y_COLUMN, TIME_COLUMN ]
-        df = pd.read_csv(path, usecols=col_list)[col_list]
+        df = row_filter.read_csv(path, usecols=col_list, time_column=TIME_COLUMN)[col_list]
         data_list= df.values.tolist()
         points_list=list()
 
@@ -72,7 +79,7 @@ class RunPlotter():
         #print('processing ', f)
 
         f_output = str(os.path.splitext(os.path.basename(f))[0])+'.png'
-        self.plot_single_mode(f, self.output_folder + 'output_' + f_output)
+        self.plot_single_mode(f, self.output_folder + 'output_' + f_output, row_filter=self.row_filter)
         del f_output
 
 
@@ -82,12 +89,19 @@ class RunPlotter():
         plot.plot()
         del plot
 
-    def plot_single_mode(self,  input_path_f, output_path):
-        trajectory= self.read_single_traj_from_single_csv(input_path_f)
+    def plot_single_mode(self,  input_path_f, output_path, time_range=None, row_filter=None):
+        if row_filter is None:
+            row_filter = RowFilter(time_range=time_range, ts_format=TIMESTAMP_FORMAT)
+        trajectory= self.read_single_traj_from_single_csv(input_path_f, row_filter)
+        if len(trajectory) == 0:
+            print('No rows of ', input_path_f, ' match the requested time_range')
+            return
         plot = PlotTrajectories(trajectory, output_path,  multi_mode=0)
         plot.plot()
 
-    def plot_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None, max_processors=1):
+    def plot_multi_mode(self, input_folder=None, output_folder=None, input_file=None, output_file=None, max_processors=1,
+                        input_tags=None, time_range=None):
+        self.row_filter = RowFilter(input_tags, time_range, TIMESTAMP_FORMAT)
 
         if input_file is None and input_folder is None:
             print('Please specify if input_file or input_folder')
@@ -122,7 +136,10 @@ class RunPlotter():
 
         if input_file is not None:
             self.output_folder=output_folder
-            self.read_multi_traj_from_csv(input_file)
+            self.read_multi_traj_from_csv(input_file, self.row_filter)
+            if len(self.list_trajectories) == 0:
+                print('No rows of ', input_file, ' match the requested input_tags/time_range')
+                return
             trajectory1=self.list_trajectories[0]
             output_file1=output_folder+'/'+str(trajectory1.tag_id)+'.png'
             plot = PlotTrajectories(trajectory1, output_file1,  multi_mode=1)
@@ -139,7 +156,8 @@ class RunPlotter():
 
         elif input_folder is not None:
             self.output_folder=output_folder
-            csv_input_files = glob.glob(os.path.join(input_folder, "*.csv"))
+            csv_input_files = [f for f in glob.glob(os.path.join(input_folder, "*.csv"))
+                               if self.row_filter.accepts_file(f, TAG_COLUMN)]
 
             if self.parallelism:
                 with ProcessPoolExecutor(max_workers=self.max_processors) as ex:
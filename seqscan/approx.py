@@ -0,0 +1,316 @@
+"""Approximate SEQSCAN on a grid, for fast monitoring.
+
+The exact engine keeps the neighbor set of every point. The approximate one
+snaps the points to a grid of cells of side cell_factor * distance and only
+counts, for each cell, the points of the current time context in the 3 x 3
+block of cells around it: a cell is dense when that count reaches n_points,
+and adjacent dense cells form the regions. A region holds the points of the
+blocks of its dense cells; its presence is computed from the runs of
+consecutive points it holds, as for the exact regions, and it becomes
+persistent once the presence reaches the threshold.
+
+The contextual logic is the one of SeqScan.scan_point(): with an active
+stop, a point first tries to expand it in the context of the stop; otherwise
+it is looked up in the context starting at the end of the stop, where the
+first persistent region it belongs to becomes the new active stop.
+
+The error is bounded by the grid: with cell_factor = 1, the neighborhood of a
+point contains all the points within distance of it, and none beyond twice
+the distance along either axis. Stops are mostly the same as the exact ones,
+their ends may move by a few points; see compare() and ApproximationReport
+for the measured differences.
+"""
+
+# Standard modules
+import csv
+import math
+from collections import defaultdict
+
+import numpy
+
+# my modules
+from .feature_point import FeaturePoint
+
+
+# side of the cells, in units of the SEQSCAN distance
+CELL_FACTOR = 1.0
+# min temporal overlap (intersection over union) of two matching stops
+MATCH_IOU = 0.5
+
+
+class CellFrame():
+    """Dense cells and regions of the points of one time context.
+
+    Args:
+        cells (list of tuple): the cell of each point of the trajectory
+        t (array): the timestamps of the points, in seconds
+        n_points (int): min number of points in the block of a dense cell
+        threshold (float): the presence of a persistent region, in seconds
+    """
+
+    def __init__(self, cells, t, n_points, threshold):
+        self.cell_of = cells
+        self.t = t
+        self.n_points = n_points
+        self.threshold = threshold
+        self.points = defaultdict(list)     # cell -> points of the context in it
+        self.counts = defaultdict(int)      # cell -> points of the context in its block
+        self.parent = {}                    # dense cell -> parent, union-find
+        self.members = {}                   # root -> points of the region
+        self.presence = {}                  # root -> presence of the region
+        self.persistent = {}                # root -> persistence flag
+
+    @staticmethod
+    def block(cell):
+        cx, cy = cell
+        return [(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+    def find(self, cell):
+        root = cell
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[cell] != root:
+            self.parent[cell], cell = root, self.parent[cell]
+        return root
+
+    def add(self, i):
+        """Adds point i to the context."""
+        cell = self.cell_of[i]
+        self.points[cell].append(i)
+        for other in self.block(cell):
+            self.counts[other] += 1
+            if other in self.parent:
+                self._join(self.find(other), i)
+            elif self.counts[other] >= self.n_points:
+                self._densify(other)
+
+    def regions(self, i):
+        """Roots of the regions point i belongs to."""
+        return set(self.find(cell) for cell in self.block(self.cell_of[i]) if cell in self.parent)
+
+    def _densify(self, cell):
+        self.parent[cell] = cell
+        self.members[cell] = set()
+        self.presence[cell] = 0.0
+        self.persistent[cell] = False
+        for other in self.block(cell):
+            for i in self.points.get(other, ()):
+                self._join(cell, i)
+        for other in self.block(cell):
+            if other != cell and other in self.parent:
+                self._union(self.find(cell), self.find(other))
+
+    def _join(self, root, i):
+        """Adds point i to the region of root: the presence grows with the
+        intervals to its previous and next points already there."""
+        members = self.members[root]
+        if i in members:
+            return
+        members.add(i)
+        if i - 1 in members:
+            self.presence[root] += self.t[i] - self.t[i - 1]
+        if i + 1 in members:
+            self.presence[root] += self.t[i + 1] - self.t[i]
+        if self.presence[root] >= self.threshold:
+            self.persistent[root] = True
+
+    def _union(self, a, b):
+        if a == b:
+            return
+        if len(self.members[a]) < len(self.members[b]):
+            a, b = b, a
+        self.parent[b] = a
+        persistent = self.persistent[a] or self.persistent[b]
+        for i in self.members.pop(b):
+            self._join(a, i)
+        self.persistent[a] |= persistent
+        del self.presence[b], self.persistent[b]
+
+
+def approximate_scan(x, y, t, distance, n_points, presence, cell_factor=CELL_FACTOR):
+    """The stops of the points of projected coordinates x, y and timestamps t
+    (seconds), sorted by time.
+
+    Returns:
+        the sorted point indices of each stop, by first point
+    """
+    side = distance * cell_factor
+    cells = list(zip(numpy.floor(numpy.asarray(x) / side).astype(numpy.int64).tolist(),
+                     numpy.floor(numpy.asarray(y) / side).astype(numpy.int64).tolist()))
+    t = numpy.asarray(t, dtype=numpy.float64)
+
+    stops = []
+    active = None       # a dense cell of the active stop, in expansion
+    expansion = None
+    look_up = CellFrame(cells, t, n_points, presence)
+    for i in range(len(t)):
+        if active is not None:
+            expansion.add(i)
+            if i in expansion.members[expansion.find(active)]:
+                look_up = CellFrame(cells, t, n_points, presence)
+                continue
+        look_up.add(i)
+        found = [root for root in look_up.regions(i) if look_up.persistent[root]]
+        if found:
+            if active is not None:
+                stops.append(expansion.members[expansion.find(active)])
+            active = min(found)
+            expansion = look_up
+            look_up = CellFrame(cells, t, n_points, presence)
+    if active is not None:
+        stops.append(expansion.members[expansion.find(active)])
+    return sorted((sorted(stop) for stop in stops), key=lambda stop: stop[0])
+
+
+def labels_of(size, stops):
+    """The (type, stop number) of each of size points, as SeqScan.point_labels(),
+    for stops given as lists of point indices; a point of two stops is
+    labelled with the first."""
+    cluster = [None] * size
+    for k, stop in enumerate(stops):
+        for i in stop:
+            if cluster[i] is None:
+                cluster[i] = k
+    prev = [None] * size
+    nxt = [None] * size
+    last = None
+    for i in range(size):
+        if cluster[i] is None:
+            prev[i] = last
+        else:
+            last = cluster[i]
+    last = None
+    for i in reversed(range(size)):
+        if cluster[i] is None:
+            nxt[i] = last
+        else:
+            last = cluster[i]
+
+    labels = []
+    counter = 0
+    current = None
+    for i in range(size):
+        if cluster[i] is not None:
+            if cluster[i] != current:
+                counter += 1
+                current = cluster[i]
+            labels.append(("cluster", counter))
+        elif prev[i] is not None and nxt[i] is not None:
+            labels.append(("excursion" if prev[i] == nxt[i] else "transition", counter))
+        else:
+            labels.append(("noise", counter))
+    return labels
+
+
+def approximate_result(points, distance, n_points, presence, cartesian, cell_factor=CELL_FACTOR):
+    """The labels and stops of approximate SEQSCAN on points (data Points,
+    sorted by time), in the format of ResultCache: (type, stop number) of each
+    point and (first, last, centroid) of each stop."""
+    geometry = [FeaturePoint(p.lat, p.lon, cartesian) for p in points]
+    t = numpy.array([p.timestamp for p in points], dtype='datetime64[us]').astype(numpy.int64) / 1e6
+    stops = approximate_scan([g.x for g in geometry], [g.y for g in geometry], t, distance, n_points, presence,
+                             cell_factor)
+    rows = []
+    for stop in stops:
+        centroid = (sum(geometry[i].lat for i in stop) / len(stop), sum(geometry[i].lon for i in stop) / len(stop))
+        rows.append((points[stop[0]].timestamp, points[stop[-1]].timestamp, centroid))
+    return labels_of(len(points), stops), rows
+
+
+def compare(exact, approximate):
+    """Differences between the (labels, stops) of an exact and of an
+    approximate run on the same points.
+
+    Returns:
+        a dict: the share of points with the same class (stop or move) and
+        with the same type, the numbers of stops, the matched ones (temporal
+        overlap of MATCH_IOU or more, each stop matched once), and the mean
+        offsets in seconds of the starts and ends of the matched stops
+    """
+    exact_labels, exact_stops = exact
+    approx_labels, approx_stops = approximate
+    size = max(1, len(exact_labels))
+    same_class = sum((a[0] == "cluster") == (b[0] == "cluster") for a, b in zip(exact_labels, approx_labels))
+    same_type = sum(a[0] == b[0] for a, b in zip(exact_labels, approx_labels))
+
+    matched = []
+    used = set()
+    for first, last, _ in exact_stops:
+        best, best_iou = None, MATCH_IOU
+        for k, (a_first, a_last, _) in enumerate(approx_stops):
+            if k in used:
+                continue
+            inter = (min(last, a_last) - max(first, a_first)).total_seconds()
+            union = (max(last, a_last) - min(first, a_first)).total_seconds()
+            iou = inter / union if union > 0 else float(inter >= 0)
+            if iou >= best_iou:
+                best, best_iou = k, iou
+        if best is not None:
+            used.add(best)
+            matched.append(((approx_stops[best][0] - first).total_seconds(),
+                            (approx_stops[best][1] - last).total_seconds()))
+    return {
+        "points": len(exact_labels),
+        "class_agreement": same_class / size,
+        "type_agreement": same_type / size,
+        "exact_stops": len(exact_stops),
+        "approx_stops": len(approx_stops),
+        "matched_stops": len(matched),
+        "start_offset": sum(abs(s) for s, e in matched) / len(matched) if matched else math.nan,
+        "end_offset": sum(abs(e) for s, e in matched) / len(matched) if matched else math.nan,
+    }
+
+
+REPORT_COLUMNS = ["tag", "points", "class_agreement", "type_agreement", "exact_stops", "approx_stops",
+                  "matched_stops", "start_offset", "end_offset", "exact_seconds", "approx_seconds"]
+
+
+class ApproximationReport():
+    """Accuracy and speed of the approximate engine against the exact one.
+
+    Args:
+        rows (list of dict): one per trajectory, with the keys of
+            REPORT_COLUMNS
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def totals(self):
+        """The figures over all the trajectories, weighted by points."""
+        points = sum(r["points"] for r in self.rows)
+        exact_stops = sum(r["exact_stops"] for r in self.rows)
+        approx_stops = sum(r["approx_stops"] for r in self.rows)
+        matched = sum(r["matched_stops"] for r in self.rows)
+        exact_seconds = sum(r["exact_seconds"] for r in self.rows)
+        approx_seconds = sum(r["approx_seconds"] for r in self.rows)
+        return {
+            "points": points,
+            "class_agreement": sum(r["class_agreement"] * r["points"] for r in self.rows) / max(1, points),
+            "type_agreement": sum(r["type_agreement"] * r["points"] for r in self.rows) / max(1, points),
+            "exact_stops": exact_stops,
+            "approx_stops": approx_stops,
+            "matched_stops": matched,
+            "recall": matched / exact_stops if exact_stops else math.nan,
+            "precision": matched / approx_stops if approx_stops else math.nan,
+            "speedup": exact_seconds / approx_seconds if approx_seconds > 0 else math.nan,
+        }
+
+    def summary(self):
+        totals = self.totals()
+        return ('Approximation: %d trajectories, %d points, class agreement %.1f%%, type agreement %.1f%%, '
+                'stops %d exact / %d approximate, recall %.1f%%, precision %.1f%%, %.1fx faster' % (
+                    len(self.rows), totals["points"], 100 * totals["class_agreement"],
+                    100 * totals["type_agreement"], totals["exact_stops"], totals["approx_stops"],
+                    100 * totals["recall"], 100 * totals["precision"], totals["speedup"]))
+
+    def report(self):
+        print(self.summary())
+
+    def save(self, path):
+        """Writes one row per trajectory to the csv file path."""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_COLUMNS)
+            for r in self.rows:
+                writer.writerow([round(r[c], 3) if isinstance(r[c], float) else r[c] for c in REPORT_COLUMNS])
@@ -0,0 +1,199 @@
+"""Content-addressed cache of SEQSCAN results.
+
+Results are stored under a hash of the trajectory points (coordinates and
+timestamps, in input order), of the SEQSCAN parameters and of the
+configuration they depend on, so that a rerun of the same input with the same
+parameters reads the labels and stops back instead of clustering again. The
+tag is not part of the key: it is only copied to the outputs.
+
+Each entry is a small file holding the label of every point and the stops;
+the least recently used entries are evicted once the cache directory grows
+beyond its size or entry budget.
+"""
+
+# Standard modules
+import hashlib
+import os
+import pickle
+
+import numpy
+
+
+# bump when the algorithm or the entry format change, to ignore older entries
+CACHE_VERSION = 1
+# default bound of the cache directory
+DEFAULT_MAX_BYTES = 1 << 30
+# puts between two scans of the cache directory, which the other processes
+# of a run write to as well
+SCAN_INTERVAL = 64
+# share of the budget a full cache is brought back to, so that the puts
+# following an eviction do not scan the directory again at once
+EVICT_RATIO = 0.9
+
+# point types of the classification output, by code
+POINT_TYPES = ("noise", "excursion", "transition", "cluster")
+_TYPE_CODES = {t: i for i, t in enumerate(POINT_TYPES)}
+
+
+class CachedStop():
+    """Stop read from the cache, standing for a cluster in the symbolic export."""
+
+    def __init__(self, first, last, centroid):
+        self.first = first
+        self.last = last
+        self.centroid = centroid
+
+    def first_timestamp(self):
+        return self.first
+
+    def last_timestamp(self):
+        return self.last
+
+    def compute_centroid(self):
+        return self.centroid
+
+
+class ResultCache():
+    """Directory of cached SEQSCAN results, bounded by LRU eviction.
+
+    Args:
+        directory (str): where the entries are stored, shared by the
+            processes of a run
+        max_bytes (int): total size of the entries kept
+        max_entries (int, optional): number of entries kept
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_entries=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.usage = None       # (bytes, entries) of the last scan, plus the puts since
+        self.puts = 0           # puts since the last scan
+
+    @staticmethod
+    def key(trajectory, distance, n_points, presence, cartesian):
+        """Hash of the points of trajectory, of the parameters and of the
+        configuration the result depends on."""
+        h = hashlib.sha1(repr((CACHE_VERSION, float(distance), int(n_points), float(presence),
+                               bool(cartesian))).encode('utf-8'))
+        points = list(trajectory)
+        h.update(numpy.array([p.lat for p in points], dtype=numpy.float64).tobytes())
+        h.update(numpy.array([p.lon for p in points], dtype=numpy.float64).tobytes())
+        h.update(numpy.array([p.timestamp for p in points], dtype='datetime64[us]').tobytes())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def get(self, key, size):
+        """Returns the (labels, stops) stored under key for a trajectory of
+        size points, or None. labels are the (type, stop number) of each point
+        in time order, stops the (first, last, centroid) of each stop."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # entry cut short or from another version of the code
+            self._remove(path)
+            self.misses += 1
+            return None
+        if entry.get("version") != CACHE_VERSION or len(entry["types"]) != size:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)      # most recently used
+        except OSError:
+            pass
+        self.hits += 1
+        labels = list(zip((POINT_TYPES[t] for t in entry["types"].tolist()), entry["stops"].tolist()))
+        return labels, entry["symbolic"]
+
+    def put(self, key, labels, stops):
+        """Stores the labels and stops of a result (see get()), then evicts the
+        least recently used entries beyond the budget."""
+        entry = {
+            "version": CACHE_VERSION,
+            "types": numpy.array([_TYPE_CODES[t] for t, k in labels], dtype=numpy.int8),
+            "stops": numpy.array([k for t, k in labels], dtype=numpy.int32),
+            "symbolic": [tuple(s) for s in stops],
+        }
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = None
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp)
+        os.replace(tmp, path)
+        self.account(size - (previous or 0), 0 if previous is not None else 1)
+
+    def account(self, size, count):
+        """Adds a put of size bytes and count entries to the usage of the
+        cache, and only scans the directory to evict entries when the usage
+        goes beyond the budget, or after SCAN_INTERVAL puts."""
+        if self.usage is None or self.puts >= SCAN_INTERVAL:
+            self.evict()
+            return
+        self.puts += 1
+        total, entries = self.usage
+        self.usage = (total + size, entries + count)
+        if self.usage[0] > self.max_bytes or (self.max_entries is not None and self.usage[1] > self.max_entries):
+            self.evict()
+
+    def entries(self):
+        """(last use, size, path) of every entry."""
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                if e.name.endswith('.pkl'):
+                    try:
+                        st = e.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((st.st_mtime, st.st_size, e.path))
+        return found
+
+    def evict(self):
+        """Removes the least recently used entries of a cache beyond its
+        budget, down to EVICT_RATIO of the budget."""
+        found = sorted(self.entries())
+        total = sum(size for used, size, path in found)
+        count = len(found)
+        if total <= self.max_bytes and (self.max_entries is None or count <= self.max_entries):
+            found = []
+        max_bytes = self.max_bytes * EVICT_RATIO
+        max_entries = int(self.max_entries * EVICT_RATIO) if self.max_entries is not None else None
+        for used, size, path in found:
+            if total <= max_bytes and (max_entries is None or count <= max_entries):
+                break
+            self._remove(path)
+            total -= size
+            count -= 1
+        self.usage = (total, count)
+        self.puts = 0
+
+    def clear(self):
+        for used, size, path in self.entries():
+            self._remove(path)
+        self.usage = (0, 0)
+        self.puts = 0
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,272 @@
+"""Resumable bulk runs.
+
+A run started with resume=True keeps a run manifest next to its outputs: the
+parameters of the run and, for every unit (a trajectory of the input file or
+a file of the input folder), its input fingerprint, status and output
+location. Workers record each unit in a journal once its rows are on disk,
+and the manifest collects the journals. When the run is started again with
+the same parameters, the units already done are skipped, and shard files cut
+short by a crash are truncated back to their last complete unit.
+"""
+
+# Standard modules
+import json
+import os
+
+from .data.run_summary import RunSummary
+from .shards import Shard, shard_path, read_journal, _json_value
+
+
+RUN_MANIFEST_VERSION = 2
+
+PENDING = "pending"
+DONE = "done"
+RUNNING = "running"
+COMPLETE = "complete"
+
+
+def run_manifest_path(output_file=None, output_folder=None, shard=None):
+    """Where a run keeps its manifest: next to the output file, or inside the
+    output folder (one per shard, as shards may share the folder)."""
+    if output_file is not None:
+        return os.path.splitext(output_file)[0] + '.run.json'
+    name = 'run.json' if shard is None else 'run.shard%dof%d.json' % (shard.index, shard.count)
+    return os.path.join(output_folder, name)
+
+
+def file_fingerprint(path):
+    """Cheap fingerprint of an input file: its name, size and modification time."""
+    st = os.stat(path)
+    return '%s:%d:%d' % (os.path.basename(path), st.st_size, st.st_mtime_ns)
+
+
+class RunManifest():
+    """Progress of a resumable run.
+
+    Args:
+        path (str): the manifest file
+        kind (str): the runner, e.g. "seqscan"
+        mode (str): "file" (units are trajectories of one input file, written
+            to shard files merged at the end) or "folder" (units are input
+            files, each with its own output files)
+        input_path (str): the input file or folder
+        params (dict): everything the outputs depend on: run parameters and
+            configuration
+    """
+
+    def __init__(self, path, kind, mode, input_path, params):
+        self.path = path
+        self.kind = kind
+        self.mode = mode
+        self.input_path = input_path
+        self.params = _normalized(params)
+        self.status = RUNNING
+        self.units = {}     # str(index) -> {"index", "tag" or "file", "fingerprint", "status", outputs}
+        self.shards = []    # one per task: {"journal"}, plus "path" and "path_symbolic" in file mode
+
+    @staticmethod
+    def open(path, kind, mode, input_path, params, outputs=()):
+        """Returns the manifest of an earlier run of the same parameters at
+        path, with the journals of its tasks collected, or a new manifest.
+
+        A complete run whose outputs are gone is started over.
+        """
+        manifest = None
+        if os.path.exists(path):
+            try:
+                manifest = RunManifest.load(path)
+            except (ValueError, KeyError) as e:
+                print('Ignoring the run manifest ', path, ': ', e)
+        if manifest is not None:
+            if not manifest.describes(kind, mode, input_path, params):
+                print('The run manifest ', path, ' describes another run: starting over')
+                manifest.discard()
+                manifest = None
+            elif manifest.status == COMPLETE and not all(os.path.exists(p) for p in outputs):
+                print('The outputs of ', path, ' are missing: starting over')
+                manifest.discard()
+                manifest = None
+        if manifest is None:
+            manifest = RunManifest(path, kind, mode, input_path, params)
+            manifest.save()
+        else:
+            manifest.collect()
+        return manifest
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != RUN_MANIFEST_VERSION:
+            raise ValueError("unsupported run manifest version %s" % data.get("version"))
+        manifest = RunManifest(path, data["kind"], data["mode"], data["input"], data["params"])
+        manifest.status = data["status"]
+        manifest.units = data["units"]
+        manifest.shards = data["shards"]
+        return manifest
+
+    def to_dict(self):
+        return {
+            "version": RUN_MANIFEST_VERSION,
+            "kind": self.kind,
+            "mode": self.mode,
+            "input": self.input_path,
+            "params": self.params,
+            "status": self.status,
+            "units": self.units,
+            "shards": self.shards,
+        }
+
+    def save(self):
+        """Writes the manifest atomically: a crash leaves the old or the new one."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, default=_json_value)
+        os.replace(tmp, self.path)
+
+    def describes(self, kind, mode, input_path, params):
+        return (self.kind, self.mode, self.input_path, self.params) == (kind, mode, input_path, _normalized(params))
+
+    def plan(self, units):
+        """Registers the units of the run and returns the indices of the ones
+        still to process, in the given order.
+
+        A unit is skipped if it is done with the same input fingerprint and
+        its outputs still exist. In file mode, the shards of units whose input
+        changed cannot be merged any more: everything is started over.
+
+        Args:
+            units (list of dict): "index", "tag" or "file", and "fingerprint"
+                of each unit
+        """
+        current = {str(u["index"]): u for u in units}
+        if self.mode == "file":
+            stale = [key for key, u in self.units.items()
+                     if u["status"] == DONE and (key not in current or
+                                                 current[key]["fingerprint"] != u["fingerprint"])]
+            if stale:
+                print('The input of ', len(stale), ' units changed since the last run: starting over')
+                self.discard()
+                self.units = {}
+                self.shards = []
+                self.status = RUNNING
+
+        todo = []
+        for key, u in current.items():
+            known = self.units.get(key)
+            if (known is not None and known["status"] == DONE and known["fingerprint"] == u["fingerprint"]
+                    and all(os.path.exists(p) for p in known.get("files", []))):
+                continue
+            self.units[key] = dict(u, status=PENDING)
+            todo.append(u["index"])
+        if todo:
+            self.status = RUNNING
+        self.save()
+        return todo
+
+    def new_shard(self, output_path=None, output_path_symbolic=None):
+        """Registers a new task and returns its journal path; in file mode,
+        returns the Shard it writes to instead."""
+        k = len(self.shards)
+        record = {"journal": '%s.journal%04d' % (self.path, k)}
+        if self.mode == "file":
+            record["path"] = shard_path(output_path, k)
+            record["path_symbolic"] = shard_path(output_path_symbolic, k)
+        self.shards.append(record)
+        self.save()
+        if self.mode == "file":
+            return Shard(record["path"], record["path_symbolic"], journal=record["journal"])
+        return record["journal"]
+
+    def collect(self):
+        """Marks done the units recorded in the journals of the tasks, and
+        truncates the shard files after their last recorded unit."""
+        for k, record in enumerate(self.shards):
+            entries = read_journal(record["journal"])
+            for entry in entries:
+                unit = self.units.get(str(entry["index"]))
+                if unit is None:
+                    continue
+                unit.setdefault("tag", entry["tag"])
+                unit.pop("merged", None)
+                unit.update(status=DONE, shard=k, points=entry["points"], stops=entry["stops"],
+                            runtime=entry["runtime"])
+                if "files" in entry:
+                    unit["files"] = entry["files"]
+            if self.mode == "file":
+                sizes = entries[-1]["sizes"] if entries else [0, 0]
+                for path, size in zip((record["path"], record["path_symbolic"]), sizes):
+                    if os.path.exists(path) and os.path.getsize(path) > size:
+                        with open(path, 'r+b') as f:
+                            f.truncate(size)
+        self.save()
+
+    def done_shards(self, output_path=None, output_path_symbolic=None):
+        """File mode: the shards holding the units done, as Shard objects
+        ready for merge_shards(). The units merged by an earlier completion
+        of the run are read back from its outputs, output_path and
+        output_path_symbolic, which come first."""
+        shards = []
+        merged = sorted((u for u in self.units.values() if u["status"] == DONE and u.get("merged")),
+                        key=lambda u: u["index"])
+        if merged and output_path is not None:
+            shard = Shard(output_path, output_path_symbolic)
+            for unit in merged:
+                shard.add_unit(self._summary(unit, output_path))
+            shard.has_header = True
+            shards.append(shard)
+        for k, record in enumerate(self.shards):
+            shard = Shard(record["path"], record["path_symbolic"], journal=record["journal"])
+            for unit in sorted((u for u in self.units.values() if u["status"] == DONE and u.get("shard") == k),
+                               key=lambda u: u["index"]):
+                shard.add_unit(self._summary(unit, record["path"]))
+            shard.has_header = bool(shard.units)
+            shards.append(shard)
+        return shards
+
+    def summaries(self, output_path=None):
+        """RunSummary of every unit done, in index order. output_path is the
+        merged output in file mode; in folder mode each unit has its own."""
+        units = sorted((u for u in self.units.values() if u["status"] == DONE), key=lambda u: u["index"])
+        return [self._summary(u, output_path if output_path is not None else u.get("files", [None])[0])
+                for u in units]
+
+    def complete(self):
+        """Marks the run complete and deletes its journals and shard files.
+
+        In file mode the units done are then in the merged outputs, not in a
+        shard any more: a later run adding units merges its shards into
+        those outputs (see done_shards()).
+        """
+        self.status = COMPLETE
+        if self.mode == "file":
+            for unit in self.units.values():
+                if unit["status"] == DONE:
+                    unit.pop("shard", None)
+                    unit["merged"] = True
+        self.save()
+        self._remove_tasks()
+        self.shards = []
+        self.save()
+
+    def discard(self):
+        """Deletes the journals and shard files of the run."""
+        self._remove_tasks()
+
+    def _remove_tasks(self):
+        for record in self.shards:
+            for name in ("journal", "path", "path_symbolic"):
+                if name in record and os.path.exists(record[name]):
+                    os.remove(record[name])
+
+    @staticmethod
+    def _summary(unit, output_path):
+        return RunSummary(unit["index"], unit.get("tag"), unit["points"], unit["stops"], unit["runtime"], output_path)
+
+
+def _normalized(params):
+    """params as read back from json, so that they compare equal after a reload."""
+    return json.loads(json.dumps(params, default=_json_value))
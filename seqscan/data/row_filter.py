@@ -0,0 +1,130 @@
+"""Selection of tags and time windows applied while reading csv inputs."""
+
+import io
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from .tag_index import TagIndex
+
+
+class RowFilter():
+    """Restricts the rows read from a csv file to some tags and a time window.
+
+    Args:
+        input_tags (iterable, optional): tags to keep, compared as strings so
+            that 10340900 and "10340900" select the same rows.
+        time_range (tuple, optional): (start, end) bounds, both inclusive,
+            given as datetime or as strings in timestamp format. Either bound
+            may be None to leave that side open.
+        ts_format (str): format of the timestamps in the csv files.
+    """
+
+    def __init__(self, input_tags=None, time_range=None, ts_format="%Y-%m-%d %H:%M:%S"):
+        self.ts_format = ts_format
+
+        if input_tags is None:
+            self.input_tags = None
+        else:
+            if isinstance(input_tags, (str, int)):
+                input_tags = [input_tags]
+            self.input_tags = set(str(t) for t in input_tags)
+
+        if time_range is None:
+            self.start = None
+            self.end = None
+        else:
+            self.start, self.end = (self._to_datetime(t) for t in time_range)
+            if self.start is not None and self.end is not None and self.start > self.end:
+                raise ValueError("time_range starts after it ends: %s > %s" % (self.start, self.end))
+
+    def _to_datetime(self, t):
+        if t is None or isinstance(t, datetime):
+            return t
+        return datetime.strptime(t, self.ts_format)
+
+    @property
+    def is_empty(self):
+        """True if this filter keeps every row."""
+        return self.input_tags is None and self.start is None and self.end is None
+
+    def accepts_tag(self, tag):
+        return self.input_tags is None or str(tag) in self.input_tags
+
+    def overlaps(self, first, last):
+        """True if the time interval [first, last] meets the time window."""
+        if self.start is not None and last < self.start:
+            return False
+        if self.end is not None and first > self.end:
+            return False
+        return True
+
+    def filter_frame(self, df, tag_column=None, time_column=None, end_column=None):
+        """Returns the rows of df selected by this filter.
+
+        Args:
+            df (DataFrame): rows to filter
+            tag_column (str, optional): name of the tag column, if any
+            time_column (str, optional): name of the timestamp column, or of
+                the start column when end_column is given
+            end_column (str, optional): name of the end timestamp column, for
+                rows describing an interval (e.g. stops)
+        """
+        if self.is_empty or len(df) == 0:
+            return df
+
+        mask = pd.Series(True, index=df.index)
+        if self.input_tags is not None and tag_column is not None and tag_column in df.columns:
+            mask &= df[tag_column].astype(str).isin(self.input_tags)
+
+        if (self.start is not None or self.end is not None) and time_column is not None:
+            first = pd.to_datetime(df[time_column], format=self.ts_format)
+            last = first if end_column is None else pd.to_datetime(df[end_column], format=self.ts_format)
+            if self.start is not None:
+                mask &= last >= self.start
+            if self.end is not None:
+                mask &= first <= self.end
+
+        return df[mask]
+
+    def read_csv(self, path, usecols=None, tag_column=None, time_column=None, end_column=None):
+        """Reads the selected rows of a csv file.
+
+        When tags are selected in a file with a tag column, the file's
+        TagIndex is used (and created on first use) so that only the byte
+        ranges of the selected tags, within the time window, are parsed.
+        """
+        if self.is_empty:
+            return pd.read_csv(path, usecols=usecols)
+
+        if tag_column is not None and time_column is not None and end_column is None \
+                and self.input_tags is not None and self._has_column(path, tag_column):
+            index = TagIndex.open(path, tag_column, time_column, self.ts_format)
+            runs = [run for run in index.runs
+                    if self.accepts_tag(run[0]) and self.overlaps(
+                        datetime.strptime(run[4], self.ts_format),
+                        datetime.strptime(run[5], self.ts_format))]
+            df = pd.read_csv(io.BytesIO(index.read_runs(runs)), usecols=usecols)
+        else:
+            df = pd.read_csv(path, usecols=usecols)
+
+        return self.filter_frame(df, tag_column, time_column, end_column)
+
+    @staticmethod
+    def _has_column(path, column):
+        return column in pd.read_csv(path, nrows=0).columns
+
+    def accepts_file(self, path, tag_column):
+        """True if the single-tag csv file at path may hold selected rows.
+
+        The tag is taken from the first row, or from the file name when the
+        file has no tag column.
+        """
+        if self.input_tags is None:
+            return True
+        head = pd.read_csv(path, nrows=1)
+        if tag_column in head.columns and len(head) > 0:
+            return self.accepts_tag(head[tag_column].iloc[0])
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return self.accepts_tag(stem)
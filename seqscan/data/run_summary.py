@@ -0,0 +1,37 @@
+class RunSummary():
+    """Compact outcome of SeqScan on one trajectory, cheap to send between processes.
+
+    Args:
+        index: position of the trajectory in the run (input order)
+        tag_id: the trajectory tag
+        points (int): number of points, i.e. of classification rows written
+        stops (int): number of stops, i.e. of symbolic rows written
+        runtime (float): wall-clock seconds spent in SeqScan.run
+        output_path (str): the classification file holding the rows
+        result (Trajectory, optional): the annotated trajectory, only kept
+            when full results are requested
+        status (str): OK, or how a trajectory over its time budget was
+            handled: REQUEUED (cancelled, then run again at the end of the
+            run), DEGRADED (run again on thinned points) or CANCELLED
+            (cancelled, waiting to be requeued: nothing written yet)
+    """
+
+    OK = "ok"
+    REQUEUED = "requeued"
+    DEGRADED = "degraded"
+    CANCELLED = "cancelled"
+
+    def __init__(self, index, tag_id, points, stops, runtime, output_path, result=None, status=OK):
+        self.index = index
+        self.tag_id = tag_id
+        self.points = points
+        self.stops = stops
+        self.runtime = runtime
+        self.output_path = output_path
+        self.result = result
+        self.status = status
+
+    def __repr__(self):
+        return 'RunSummary(tag_id=%s, points=%d, stops=%d, runtime=%.3fs, output_path=%s%s)' % (
+            self.tag_id, self.points, self.stops, self.runtime, self.output_path,
+            '' if self.status == RunSummary.OK else ', status=' + self.status)
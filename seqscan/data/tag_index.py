@@ -0,0 +1,129 @@
+"""Byte-offset index of the tag runs of a multi-tag csv file."""
+
+import os
+import csv
+import json
+
+import pandas as pd
+
+
+class TagIndex():
+    """Position of every run of consecutive rows sharing the same tag.
+
+    A multi-tag file is split into trajectories wherever the tag changes, so
+    each run is one trajectory. For each run the index keeps the byte range of
+    its rows, the number of rows and the first/last timestamps, which lets a
+    reader seek directly to the selected tags instead of parsing the whole
+    file. The index is saved next to the csv file and rebuilt whenever the
+    file size or modification time changes.
+    """
+
+    VERSION = 1
+    SUFFIX = '.tagidx.json'
+
+    def __init__(self, path, header, runs):
+        self.path = path
+        self.header = header    # raw bytes of the header line
+        self.runs = runs        # list of [tag, start, end, rows, first, last]
+
+    def __len__(self):
+        return len(self.runs)
+
+    @staticmethod
+    def index_path(path):
+        return path + TagIndex.SUFFIX
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @staticmethod
+    def load(path):
+        """Returns the saved index of path, or None if missing or stale."""
+        try:
+            with open(TagIndex.index_path(path)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != TagIndex.VERSION or data.get("source") != TagIndex._signature(path):
+            return None
+
+        return TagIndex(path, data["header"].encode(), data["runs"])
+
+    @staticmethod
+    def open(path, tag_column, time_column, ts_format):
+        """Returns the index of path, building and saving it if needed."""
+        index = TagIndex.load(path)
+        if index is None:
+            index = TagIndex.build(path, tag_column, time_column, ts_format)
+            index.save()
+        return index
+
+    @staticmethod
+    def build(path, tag_column, time_column, ts_format):
+        """Scans path once, recording the byte range of every tag run.
+
+        Only the tag and time fields are looked at; coordinates are never
+        parsed.
+        """
+        runs = []
+        times = []
+
+        with open(path, 'rb') as f:
+            header = f.readline()
+            names = next(csv.reader([header.decode()]))
+            tag_pos = names.index(tag_column)
+            time_pos = names.index(time_column)
+
+            offset = f.tell()
+            tag = None
+            for line in f:
+                if not line.strip():
+                    offset += len(line)
+                    continue
+                if b'"' in line:
+                    fields = next(csv.reader([line.decode()]))
+                else:
+                    fields = line.rstrip(b'\r\n').decode().split(',')
+
+                if not runs or fields[tag_pos] != tag:
+                    tag = fields[tag_pos]
+                    runs.append([tag, offset, offset, 0, None, None])
+                    times.append([])
+
+                offset += len(line)
+                runs[-1][2] = offset
+                runs[-1][3] += 1
+                times[-1].append(fields[time_pos])
+
+        for run, run_times in zip(runs, times):
+            parsed = pd.to_datetime(pd.Series(run_times), format=ts_format)
+            run[4] = parsed.min().strftime(ts_format)
+            run[5] = parsed.max().strftime(ts_format)
+
+        return TagIndex(path, header, runs)
+
+    def save(self):
+        data = {
+            "version": TagIndex.VERSION,
+            "source": TagIndex._signature(self.path),
+            "header": self.header.decode(),
+            "runs": self.runs,
+        }
+        try:
+            with open(TagIndex.index_path(self.path), 'w') as f:
+                json.dump(data, f)
+        except OSError:
+            # read-only input folder: the index is only an accelerator
+            pass
+
+    def read_runs(self, runs):
+        """Returns the raw csv bytes (header included) of the given runs."""
+        chunks = [self.header]
+        with open(self.path, 'rb') as f:
+            for run in runs:
+                f.seek(run[1])
+                chunks.append(f.read(run[2] - run[1]))
+        return b''.join(chunks)
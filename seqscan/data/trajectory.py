@@ -5,7 +5,10 @@ from csv import DictReader, DictWriter
 from datetime import datetime
 from math import sin, cos, asin, radians, sqrt
 
+import numpy
+
 from .point import Point
+from ..pipeline import write_rows
 import json
 
 with open('./config.json') as f:
@@ -94,30 +97,70 @@ class Trajectory(Sequence):
     def get_annotations(self):
         return list(self._data[0].annotations.keys())
     
-    def export_to_csv(self, path, lat=LATITUDE, lon=LONGITUDE, ts=TIMESTAMP, ts_format=TIMESTAMP_FORMAT, writing_mode=0):
-        res = []
-        for point in self._data:
-            p = {
-                lat: point.lat,
-                lon: point.lon,
-                ts: point.timestamp.strftime(ts_format)
-            }
-            for k, v in point.annotations.items():
-                p[k] = v
-            res.append(p)
-        
-        if writing_mode==0 or writing_mode==1:
-            with open(path, "w") as f:
-                #print(res[0].keys())
-                w = DictWriter(f, fieldnames=res[0].keys(), lineterminator="\n")
-                w.writeheader()
-                w.writerows(res)
-
-        elif writing_mode==2:
-            with open(path, "a") as f:
-                #print(res[0].keys())
-                w = DictWriter(f, fieldnames=res[0].keys(), lineterminator="\n")
-                w.writerows(res)
+    def csv_rows(self, lat=LATITUDE, lon=LONGITUDE, ts=TIMESTAMP, ts_format=TIMESTAMP_FORMAT):
+        """Returns the csv header and a generator of the rows of this trajectory."""
+        header = [lat, lon, ts] + [k for k in self._data[0].annotations.keys() if k not in (lat, lon, ts)]
+
+        def rows():
+            for point in self._data:
+                p = {
+                    lat: point.lat,
+                    lon: point.lon,
+                    ts: point.timestamp.strftime(ts_format)
+                }
+                for k, v in point.annotations.items():
+                    p[k] = v
+                yield [p.get(k, "") for k in header]
+
+        return header, rows()
+
+    def export_to_csv(self, path, lat=LATITUDE, lon=LONGITUDE, ts=TIMESTAMP, ts_format=TIMESTAMP_FORMAT, writing_mode=0, writer=None):
+        header, rows = self.csv_rows(lat, lon, ts, ts_format)
+
+        if writer is None:
+            write_rows(path, writing_mode, header, rows)
+        else:
+            writer.submit(path, writing_mode, header, rows)
+
+    def thin(self, min_interval=None, min_displacement=None):
+        """Thins the bursts of this trajectory.
+
+        In time order, a point is kept when it starts a new slot of
+        min_interval seconds since the first point, or when it lies at
+        min_displacement or more (distance of the coordinate system) from the
+        last kept point; the first point is always kept. Sparse fixes are
+        therefore all kept, while a burst keeps about one point per
+        min_interval or per min_displacement moved, and the jitter of a
+        burst standing still keeps none. Without either value every point is
+        kept.
+
+        Returns:
+            the Trajectory of the kept points, in time order, and for each
+            point of this trajectory, in time order, the index of the last
+            kept point at or before it (numpy array)
+        """
+        order = sorted(range(len(self._data)), key=lambda i: self._data[i].timestamp)
+        points = [self._data[i] for i in order]
+        keep = numpy.zeros(len(points), dtype=bool)
+        if len(points) > 0:
+            keep[0] = True
+            if min_interval is None and min_displacement is None:
+                keep[:] = True
+            if min_interval is not None:
+                t = numpy.array([p.timestamp for p in points], dtype='datetime64[us]').astype(numpy.int64)
+                slots = numpy.floor((t - t[0]) / (min_interval * 1e6))
+                keep[1:] |= slots[1:] != slots[:-1]
+            if min_displacement is not None:
+                # sequential: the distance is measured from the last kept point
+                anchor = 0
+                for i in range(1, len(points)):
+                    if keep[i] or self.distance(order[anchor], order[i]) >= min_displacement:
+                        keep[i] = True
+                        anchor = i
+
+        kept = [points[i] for i in numpy.flatnonzero(keep).tolist()]
+        mapping = numpy.cumsum(keep) - 1
+        return Trajectory(kept, sort=False, tag_id=self.tag_id), mapping
 
     def _haversine_distance(self, idx1, idx2):
         p1 = self.get_point(idx1)
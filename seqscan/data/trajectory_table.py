@@ -0,0 +1,125 @@
+import hashlib
+import sys
+
+import numpy
+import pandas as pd
+
+from .point import Point
+from .trajectory import Trajectory
+
+
+class TrajectoryTable():
+    """Columnar storage of many trajectories.
+
+    Coordinates and timestamps of every point are kept in three flat arrays
+    (x, y and microseconds since the epoch), and each trajectory is a run
+    (tag, start, stop) of consecutive rows. The arrays can be placed in shared
+    memory, so that worker processes read the trajectories they are given
+    through their offsets instead of receiving pickled points.
+
+    Args:
+        x, y (numpy array of float64): coordinates, as read from the csv file
+        t (numpy array of int64): timestamps, in microseconds since the epoch
+        runs (list): (tag, start, stop) of each trajectory
+    """
+
+    def __init__(self, x, y, t, runs=None):
+        self.x = x
+        self.y = y
+        self.t = t
+        self.runs = runs if runs is not None else []
+
+    def __len__(self):
+        return len(self.runs)
+
+    @property
+    def n_points(self):
+        return len(self.t)
+
+    def size(self, i):
+        """Number of points of the i-th trajectory."""
+        tag, start, stop = self.runs[i]
+        return stop - start
+
+    @staticmethod
+    def from_frame(df, tag_column, x_column, y_column, time_column, ts_format):
+        """Builds the table of a DataFrame, one trajectory per run of equal tags.
+
+        Like the row-by-row readers, a new trajectory starts whenever the tag
+        changes from one row to the next.
+        """
+        x = df[x_column].to_numpy(dtype=numpy.float64)
+        y = df[y_column].to_numpy(dtype=numpy.float64)
+        t = pd.to_datetime(df[time_column], format=ts_format).to_numpy().astype('datetime64[us]').astype(numpy.int64)
+
+        runs = []
+        if len(df) > 0:
+            tags = df[tag_column].tolist()
+            starts = [0] + [i for i in range(1, len(tags)) if tags[i] != tags[i - 1]]
+            stops = starts[1:] + [len(tags)]
+            runs = [(tags[start], start, stop) for start, stop in zip(starts, stops)]
+
+        return TrajectoryTable(x, y, t, runs)
+
+    def fingerprint(self, i):
+        """Hash of the tag and of the points of the i-th trajectory: equal
+        fingerprints mean equal SeqScan inputs."""
+        tag, start, stop = self.runs[i]
+        h = hashlib.sha1(str(tag).encode('utf-8'))
+        for column in (self.x, self.y, self.t):
+            h.update(numpy.ascontiguousarray(column[start:stop]).tobytes())
+        return h.hexdigest()
+
+    def trajectory(self, i):
+        """Returns the i-th trajectory as a Trajectory."""
+        return self.slice_trajectory(*self.runs[i])
+
+    def slice_trajectory(self, tag, start, stop):
+        """Returns the rows [start, stop) as a Trajectory with the given tag."""
+        timestamps = self.t[start:stop].astype('datetime64[us]').astype(object)
+        points = [Point(x, y, ts) for x, y, ts in
+                  zip(self.x[start:stop].tolist(), self.y[start:stop].tolist(), timestamps)]
+        return Trajectory(points, tag_id=tag)
+
+    def to_shared_memory(self):
+        """Copies the arrays into a new SharedMemory block.
+
+        Returns the block, to be closed and unlinked by the caller once the
+        workers are done, and the small descriptor to pass to attach().
+        """
+        from multiprocessing import shared_memory
+
+        n = self.n_points
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 24 * n))
+        x, y, t = TrajectoryTable._views(shm, n)
+        x[:] = self.x
+        y[:] = self.y
+        t[:] = self.t
+        return shm, (shm.name, n)
+
+    @staticmethod
+    def attach(descriptor):
+        """Maps the arrays of a block made by to_shared_memory(), without copy.
+
+        Returns the table (with no runs: workers receive the offsets of their
+        trajectories) and the block, which must stay referenced while the
+        table is used.
+        """
+        from multiprocessing import shared_memory
+
+        name, n = descriptor
+        # the creator owns the block and unlinks it; pool workers share its
+        # resource tracker, so attaching does not register it a second time
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+        x, y, t = TrajectoryTable._views(shm, n)
+        return TrajectoryTable(x, y, t), shm
+
+    @staticmethod
+    def _views(shm, n):
+        x = numpy.ndarray((n,), dtype=numpy.float64, buffer=shm.buf, offset=0)
+        y = numpy.ndarray((n,), dtype=numpy.float64, buffer=shm.buf, offset=8 * n)
+        t = numpy.ndarray((n,), dtype=numpy.int64, buffer=shm.buf, offset=16 * n)
+        return x, y, t
@@ -0,0 +1,238 @@
+"""Fast estimation of the SEQSCAN parameters of a new dataset.
+
+Instead of running SEQSCAN with dozens of settings, the estimator looks at
+the data once:
+
+- the k-distance profile: for a sample of points, the distance to their k
+  nearest points of the same trajectory, with the distance of SeqScan
+  (euclidean or haversine). Sorted, the k-distances rise slowly over the
+  points of dense places and sharply over the isolated ones; the knee of the
+  curve for k = n - 1 (the point is one of its own n neighbors) is a natural
+  distance for stops of n points;
+- the sampling: the intervals between consecutive points and the time span
+  of n consecutive points, which bounds the presence a stop of n points can
+  have.
+
+For each candidate n it suggests an eps and a range around it, and a delta
+range; grid() turns a suggestion into the few settings worth a full run
+(e.g. with run_ss_sweep()).
+"""
+
+# Standard modules
+import csv
+import math
+
+import numpy
+
+from .preflight import EARTH_RADIUS
+
+
+# number of points whose k-distances are computed, over all the trajectories
+SAMPLE_SIZE = 512
+# candidate values of n
+N_VALUES = (3, 5, 10, 20)
+# n of the default grid, when it is a candidate
+DEFAULT_N = 5
+# max number of distances computed at once
+BLOCK_SIZE = 1 << 22
+# k-distances above this quantile are left out of the knee search
+KNEE_QUANTILE = 0.99
+# an interval this many times the median one is a gap in the sampling
+GAP_FACTOR = 10
+
+SUGGESTION_COLUMNS = ["n_points", "eps", "eps_low", "eps_high", "delta_low", "delta_high"]
+
+
+def distances(lat1, lon1, lat2, lon2, cartesian):
+    """SeqScan.distance() on arrays, broadcast against each other."""
+    if cartesian:
+        return numpy.sqrt((lon1 - lon2) ** 2 + (lat1 - lat2) ** 2)
+    dlon = numpy.radians(lon2) - numpy.radians(lon1)
+    dlat = numpy.radians(lat2) - numpy.radians(lat1)
+    a = numpy.sin(dlat / 2) ** 2 + numpy.cos(numpy.radians(lat1)) * numpy.cos(numpy.radians(lat2)) \
+        * numpy.sin(dlon / 2) ** 2
+    return 2 * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0))) * EARTH_RADIUS
+
+
+def k_distances(lat, lon, sample, k_max, cartesian):
+    """Distances of the points of index sample to their 1..k_max nearest
+    other points of lat, lon, as a (len(sample), k_max) array (inf where the
+    trajectory has fewer points)."""
+    size = len(lat)
+    result = numpy.full((len(sample), k_max), numpy.inf)
+    k = min(k_max, size - 1)
+    if k <= 0:
+        return result
+    rows = max(1, BLOCK_SIZE // size)
+    for start in range(0, len(sample), rows):
+        block = sample[start:start + rows]
+        d = distances(lat[block, None], lon[block, None], lat[None, :], lon[None, :], cartesian)
+        d[numpy.arange(len(block)), block] = numpy.inf      # the point itself
+        nearest = numpy.partition(d, k - 1, axis=1)[:, :k]
+        result[start:start + len(block), :k] = numpy.sort(nearest, axis=1)
+    return result
+
+
+def knee(values):
+    """The value at the knee of the sorted values: the point of the curve
+    farthest below the chord joining its ends, both axes scaled to [0, 1]."""
+    values = numpy.sort(values[numpy.isfinite(values)])
+    if len(values) == 0:
+        return math.nan
+    values = values[:max(1, int(math.ceil(len(values) * KNEE_QUANTILE)))]
+    if len(values) < 3 or values[-1] == values[0]:
+        return float(values[-1])
+    x = numpy.linspace(0.0, 1.0, len(values))
+    y = (values - values[0]) / (values[-1] - values[0])
+    return float(values[numpy.argmax(x - y)])
+
+
+def spans(t, n):
+    """Time spans (seconds) of the runs of n consecutive timestamps of t."""
+    if len(t) < n or n < 2:
+        return numpy.empty(0)
+    return t[n - 1:] - t[:len(t) - n + 1]
+
+
+def round_significant(value, digits=2):
+    """value rounded to digits significant digits."""
+    if not math.isfinite(value) or value == 0:
+        return value
+    return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+
+def trajectory_arrays(trajectory):
+    """The (lat, lon, t) arrays of a Trajectory for estimate()."""
+    points = sorted(trajectory, key=lambda p: p.timestamp)
+    t = numpy.array([p.timestamp for p in points], dtype='datetime64[us]').astype(numpy.int64) / 1e6
+    return numpy.array([p.lat for p in points]), numpy.array([p.lon for p in points]), t
+
+
+def estimate(trajectories, cartesian, n_values=N_VALUES, sample_size=SAMPLE_SIZE, seed=0, time_unit="s",
+             time_scale=1.0):
+    """Estimates the SEQSCAN parameters of the trajectories.
+
+    Args:
+        trajectories (list): the (lat, lon, t) arrays of each trajectory,
+            sorted by time, lat and lon as read from the X and Y columns and
+            t in seconds
+        cartesian (bool): the coordinate system of the configuration
+        n_values (iterable): the candidate values of n
+        sample_size (int): number of points whose k-distances are computed,
+            shared among the trajectories by their number of points
+        time_unit (str), time_scale (float): unit of the deltas suggested,
+            and its length in seconds
+
+    Returns:
+        a ParameterEstimate
+    """
+    n_values = sorted(set(int(n) for n in n_values if n >= 2))
+    k_max = max(n_values) - 1
+    total = sum(len(t) for _, _, t in trajectories)
+    if total == 0:
+        raise ValueError("no points to estimate the parameters from")
+    rng = numpy.random.default_rng(seed)
+
+    profile = []
+    intervals = []
+    run_spans = {n: [] for n in n_values}
+    for lat, lon, t in trajectories:
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        lon = numpy.asarray(lon, dtype=numpy.float64)
+        t = numpy.asarray(t, dtype=numpy.float64)
+        if len(t) == 0:
+            continue
+        intervals.append(numpy.diff(t))
+        for n in n_values:
+            run_spans[n].append(spans(t, n))
+        share = min(len(t), max(1, int(round(sample_size * len(t) / total))))
+        sample = numpy.sort(rng.choice(len(t), share, replace=False))
+        profile.append(k_distances(lat, lon, sample, k_max, cartesian))
+
+    profile = numpy.concatenate(profile) if profile else numpy.empty((0, k_max))
+    intervals = numpy.concatenate(intervals) if intervals else numpy.empty(0)
+    suggestions = []
+    for n in n_values:
+        eps = round_significant(knee(profile[:, n - 2])) if len(profile) else math.nan
+        span = numpy.concatenate(run_spans[n])
+        if len(span):
+            delta_low = round_significant(float(numpy.median(span)) / time_scale)
+            delta_high = round_significant(float(numpy.quantile(span, 0.9)) / time_scale)
+            if delta_high <= delta_low:
+                delta_high = 2 * delta_low
+        else:
+            delta_low = delta_high = math.nan
+        suggestions.append([n, eps, round_significant(eps / 2), round_significant(eps * 2), delta_low, delta_high])
+    return ParameterEstimate(len(trajectories), total, intervals, profile, suggestions, time_unit)
+
+
+class ParameterEstimate():
+    """Suggested SEQSCAN parameters of a dataset, see estimate().
+
+    Args:
+        trajectories (int): number of trajectories looked at
+        points (int): number of points of those trajectories
+        intervals (array): intervals between consecutive points (seconds)
+        profile (array): k-distances of the sampled points, one row per
+            point and one column per k = 1, 2, ...
+        suggestions (list): one row of SUGGESTION_COLUMNS per candidate n,
+            distances in the unit of the SEQSCAN distance, deltas in time_unit
+        time_unit (str): unit of the deltas
+    """
+
+    def __init__(self, trajectories, points, intervals, profile, suggestions, time_unit="s"):
+        self.trajectories = trajectories
+        self.points = points
+        self.intervals = intervals
+        self.profile = profile
+        self.suggestions = suggestions
+        self.time_unit = time_unit
+
+    def sampling(self):
+        """Median, 10th and 90th percentiles of the sampling intervals
+        (seconds), and the number of gaps, intervals of GAP_FACTOR times the
+        median or more."""
+        if len(self.intervals) == 0:
+            return {"median": math.nan, "p10": math.nan, "p90": math.nan, "gaps": 0}
+        median = float(numpy.median(self.intervals))
+        return {
+            "median": median,
+            "p10": float(numpy.quantile(self.intervals, 0.1)),
+            "p90": float(numpy.quantile(self.intervals, 0.9)),
+            "gaps": int(numpy.sum(self.intervals >= GAP_FACTOR * median)) if median > 0 else 0,
+        }
+
+    def suggestion(self, n=None):
+        """The suggestion row of n, of DEFAULT_N or else of the first
+        candidate when None."""
+        rows = {row[0]: row for row in self.suggestions}
+        if n is None:
+            n = DEFAULT_N if DEFAULT_N in rows else self.suggestions[0][0]
+        if n not in rows:
+            raise ValueError("%s is not a candidate n: %s" % (n, sorted(rows)))
+        return rows[n]
+
+    def grid(self, n=None):
+        """The (eps values, delta values, n values) worth a full run for n:
+        the suggested eps and the ends of its range, the ends of the delta
+        range."""
+        n, eps, eps_low, eps_high, delta_low, delta_high = self.suggestion(n)
+        return [eps_low, eps, eps_high], [delta_low, delta_high], [n]
+
+    def report(self):
+        """Prints the suggestions."""
+        sampling = self.sampling()
+        print('Parameter estimate over ', self.trajectories, ' trajectories, ', self.points, ' points, ',
+              len(self.profile), ' sampled')
+        print('sampling interval: median %.3g s, 10%%-90%% %.3g-%.3g s, %d gaps' % (
+            sampling["median"], sampling["p10"], sampling["p90"], sampling["gaps"]))
+        for n, eps, eps_low, eps_high, delta_low, delta_high in self.suggestions:
+            print('n=%d: eps %.6g (%.6g-%.6g), delta %.6g-%.6g %s' % (n, eps, eps_low, eps_high, delta_low,
+                                                                       delta_high, self.time_unit))
+
+    def save(self, path):
+        """Writes the suggestions to a csv file."""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(SUGGESTION_COLUMNS)
+            writer.writerows(self.suggestions)
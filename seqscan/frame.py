@@ -0,0 +1,113 @@
+"""SEQSCAN on pandas DataFrames.
+
+seqscan_dataframe() clusters the trajectories of a DataFrame in memory and
+returns the label columns of its rows and the stops as DataFrames, the same
+as the classification and symbolic outputs of a run on the csv file, without
+the files: the SEQSCAN points are built straight from the columns instead of
+going through the csv reader, data Points and Trajectory. Trajectories can
+be clustered in a process pool, each worker receiving the columns of its
+trajectory only.
+"""
+
+# Standard modules
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas as pd
+
+# my modules
+from .seqscan import SeqScan, SYMBOLIC_HEADER, LABEL_COLUMNS, convert_time_to_s, label_annotations
+from .data.trajectory import Trajectory
+
+
+with open('./config.json') as f:
+    config = json.load(f)
+TAG_COLUMN = config["CSV_columns"]["TAG_COLUMN"]
+TIME_COLUMN = config["CSV_columns"]["TIME_COLUMN"]
+X_COLUMN = config["CSV_columns"]["X_COLUMN"]
+Y_COLUMN = config["CSV_columns"]["Y_COLUMN"]
+TIMESTAMP_FORMAT = config["TIMESTAMP_FORMAT"]
+
+
+def cluster_columns(task):
+    """Clusters one trajectory given as columns.
+
+    Args:
+        task (tuple): the tag, the x, y and timestamps (datetime) of the
+            points in time order, distance, n_points and presence (seconds)
+
+    Returns:
+        the (type, stop number) of each point (see SeqScan.point_labels())
+        and the rows of the symbolic trajectory
+    """
+    tag, x, y, timestamps, distance, n_points, presence = task
+    seqscan = SeqScan(Trajectory(tag_id=tag), None, None)
+    dataset = seqscan.scan_rows(zip(x, y, timestamps), distance, n_points, presence)
+    labels = seqscan.point_labels()
+    _, rows = seqscan.symbolic_rows()
+    seqscan.clearObjectMemory(dataset)
+    return labels, rows
+
+
+def seqscan_dataframe(df, eps, n, delta, tag_col=TAG_COLUMN, x_col=X_COLUMN, y_col=Y_COLUMN, time_col=TIME_COLUMN,
+                      ts_format=TIMESTAMP_FORMAT, max_processors=1):
+    """Runs SeqScan on the trajectories of a DataFrame.
+
+    Args:
+        df (DataFrame): the points, one trajectory per value of tag_col, or
+            a single trajectory when tag_col is None or not a column; rows
+            whose tag is missing are not clustered and get missing labels
+        eps (float), n (int): the SEQSCAN distance and min number of points
+        delta (float): the presence, in the time unit of the configuration
+        x_col, y_col, time_col (str): the coordinate and timestamp columns,
+            timestamps as datetimes or as strings in ts_format
+        max_processors (int): processes clustering the trajectories
+
+    Returns:
+        the LABEL_COLUMNS of the rows of df (same index) and the stops, one
+        row per stop with the columns of the symbolic output
+    """
+    presence = convert_time_to_s(delta)
+    if pd.api.types.is_datetime64_any_dtype(df[time_col]):
+        times = df[time_col]
+    else:
+        times = pd.to_datetime(df[time_col], format=ts_format)
+    x = df[x_col].to_numpy(dtype=numpy.float64)
+    y = df[y_col].to_numpy(dtype=numpy.float64)
+    t = times.to_numpy()
+
+    if tag_col is not None and tag_col in df.columns:
+        groups = df.groupby(tag_col, sort=False).indices
+    else:
+        groups = {None: numpy.arange(len(df))}
+
+    tasks = []
+    positions = []
+    for tag, rows in groups.items():
+        # stable: points of equal timestamps keep their order, as in Trajectory
+        rows = rows[numpy.argsort(t[rows], kind='stable')]
+        positions.append(rows)
+        tasks.append((tag, x[rows].tolist(), y[rows].tolist(), times.iloc[rows].dt.to_pydatetime().tolist(), eps, n,
+                      presence))
+
+    if max_processors > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(max_processors, len(tasks))) as ex:
+            results = list(ex.map(cluster_columns, tasks))
+    else:
+        results = [cluster_columns(task) for task in tasks]
+
+    labels = [None] * len(df)
+    stops = []
+    for rows, (trajectory_labels, symbolic) in zip(positions, results):
+        for i, label in zip(rows.tolist(), trajectory_labels):
+            labels[i] = label
+        stops.extend(symbolic)
+
+    # rows without a tag are in no trajectory: their labels are missing
+    missing = (None,) * len(LABEL_COLUMNS)
+    labels = pd.DataFrame([missing if label is None else label_annotations(*label) for label in labels],
+                          index=df.index, columns=LABEL_COLUMNS)
+    if labels["cluster"].isna().any():
+        labels["cluster"] = labels["cluster"].astype("Int64")
+    return labels, pd.DataFrame(stops, columns=SYMBOLIC_HEADER)
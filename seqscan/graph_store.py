@@ -0,0 +1,146 @@
+"""Persistent store of the neighbor graphs of trajectories.
+
+The NeighborGraph of a trajectory (see neighbors.py) only depends on its
+points and on the distance. The store keeps it on disk in compressed sparse
+row form, one .npy file for indptr and one for indices, under the fingerprint
+of the trajectory and the distance, so that later runs, and the preflight,
+read it back instead of computing it again. The files are memory-mapped
+read-only: the worker processes of a run using the same graph share the
+pages of the OS cache instead of each holding a copy.
+
+A graph missing for a distance is restricted from the one of the smallest
+larger distance stored, if any, and stored in turn.
+"""
+
+# Standard modules
+import hashlib
+import os
+
+import numpy
+
+from .neighbors import NeighborGraph
+
+
+# bump when the graph or the file layout change, to ignore older graphs
+GRAPH_VERSION = 1
+
+COORDS_FILE = 'coords.npy'
+INDPTR_SUFFIX = '.indptr.npy'
+INDICES_SUFFIX = '.indices.npy'
+
+
+def fingerprint(x, y, t, cartesian):
+    """Hash of the points of a trajectory, in time order: their coordinates
+    as read from the X and Y columns and their timestamps in microseconds
+    since the epoch (int64), as in TrajectoryTable."""
+    h = hashlib.sha1(repr((GRAPH_VERSION, bool(cartesian))).encode('utf-8'))
+    h.update(numpy.ascontiguousarray(x, dtype=numpy.float64).tobytes())
+    h.update(numpy.ascontiguousarray(y, dtype=numpy.float64).tobytes())
+    h.update(numpy.ascontiguousarray(t, dtype=numpy.int64).tobytes())
+    return h.hexdigest()
+
+
+def dataset_fingerprint(dataset, cartesian):
+    """fingerprint() of the SEQSCAN points of a trajectory, sorted by time."""
+    t = numpy.array([p.time for p in dataset], dtype='datetime64[us]').astype(numpy.int64)
+    return fingerprint([p.geometry.lat for p in dataset], [p.geometry.lon for p in dataset], t, cartesian)
+
+
+class GraphStore():
+    """Directory of neighbor graphs, shared by the processes of a run.
+
+    Args:
+        directory (str): where the graphs are stored
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    @staticmethod
+    def name(distance):
+        return repr(float(distance))
+
+    def distances(self, key):
+        """The distances of the graphs stored under key."""
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return []
+        return sorted(float(e.name[:-len(INDPTR_SUFFIX)]) for e in os.scandir(path) if e.name.endswith(INDPTR_SUFFIX))
+
+    def get(self, key, distance):
+        """The stored graph of key for distance, memory-mapped, restricted
+        from the one of a larger distance if needed, or None."""
+        larger = [d for d in self.distances(key) if d >= distance]
+        if not larger:
+            self.misses += 1
+            return None
+        graph = self._load(key, larger[0])
+        if graph is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if larger[0] != distance:
+            graph = graph.restrict(distance)
+            self.put(key, graph)
+        return graph
+
+    def put(self, key, graph):
+        """Stores graph under key. Indices are stored on 32 bits when the
+        trajectory allows it."""
+        path = self.path(key)
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(os.path.join(path, COORDS_FILE)):
+            self._save(os.path.join(path, COORDS_FILE), numpy.stack([graph.x, graph.y]))
+        dtype = numpy.int32 if len(graph) < 2 ** 31 else numpy.int64
+        name = self.name(graph.distance)
+        # the indptr file is written last: it marks a complete graph
+        self._save(os.path.join(path, name + INDICES_SUFFIX), numpy.asarray(graph.indices, dtype=dtype))
+        self._save(os.path.join(path, name + INDPTR_SUFFIX), numpy.asarray(graph.indptr, dtype=numpy.int64))
+
+    def graph(self, key, x, y, distance):
+        """The graph of key for distance, from the store or computed from the
+        projected coordinates x, y and stored."""
+        graph = self.get(key, distance)
+        if graph is None:
+            graph = NeighborGraph.build(x, y, distance)
+            self.put(key, graph)
+        return graph
+
+    def _load(self, key, distance):
+        path = self.path(key)
+        name = self.name(distance)
+        try:
+            coords = numpy.load(os.path.join(path, COORDS_FILE), mmap_mode='r')
+            indptr = numpy.load(os.path.join(path, name + INDPTR_SUFFIX), mmap_mode='r')
+            indices = numpy.load(os.path.join(path, name + INDICES_SUFFIX), mmap_mode='r')
+        except (OSError, ValueError):
+            # files cut short
+            return None
+        if len(indptr) != coords.shape[1] + 1 or indptr[-1] != len(indices):
+            return None
+        return NeighborGraph(coords[0], coords[1], distance, indptr, indices)
+
+    @staticmethod
+    def _save(path, array):
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            numpy.save(f, array)
+        os.replace(tmp, path)
+
+    def clear(self):
+        """Removes every graph."""
+        if not os.path.isdir(self.directory):
+            return
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for graph in os.scandir(sub.path):
+                if graph.is_dir():
+                    for e in os.scandir(graph.path):
+                        os.remove(e.path)
+                    os.rmdir(graph.path)
@@ -0,0 +1,184 @@
+"""Spatial candidate neighborhoods of the points of a trajectory.
+
+For each point, SEQSCAN looks for its neighbors among the earlier points that
+are still reachable (current noise set and regions of the current time
+frame) and fall in the square of half side distance + 1 around it. The
+spatial part of that search does not depend on the clustering state: it is
+computed here with NumPy, ahead of the clustering loop, and the loop only
+keeps the candidates that are reachable.
+
+The candidates of every point can also be kept as a NeighborGraph, in
+compressed sparse row form: the graph of a distance contains the one of any
+smaller distance, so that runs sharing a trajectory with several distances
+(see sweep.py) compute it once, for the largest one, and filter it down.
+"""
+
+# Standard modules
+import numpy
+
+from .pipeline import prefetch
+
+
+# number of points whose candidates are computed together
+CHUNK_SIZE = 512
+# number of chunks computed ahead of the clustering loop
+PREFETCH_CHUNKS = 4
+
+
+class SpatialGrid():
+    """Grid of cells of side distance + 1 over the projected points.
+
+    Args:
+        x, y (array): projected coordinates of the points, in time order
+        distance (float): the SEQSCAN distance
+    """
+
+    def __init__(self, x, y, distance):
+        self.x = numpy.asarray(x, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        self.distance = distance
+        self.width = distance + 1
+
+        size = len(self.x)
+        if size == 0:
+            self.cx = self.cy = self.order = self.sorted_keys = numpy.empty(0, dtype=numpy.int64)
+            self.stride = 3
+            return
+        # cells a little larger than the square, against rounding
+        cell = self.width * (1 + 1e-9) + 1e-9
+        self.cx = numpy.floor((self.x - self.x.min()) / cell).astype(numpy.int64) + 1
+        self.cy = numpy.floor((self.y - self.y.min()) / cell).astype(numpy.int64) + 1
+        self.stride = int(self.cy.max()) + 2
+        keys = self.cx * self.stride + self.cy
+        # point indices grouped by cell, increasing inside each cell
+        self.order = numpy.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def chunk(self, start, stop):
+        """Returns, for each point j in start..stop-1, the indices of the points
+        before j in the square of point j, in increasing order.
+
+        The comparisons are the ones of Rectangle.buffer() and
+        Rectangle.contains_point(), on the same float values. The whole chunk
+        is computed with array operations, which release the GIL.
+        """
+        return self.candidates(numpy.arange(start, stop))
+
+    def candidates(self, js):
+        """As chunk(), for the points of the increasing index array js."""
+        if len(js) == 0:
+            return []
+        # index pairs (j, i) of the points i in the 3 x 3 cells around j
+        owners, members = [], []
+        for dx in (-1, 0, 1):
+            base = (self.cx[js] + dx) * self.stride + self.cy[js]
+            lo = numpy.searchsorted(self.sorted_keys, base - 1, side='left')
+            hi = numpy.searchsorted(self.sorted_keys, base + 1, side='right')
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            owner = numpy.repeat(js, counts)
+            # positions lo[k], lo[k] + 1, ..., hi[k] - 1 for each k, flattened
+            offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            owners.append(owner)
+            members.append(self.order[numpy.repeat(lo, counts) + offsets])
+        if not owners:
+            return [numpy.empty(0, dtype=numpy.int64) for _ in js]
+        owner = numpy.concatenate(owners)
+        member = numpy.concatenate(members)
+
+        keep = member < owner
+        owner = owner[keep]
+        member = member[keep]
+        xj = self.x[owner]
+        yj = self.y[owner]
+        qx = self.x[member]
+        qy = self.y[member]
+        w = self.width
+        keep = (xj - w <= qx) & (qx <= xj + w) & (yj - w <= qy) & (qy <= yj + w)
+        owner = owner[keep]
+        member = member[keep]
+
+        # group by point, increasing indices inside each group
+        order = numpy.lexsort((member, owner))
+        member = member[order]
+        bounds = numpy.searchsorted(owner[order], js, side='left')
+        return numpy.split(member, bounds[1:])
+
+
+class NeighborGraph():
+    """Spatial candidates of every point of a trajectory, in compressed
+    sparse row form: those of point j are indices[indptr[j]:indptr[j + 1]],
+    the points before j in its square, in increasing order.
+
+    Args:
+        x, y (array): projected coordinates of the points, in time order
+        distance (float): the SEQSCAN distance
+        indptr (array): len(x) + 1 offsets into indices
+        indices (array): the candidates of all the points, one after the other
+    """
+
+    def __init__(self, x, y, distance, indptr, indices):
+        self.x = numpy.asarray(x, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        self.distance = distance
+        self.indptr = indptr
+        self.indices = indices
+
+    @staticmethod
+    def build(x, y, distance, chunk_size=CHUNK_SIZE):
+        """Computes the graph of the points, one chunk at a time."""
+        grid = SpatialGrid(x, y, distance)
+        counts = [numpy.zeros(1, dtype=numpy.int64)]
+        indices = []
+        for start in range(0, len(grid.x), chunk_size):
+            candidates = grid.chunk(start, min(start + chunk_size, len(grid.x)))
+            counts.append(numpy.array([len(c) for c in candidates], dtype=numpy.int64))
+            indices.extend(candidates)
+        indptr = numpy.cumsum(numpy.concatenate(counts))
+        indices = numpy.concatenate(indices) if indices else numpy.empty(0, dtype=numpy.int64)
+        return NeighborGraph(grid.x, grid.y, distance, indptr, indices)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def restrict(self, distance):
+        """The graph of a distance not larger than this one: the candidates
+        kept are the ones SpatialGrid(x, y, distance) would find."""
+        if distance > self.distance:
+            raise ValueError("cannot restrict the graph of distance %s to %s" % (self.distance, distance))
+        if distance == self.distance:
+            return self
+        owner = numpy.repeat(numpy.arange(len(self)), numpy.diff(self.indptr))
+        xj = self.x[owner]
+        yj = self.y[owner]
+        qx = self.x[self.indices]
+        qy = self.y[self.indices]
+        w = distance + 1
+        keep = (xj - w <= qx) & (qx <= xj + w) & (yj - w <= qy) & (qy <= yj + w)
+        counts = numpy.bincount(owner[keep], minlength=len(self))
+        indptr = numpy.concatenate([numpy.zeros(1, dtype=numpy.int64), numpy.cumsum(counts)])
+        return NeighborGraph(self.x, self.y, distance, indptr, self.indices[keep])
+
+    def rows(self):
+        """Yields the candidates of each point, in order, as spatial_candidates()."""
+        for start in range(0, len(self), CHUNK_SIZE):
+            bounds = self.indptr[start:start + CHUNK_SIZE + 1].tolist()
+            for lo, hi in zip(bounds, bounds[1:]):
+                yield self.indices[lo:hi]
+
+
+def spatial_candidates(dataset, distance, chunk_size=CHUNK_SIZE, depth=PREFETCH_CHUNKS):
+    """Yields candidates(j) for each point of dataset, in order, computed by
+    a background thread a few chunks ahead of the caller.
+
+    Args:
+        dataset (list of Point): the SEQSCAN points, in time order
+        distance (float): the SEQSCAN distance
+    """
+    grid = SpatialGrid([p.geometry.x for p in dataset], [p.geometry.y for p in dataset], distance)
+    chunks = [(start, min(start + chunk_size, len(dataset))) for start in range(0, len(dataset), chunk_size)]
+    for bounds, results in prefetch(chunks, lambda bounds: grid.chunk(*bounds), depth):
+        for result in results:
+            yield result
@@ -0,0 +1,360 @@
+"""Online SEQSCAN on a live feed of positions.
+
+OnlineSeqScan receives the points of one object one at a time, in time order,
+and runs the SEQSCAN loop on each of them as it arrives (SeqScan.scan_point).
+It emits events as soon as they are known:
+
+- STOP_START when a new stop becomes active: it is certain to be a stop, but
+  its first timestamp may still move back as earlier points join it;
+- STOP_END when the stop is replaced by the next one, or at close(): its
+  points, first and last timestamps and centroid are final;
+- LABEL for each point once its label is final, i.e. once the stop it belongs
+  to, or the stop after it, has ended.
+
+Once a stop ends, no later point can join it or any earlier region: a new
+time context starts after its last point. The points up to it are labelled,
+then dropped along with the regions of the contexts behind, so that the state
+only holds the points of the active time context. Labels and stops are those
+of SeqScan.run on the whole trajectory.
+
+The active time context grows as long as no stop ends, e.g. along a long
+move. max_context bounds it: when the oldest point kept is older than
+max_context, the stream is cut as if the trajectory ended there (the active
+stop ends, the points kept are labelled) and clustering starts afresh, so
+results then differ from a batch run around the cuts.
+
+Region keeps its scan state in class attributes: each OnlineSeqScan keeps its
+own copy and installs it while it runs, so that the scans of many objects can
+be interleaved in one thread (not in several threads).
+
+An OnlineSeqScan pickles to a flat table of its points and regions: their
+graph of neighbors is too deep for the recursive pickling of the objects.
+"""
+
+# Standard modules
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy
+
+# my modules
+from .region import Region
+from .point import Point
+from .feature_point import FeaturePoint
+from .seqscan import SeqScan
+from .data.trajectory import Trajectory
+
+
+STOP_START = "stop_start"
+STOP_END = "stop_end"
+LABEL = "label"
+
+# class-level state of Region owned by each online scan
+REGION_STATE = ("threshold", "counter", "log", "phase", "expansion_log", "look_up_log", "expansion_noise",
+                "look_up_noise")
+
+
+class _Ref(int):
+    """Position of a Point or Region in the object table of a pickled state."""
+
+
+class _Refs():
+    """Positions of a set, list or deque of Points and Regions."""
+
+    def __init__(self, kind, positions):
+        self.kind = kind
+        self.positions = positions
+
+
+_COLLECTIONS = {"set": set, "list": list, "deque": deque}
+
+
+def _position(value, table, index):
+    key = id(value)
+    if key not in index:
+        index[key] = len(table)
+        table.append(value)
+    return index[key]
+
+
+def _flatten(value, table, index):
+    """value with the Points and Regions it holds replaced by their position
+    in table (index maps their id() to their position)."""
+    if isinstance(value, (Point, Region)):
+        return _Ref(_position(value, table, index))
+    if isinstance(value, (set, frozenset, list, deque)):
+        kind = "set" if isinstance(value, (set, frozenset)) else type(value).__name__
+        if value and all(isinstance(v, (Point, Region)) for v in value):
+            # the neighbors of the points: one array instead of an object each
+            return _Refs(kind, numpy.array([_position(v, table, index) for v in value], dtype=numpy.int32))
+        return _COLLECTIONS[kind](_flatten(v, table, index) for v in value)
+    if isinstance(value, tuple):
+        return tuple(_flatten(v, table, index) for v in value)
+    if isinstance(value, dict):
+        return {k: _flatten(v, table, index) for k, v in value.items()}
+    return value
+
+
+def _restore(value, objects):
+    """Inverse of _flatten(), objects being the rebuilt table."""
+    if type(value) is _Ref:
+        return objects[value]
+    if type(value) is _Refs:
+        return _COLLECTIONS[value.kind](objects[k] for k in value.positions.tolist())
+    if isinstance(value, (set, list, deque)):
+        return type(value)(_restore(v, objects) for v in value)
+    if isinstance(value, tuple):
+        return tuple(_restore(v, objects) for v in value)
+    if isinstance(value, dict):
+        return {k: _restore(v, objects) for k, v in value.items()}
+    return value
+
+
+def flatten_objects(state):
+    """Returns (classes, attributes, flat state) of state, a structure holding
+    Points and Regions: the objects reachable from it are listed once, their
+    attributes and state referring to each other by position."""
+    table, index = [], {}
+    flat = _flatten(state, table, index)
+    attributes = []
+    k = 0
+    # the table grows while the attributes of its objects are flattened
+    while k < len(table):
+        attributes.append(_flatten(vars(table[k]), table, index))
+        k += 1
+    return [type(o) for o in table], attributes, flat
+
+
+def restore_objects(classes, attributes, flat):
+    """Rebuilds the state flattened by flatten_objects()."""
+    objects = [cls.__new__(cls) for cls in classes]
+    for o, attrs in zip(objects, attributes):
+        o.__dict__.update(_restore(attrs, objects))
+    return _restore(flat, objects)
+
+
+class StreamEvent():
+    """Event emitted by OnlineSeqScan.
+
+    Args:
+        kind (str): STOP_START, STOP_END or LABEL
+        tag_id: the trajectory tag
+        stop (int): number of the stop (STOP_<stop> in the symbolic output);
+            for a LABEL, the stop of the point or the last stop before it, as
+            in SeqScan.point_labels()
+        first (datetime): first timestamp of the stop (provisional for a
+            STOP_START), or timestamp of the point of a LABEL
+        last (datetime): last timestamp of the stop, for a STOP_END
+        centroid (tuple): centroid of the stop, for a STOP_END
+        point (tuple): (lat, lon, timestamp) of the point, for a LABEL
+        label (str): "cluster", "excursion", "transition" or "noise", for a LABEL
+    """
+
+    def __init__(self, kind, tag_id, stop, first, last=None, centroid=None, point=None, label=None):
+        self.kind = kind
+        self.tag_id = tag_id
+        self.stop = stop
+        self.first = first
+        self.last = last
+        self.centroid = centroid
+        self.point = point
+        self.label = label
+
+    def __repr__(self):
+        if self.kind == LABEL:
+            return 'StreamEvent(label, tag_id=%s, time=%s, %s, stop=%d)' % (self.tag_id, self.first, self.label,
+                                                                             self.stop)
+        return 'StreamEvent(%s, tag_id=%s, stop=%d, first=%s, last=%s)' % (self.kind, self.tag_id, self.stop,
+                                                                            self.first, self.last)
+
+
+class OnlineSeqScan():
+    """SEQSCAN on the points of one object, pushed in time order.
+
+    Args:
+        distance (float): the SEQSCAN distance
+        n_points (int): min number of neighbors of a core point
+        presence (float): min presence of a stop, in seconds
+        tag_id: the trajectory tag, copied to the events
+        max_context (float, optional): seconds of points the state may span
+            before the stream is cut, see the module documentation
+    """
+
+    def __init__(self, distance, n_points, presence, tag_id=None, max_context=None):
+        self.distance = distance
+        self.n_points = n_points
+        self.presence = presence
+        self.tag_id = tag_id
+        self.max_context = timedelta(seconds=max_context) if max_context is not None else None
+
+        self.engine = SeqScan(Trajectory(tag_id=tag_id), None, None)
+        self.engine.clusters = set()
+
+        self.pending = deque()      # points not labelled yet, in time order
+        self.next_id = 0            # point ids: consecutive along the stream
+        self.last_time = None
+        self.stops = 0              # stops found so far
+        self.active_stop = 0        # number of the active stop
+        self.label_stop = 0         # stop number of the last point labelled
+        self.last_cluster = None    # cluster of the last clustered point labelled
+        self.closed = False
+        self._reset()
+
+    def _reset(self):
+        """Starts a new scan: empty regions, no active stop."""
+        self.regions = {
+            "threshold": timedelta(seconds=self.presence),
+            "counter": 0,
+            "log": [],
+            "phase": Region.EXPANSION,
+            "expansion_log": set(),
+            "look_up_log": set(),
+            "expansion_noise": set(),
+            "look_up_noise": set(),
+        }
+        self.time_start = datetime.min
+        self.time_end = datetime.min
+        self.active = None
+        self.last_cluster = None
+
+    def __len__(self):
+        """Number of points held in the state."""
+        return len(self.pending)
+
+    def push(self, lat, lon, timestamp):
+        """Adds the next point of the object and returns the events it
+        triggers, as a list of StreamEvent.
+
+        Raises:
+            ValueError if timestamp is before the one of the previous point
+        """
+        if self.closed:
+            raise ValueError("push() after close()")
+        if self.last_time is not None and timestamp < self.last_time:
+            raise ValueError("points must be pushed in time order: %s after %s" % (timestamp, self.last_time))
+        events = []
+        if self.max_context is not None and self.pending and timestamp - self.pending[0].time > self.max_context:
+            events += self._cut()
+        self.last_time = timestamp
+
+        point = Point(FeaturePoint(lat, lon, self.engine.is_cartesian), timestamp)
+        point.id = self.next_id     # time ranges are runs of consecutive ids
+        self.next_id += 1
+        self.pending.append(point)
+
+        self._install()
+        try:
+            self.time_start, self.time_end, self.active, found = self.engine.scan_point(
+                point, self.distance, self.n_points, self.time_start, self.time_end, self.active
+            )
+        finally:
+            self._uninstall()
+
+        if found:
+            events += self._end_stops()
+            self.stops += 1
+            self.active_stop = self.stops
+            events.append(StreamEvent(STOP_START, self.tag_id, self.active_stop, self.active.first_timestamp()))
+        return events
+
+    def extend(self, points):
+        """push() of each (lat, lon, timestamp) of points; returns all the events."""
+        events = []
+        for lat, lon, timestamp in points:
+            events += self.push(lat, lon, timestamp)
+        return events
+
+    def close(self):
+        """Ends the stream: the active stop ends and every point left is
+        labelled. Returns the last events."""
+        if self.closed:
+            return []
+        events = self._finish()
+        self.closed = True
+        return events
+
+    def _cut(self):
+        """Ends the stream at the current point and starts clustering afresh."""
+        events = self._finish()
+        self._reset()
+        return events
+
+    def _finish(self):
+        if self.active is not None:
+            self.engine.add_cluster(self.active)
+            self.active = None
+        events = self._end_stops()
+        while self.pending:
+            # no stop after them
+            events.append(self._label(self.pending.popleft(), None))
+        return events
+
+    def _end_stops(self):
+        """Emits the stop replaced by the new active one (added to the
+        engine clusters by scan_point()), and the labels of the points up to
+        its last one, then drops them."""
+        events = []
+        for cluster in self.engine.clusters:
+            last = max(p.id for p in cluster.points)
+            while self.pending and self.pending[0].id <= last:
+                point = self.pending.popleft()
+                events.append(self._label(point, cluster))
+                self._release(point)
+            events.append(StreamEvent(STOP_END, self.tag_id, self.active_stop, cluster.first_timestamp(),
+                                      cluster.last_timestamp(), cluster.compute_centroid()))
+        self.engine.clusters = set()
+        self.regions["log"] = []
+        # the contexts before time_start are over
+        for point in self.pending:
+            for start in [s for s in point.regions if s < self.time_start]:
+                del point.regions[start]
+        return events
+
+    def _label(self, point, next_cluster):
+        """LABEL event of point, whose next cluster (the cluster of the first
+        clustered point after it) is next_cluster; see SeqScan.point_labels()."""
+        if next_cluster is not None and point in next_cluster.points:
+            if next_cluster is not self.last_cluster:
+                self.label_stop += 1
+                self.last_cluster = next_cluster
+            label = "cluster"
+        elif next_cluster is None or self.last_cluster is None:
+            label = "noise"
+        elif next_cluster is self.last_cluster:
+            label = "excursion"
+        else:
+            label = "transition"
+        geometry = point.geometry
+        return StreamEvent(LABEL, self.tag_id, self.label_stop, point.time,
+                           point=(geometry.lat, geometry.lon, point.time), label=label)
+
+    @staticmethod
+    def _release(point):
+        """Unlinks a labelled point from the points still held: it can no
+        longer be a neighbor in the time contexts to come."""
+        for n in point.neighbors:
+            if n is not point:
+                n.neighbors.discard(point)
+        point.neighbors = set()
+        point.regions = {}
+
+    def __getstate__(self):
+        state = {k: v for k, v in vars(self).items() if k != "engine"}
+        # only compared with the clusters ending later, see _label()
+        state["last_cluster"] = self.last_cluster is not None
+        return flatten_objects(state)
+
+    def __setstate__(self, flat):
+        state = restore_objects(*flat)
+        state["last_cluster"] = object() if state["last_cluster"] else None
+        self.__dict__.update(state)
+        self.engine = SeqScan(Trajectory(tag_id=self.tag_id), None, None)
+        self.engine.clusters = set()
+
+    def _install(self):
+        for name in REGION_STATE:
+            setattr(Region, name, self.regions[name])
+
+    def _uninstall(self):
+        for name in REGION_STATE:
+            self.regions[name] = getattr(Region, name)
@@ -0,0 +1,196 @@
+"""Background stages overlapping file I/O with the SEQSCAN computation."""
+
+# Standard modules
+import csv
+import queue
+import threading
+
+
+# Sentinel closing a stage queue.
+_DONE = object()
+
+
+class _Call():
+    """AsyncWriter job running a function instead of writing rows."""
+
+    def __init__(self, function):
+        self.function = function
+
+
+def prefetch(items, loader, depth=2):
+    """Yields (item, loader(item)) for each item, loading ahead in a thread.
+
+    While the caller works on one item, a background thread already loads the
+    next ones, keeping at most depth loaded items waiting. Exceptions raised
+    by the loader are re-raised by the generator at the position of the item
+    that failed.
+
+    Args:
+        items (iterable): the items to load, e.g. paths of csv files
+        loader (callable): loads a single item
+        depth (int): max number of loaded items kept ahead of the caller
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(entry):
+        # gives up if the consumer went away
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                try:
+                    entry = (item, loader(item), None)
+                except Exception as exception:
+                    entry = (item, None, exception)
+                if not put(entry):
+                    return
+        finally:
+            put(_DONE)
+
+    worker = threading.Thread(target=produce, name="seqscan-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            entry = buffer.get()
+            if entry is _DONE:
+                break
+            item, result, exception = entry
+            if exception is not None:
+                raise exception
+            yield item, result
+    finally:
+        stop.set()
+        worker.join()
+
+
+def write_rows(path, writing_mode, header, rows, newline=None, lineterminator="\n"):
+    """Writes csv rows to path synchronously.
+
+    Args:
+        path (str): the output file
+        writing_mode (int): 0 or 1 to (over)write the file with its header,
+            2 to append the rows only
+        header (list): the column names
+        rows (iterable): the rows, as sequences of values
+        newline, lineterminator: as in open() and csv.writer()
+    """
+    mode = "a" if writing_mode == 2 else "w"
+    with open(path, mode, newline=newline) as f:
+        _write(f, writing_mode, header, rows, lineterminator)
+
+
+def _write(f, writing_mode, header, rows, lineterminator):
+    writer = csv.writer(f, lineterminator=lineterminator)
+    if writing_mode != 2:
+        writer.writerow(header)
+    writer.writerows(rows)
+
+
+class AsyncWriter():
+    """Writes csv rows to files from a background thread.
+
+    Jobs are queued by submit() and written in order by a single writer
+    thread, so that the caller can go on with the next trajectory while the
+    previous one is serialized. The queue is bounded: when storage is slower
+    than clustering, submit() blocks until there is room again. Jobs waiting
+    in the queue are written in batches, keeping each file open (with a large
+    buffer) across consecutive jobs.
+
+    Args:
+        max_pending (int): max number of jobs waiting in the queue
+        buffer_size (int): size of the write buffer of each open file
+    """
+
+    def __init__(self, max_pending=8, buffer_size=1 << 20):
+        self.buffer_size = buffer_size
+        self._jobs = queue.Queue(maxsize=max(1, max_pending))
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, name="seqscan-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        # already unwinding: an error of the writer must not hide that one
+        try:
+            self.close()
+        except Exception as error:
+            print('The writer failed too: ', repr(error))
+
+    def submit(self, path, writing_mode, header, rows, newline=None, lineterminator="\n"):
+        """Queues rows to be written, with the semantics of write_rows().
+
+        rows may be a generator: it is consumed by the writer thread.
+        """
+        if self._error is not None:
+            raise self._error
+        self._jobs.put((path, writing_mode, header, rows, newline, lineterminator))
+
+    def call(self, function):
+        """Queues function, run by the writer thread once every job queued
+        before it is written and its file closed, e.g. to record that the rows
+        of a trajectory are on disk."""
+        if self._error is not None:
+            raise self._error
+        self._jobs.put(_Call(function))
+
+    def close(self):
+        """Waits until every queued job is written, then stops the thread."""
+        if self._thread.is_alive():
+            self._jobs.put(_DONE)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _drain(self):
+        done = False
+        while not done:
+            batch = [self._jobs.get()]
+            while True:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+            if self._error is None:
+                try:
+                    self._write_batch(batch)
+                except Exception as exception:
+                    self._error = exception
+
+    def _write_batch(self, batch):
+        files = {}
+        try:
+            for job in batch:
+                if isinstance(job, _Call):
+                    for f in files.values():
+                        f.close()
+                    files = {}
+                    job.function()
+                    continue
+                path, writing_mode, header, rows, newline, lineterminator = job
+                f = files.get((path, newline))
+                if f is None or writing_mode != 2:
+                    if f is not None:
+                        f.close()
+                    mode = "a" if writing_mode == 2 else "w"
+                    f = open(path, mode, newline=newline, buffering=self.buffer_size)
+                    files[(path, newline)] = f
+                _write(f, writing_mode, header, rows, lineterminator)
+        finally:
+            for f in files.values():
+                f.close()
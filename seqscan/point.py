@@ -11,12 +11,16 @@ class Point(object):
     
     counter = None             # id generator
     
-    def __init__(self, geometry, time):
+    def __init__(self, geometry, time, weight=1, end_time=None):
         """Constructor.
         
         Args:
             geometry (FeaturePoint) : the geometry,lat,lon,x and y...
             time (datetime) : the observation timestamp
+            weight (int) : number of observations this Point stands for, see
+                stationary.py
+            end_time (datetime) : timestamp of the last of those
+                observations, defaults to time
 
         Note:
             ids are generated using the class counter: this technique is NOT 
@@ -29,6 +33,8 @@ class Point(object):
         self.id = Point.counter
         self.geometry = geometry
         self.time = time
+        self.weight = weight
+        self.end_time = time if end_time is None else end_time
 
 
         self.core=False
@@ -63,7 +69,8 @@ class Point(object):
         """True if this Point is dense in the specified time frame.
         
         A Point is dense (w.r.t. a time frame) if it has at least threshold 
-        neighbors (in the specified time frame).
+        neighbors (in the specified time frame), each neighbor counting for
+        its weight.
         
         Args:
             threshold (int): min number of neighbors for a dense point
@@ -74,7 +81,7 @@ class Point(object):
             this implementation checks only that the neighbors are found AFTER
             the beginning of the time frame, i.e. ignores the end parameter.
         """
-        if len([p for p in self.neighbors if p.time > start]) >= threshold:
+        if sum(p.weight for p in self.neighbors if p.time > start) >= threshold:
             self.core=True
             return True
         else:
@@ -0,0 +1,211 @@
+"""Cost preflight of bulk runs.
+
+Before a run, the runtime and peak memory of SEQSCAN on each trajectory are
+estimated from its number of points and from its density: the mean number of
+earlier points in the query square of a sample of its points, i.e. the
+neighbors each point is compared with and keeps. Memory grows linearly with
+the points and the neighbors they keep; runtime grows with the neighbors and a
+little faster than linearly with the points (longer trajectories carry larger
+noise sets and region logs). The coefficients below were fitted on runs of
+the bundled ATC data and of synthetic trajectories of about 10000 points, so
+they give orders of magnitude rather than exact figures.
+
+The report is used to plan capacity, and by the worker pools to admit tasks
+only while their estimated memory fits a budget (see scheduling.admit()).
+"""
+
+# Standard modules
+import csv
+import math
+
+import numpy
+
+from .neighbors import SpatialGrid
+from .graph_store import fingerprint
+
+
+# number of points whose neighbors are counted to estimate the density
+SAMPLE_SIZE = 256
+
+# cost model, see estimate_cost()
+SECONDS_SCALE = 2.5e-6
+SECONDS_PER_NEIGHBOR = 1e-6
+BYTES_PER_POINT = 1500
+BYTES_PER_NEIGHBOR = 135
+EARTH_RADIUS = 6371009
+# memory of a worker process before it loads its first trajectory
+WORKER_BYTES = 100 * 1024 * 1024
+
+# a trajectory needing more than this share of the memory budget runs alone
+HEAVY_SHARE = 0.5
+
+
+def projected(lat, lon, cartesian):
+    """Coordinates in the unit of the SEQSCAN distance: as is for cartesian
+    data, meters of an equirectangular projection for latitudes and
+    longitudes (close enough to UTM for an estimate)."""
+    lat = numpy.asarray(lat, dtype=numpy.float64)
+    lon = numpy.asarray(lon, dtype=numpy.float64)
+    if cartesian or len(lat) == 0:
+        return lon, lat
+    scale = EARTH_RADIUS * math.pi / 180
+    return lon * scale * math.cos(math.radians(float(numpy.mean(lat)))), lat * scale
+
+
+def sample_density(x, y, distance, sample_size=SAMPLE_SIZE, seed=0):
+    """Mean number of earlier points in the query square of sampled points.
+
+    Args:
+        x, y (array): projected coordinates of the points, in time order
+        distance (float): the SEQSCAN distance
+    """
+    size = len(x)
+    if size == 0:
+        return 0.0
+    grid = SpatialGrid(x, y, distance)
+    if size <= sample_size:
+        sample = numpy.arange(size)
+    else:
+        sample = numpy.sort(numpy.random.default_rng(seed).choice(size, sample_size, replace=False))
+    return float(numpy.mean([len(c) for c in grid.candidates(sample)]))
+
+
+def estimate_cost(points, density):
+    """Estimated (seconds, peak bytes) of SEQSCAN on a trajectory:
+
+        seconds = points * (SECONDS_SCALE * sqrt(points) + SECONDS_PER_NEIGHBOR * density)
+        bytes   = points * (BYTES_PER_POINT + BYTES_PER_NEIGHBOR * density)
+    """
+    seconds = points * (SECONDS_SCALE * math.sqrt(points) + SECONDS_PER_NEIGHBOR * density)
+    peak_bytes = points * (BYTES_PER_POINT + BYTES_PER_NEIGHBOR * density)
+    return seconds, int(peak_bytes)
+
+
+def unit_cost(index, tag, lat, lon, distance, cartesian, graph=None):
+    """TrajectoryCost of the points of coordinates lat, lon, in time order
+    (as read from the X and Y columns). With the stored NeighborGraph of the
+    points, the density is its exact mean degree instead of an estimate."""
+    if graph is not None:
+        return TrajectoryCost(index, tag, len(graph), float(graph.indptr[-1]) / max(1, len(graph)))
+    x, y = projected(lat, lon, cartesian)
+    return TrajectoryCost(index, tag, len(x), sample_density(x, y, distance))
+
+
+def table_costs(table, indices, distance, cartesian, graphs=None):
+    """TrajectoryCost of the trajectories of a TrajectoryTable given by their
+    indices, using the graphs of a GraphStore when it holds them."""
+    costs = []
+    for i in indices:
+        tag, start, stop = table.runs[i]
+        order = numpy.argsort(table.t[start:stop], kind='stable')
+        lat, lon = table.x[start:stop][order], table.y[start:stop][order]
+        graph = None
+        if graphs is not None:
+            graph = graphs.get(fingerprint(lat, lon, table.t[start:stop][order], cartesian), distance)
+        costs.append(unit_cost(i, tag, lat, lon, distance, cartesian, graph))
+    return costs
+
+
+class TrajectoryCost():
+    """Estimated cost of one unit (trajectory or input file) of a run.
+
+    Args:
+        index: position of the unit in the run
+        tag: the trajectory tag, or the input file
+        points (int): number of points
+        density (float): see sample_density()
+    """
+
+    def __init__(self, index, tag, points, density):
+        self.index = index
+        self.tag = tag
+        self.points = points
+        self.density = density
+        self.seconds, self.peak_bytes = estimate_cost(points, density)
+        self.heavy = False
+
+    def __repr__(self):
+        return 'TrajectoryCost(tag=%s, points=%d, density=%.1f, seconds=%.2f, peak=%.1fMB%s)' % (
+            self.tag, self.points, self.density, self.seconds, self.peak_bytes / 2 ** 20,
+            ', heavy' if self.heavy else '')
+
+
+class PreflightReport():
+    """Estimated costs of the units of a run.
+
+    Args:
+        costs (list of TrajectoryCost): one per unit
+        max_processors (int): the number of workers of the run
+        memory_budget (int, optional): bytes the trajectories being clustered
+            may use together, on top of the worker processes themselves;
+            units needing more than HEAVY_SHARE of it are marked heavy
+    """
+
+    def __init__(self, costs, max_processors=1, memory_budget=None):
+        self.costs = costs
+        self.max_processors = max_processors
+        self.memory_budget = memory_budget
+        for c in costs:
+            c.heavy = memory_budget is not None and c.peak_bytes > memory_budget * HEAVY_SHARE
+
+    def by_index(self):
+        return {c.index: c for c in self.costs}
+
+    @property
+    def total_points(self):
+        return sum(c.points for c in self.costs)
+
+    @property
+    def total_seconds(self):
+        """Estimated CPU time of the whole run."""
+        return sum(c.seconds for c in self.costs)
+
+    @property
+    def largest(self):
+        return max(self.costs, key=lambda c: c.peak_bytes, default=None)
+
+    def peak_bytes(self):
+        """Estimated peak memory of the run: the largest trajectories
+        running together, one per worker, plus the workers themselves."""
+        largest = sorted((c.peak_bytes for c in self.costs), reverse=True)[:self.max_processors]
+        data = sum(largest)
+        if self.memory_budget is not None and largest:
+            # admission keeps the data within the budget, or runs a larger
+            # trajectory alone
+            data = min(data, max(self.memory_budget, largest[0]))
+        return data + WORKER_BYTES * min(self.max_processors, len(self.costs))
+
+    def wall_seconds(self):
+        """Estimated duration with max_processors workers: the total spread
+        over the workers, but at least the longest trajectory."""
+        longest = max((c.seconds for c in self.costs), default=0.0)
+        return max(longest, self.total_seconds / max(1, self.max_processors))
+
+    def heavy(self):
+        return [c for c in self.costs if c.heavy]
+
+    def summary(self):
+        lines = ['Preflight: %d trajectories, %d points, estimated %.1fs CPU, %.1fs with %d workers, '
+                 'peak %.1fMB with the workers' % (
+            len(self.costs), self.total_points, self.total_seconds, self.wall_seconds(), self.max_processors,
+            self.peak_bytes() / 2 ** 20)]
+        largest = self.largest
+        if largest is not None:
+            lines.append('  largest: %s' % largest)
+        heavy = self.heavy()
+        if heavy:
+            lines.append('  %d heavy trajectories run alone (budget %.1fMB): %s' % (
+                len(heavy), self.memory_budget / 2 ** 20, ', '.join(str(c.tag) for c in heavy)))
+        return '\n'.join(lines)
+
+    def report(self):
+        print(self.summary())
+
+    def save(self, path):
+        """Writes one row per unit to the csv file path."""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['index', 'tag', 'points', 'density', 'seconds', 'peak_bytes', 'heavy'])
+            for c in self.costs:
+                writer.writerow([c.index, c.tag, c.points, round(c.density, 3), round(c.seconds, 3),
+                                 c.peak_bytes, int(c.heavy)])
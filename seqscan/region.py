@@ -128,9 +128,10 @@ class Region(object):
         """Adds a new Point to this Region.
         
         Args:
-            point (Point) : a MigrO.seqscan.Point object
+            point (Point) : a MigrO.seqscan.Point object; a weighted point
+                adds its whole time span, up to its end_time
         """
-        self.time.add_simple_range(SimpleRange(point.id, point.time))
+        self.time.add_simple_range(SimpleRange(point.id, point.time, point.id, point.end_time))
         
         # persistence update
         self.persistent |= self.time.presence() >= Region.threshold
@@ -252,11 +253,13 @@ class Region(object):
 
         total_lat = 0
         total_lon = 0
-        count = len(self.points)
+        count = 0
 
+        # weighted points count for the points they stand for
         for point in self.points:
-            total_lat += point.geometry.lat
-            total_lon += point.geometry.lon
+            total_lat += point.geometry.lat * point.weight
+            total_lon += point.geometry.lon * point.weight
+            count += point.weight
 
         average_lat = total_lat / count
         average_lon = total_lon / count
@@ -297,7 +300,7 @@ class NodeRegion(Region):
             point (Point) : a MigrO.seqscan.Point object
         """
 
-        self.time.add_simple_range(SimpleRange(point.id, point.time))
+        self.time.add_simple_range(SimpleRange(point.id, point.time, point.id, point.end_time))
 
         # persistence update
         self.persistent |= self.time.presence() >= Region.threshold
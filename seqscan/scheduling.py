@@ -0,0 +1,137 @@
+"""Size-aware batching of bulk work, memory admission and per-worker utilization reports."""
+
+# Standard modules
+import os
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from .preflight import HEAVY_SHARE
+
+
+def lpt_batches(units, cost, n_workers, tasks_per_worker=4):
+    """Groups units into tasks, longest-processing-time first.
+
+    Units are sorted by decreasing cost. A unit costing more than the target
+    task cost (total cost / (n_workers * tasks_per_worker)) is a task of its
+    own; smaller units are packed together until a task reaches the target,
+    so that thousands of tiny trajectories do not pay one task each. The
+    tasks come out in decreasing cost order: submitted in that order, the
+    largest ones start first and the small ones fill the gaps at the end.
+
+    Args:
+        units (list): the work units, e.g. (index, tag, start, stop)
+        cost (callable): estimated cost of a unit, e.g. its number of points
+        n_workers (int): number of worker processes
+        tasks_per_worker (int): tasks to aim for per worker
+
+    Returns:
+        list of lists of units
+    """
+    costs = [max(1, cost(u)) for u in units]
+    order = sorted(range(len(units)), key=lambda i: -costs[i])
+    target = sum(costs) / max(1, n_workers * tasks_per_worker)
+
+    batches = []
+    batch, batch_cost = [], 0
+    for i in order:
+        batch.append(units[i])
+        batch_cost += costs[i]
+        if batch_cost >= target:
+            batches.append(batch)
+            batch, batch_cost = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def timed_task(function, task):
+    """Runs function(task) in a worker, returning (pid, busy seconds, result)."""
+    start = time.perf_counter()
+    result = function(task)
+    return os.getpid(), time.perf_counter() - start, result
+
+
+def admit(executor, function, tasks, memory, budget, n_workers):
+    """Runs function over tasks on executor, admitting a task only while the
+    estimated memory of the running tasks plus its own fits the budget.
+
+    At most n_workers tasks run at once, so that every admitted task is
+    actually running. A task needing more than HEAVY_SHARE of the budget runs
+    alone: once it is the next in line, nothing else is admitted until the
+    pool is empty, and nothing else while it runs. Lighter tasks that do not
+    fit yet wait, while smaller ones behind them may go first.
+
+    Args:
+        executor (Executor): the pool, with n_workers workers
+        function (callable): the task function, as for executor.map()
+        tasks (list): the tasks, in submission order
+        memory (list of int): estimated peak bytes of each task
+        budget (int): bytes the running tasks may use together
+        n_workers (int): number of workers of the pool
+
+    Yields:
+        the task results, in completion order
+    """
+    pending = deque(zip(tasks, memory))
+    running = {}
+    used = 0
+    alone = False
+    while pending or running:
+        waiting = []
+        while pending and len(running) < n_workers and not alone:
+            task, need = pending.popleft()
+            heavy = need > budget * HEAVY_SHARE
+            if heavy and running:
+                # waits for the pool to drain, keeping the others behind it
+                pending.appendleft((task, need))
+                break
+            if running and used + need > budget:
+                waiting.append((task, need))
+                continue
+            running[executor.submit(function, task)] = need
+            used += need
+            alone = heavy
+        pending.extendleft(reversed(waiting))
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            used -= running.pop(future)
+            yield future.result()
+        if not running:
+            alone = False
+
+
+class WorkerUsage():
+    """Busy time of each worker process of a pool, to report its utilization.
+
+    Args:
+        wall_start (float): time.perf_counter() when the pool started
+    """
+
+    def __init__(self, wall_start=None):
+        self.wall_start = time.perf_counter() if wall_start is None else wall_start
+        self.wall = None
+        self.workers = {}   # pid -> [tasks, units, busy seconds]
+
+    def record(self, pid, busy, units):
+        stats = self.workers.setdefault(pid, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += units
+        stats[2] += busy
+
+    def stop(self):
+        self.wall = time.perf_counter() - self.wall_start
+
+    def utilization(self):
+        """Returns {pid: busy / wall-clock time of the pool}."""
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.wall_start
+        return {pid: (busy / wall if wall > 0 else 0.0) for pid, (tasks, units, busy) in self.workers.items()}
+
+    def report(self):
+        """Prints one line per worker: tasks, units and utilization."""
+        utilization = self.utilization()
+        print('Worker utilization over %.2fs:' % (self.wall or 0.0))
+        for k, (pid, (tasks, units, busy)) in enumerate(sorted(self.workers.items())):
+            print('  worker %d (pid %d): %d tasks, %d trajectories, busy %.2fs (%.0f%%)' % (
+                k, pid, tasks, units, busy, 100 * utilization[pid]))
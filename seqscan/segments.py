@@ -0,0 +1,179 @@
+"""Splitting of one trajectory into segments that SEQSCAN can cluster independently.
+
+SEQSCAN is sequential: the state carried from a point to the next (active
+cluster, time frame, region logs, noise sets) depends on every previous
+point. It can however only reach earlier points through the spatial query
+around each new point, i.e. the square of half side distance + 1 centred on
+it. If no point before index k lies in the query square of any point from k
+on, the points from k on never see the earlier ones: the earlier state only
+survives as a far away active cluster and a time frame starting before every
+later point, and a fresh run started at k builds exactly the same regions.
+Timestamps must also strictly increase up to k, so that the time frames of
+the sequential run and of the fresh run never collapse to the same instant.
+
+Segments are clustered in separate processes and their clusters stitched
+back into one cluster set before the labelling, which therefore numbers the
+stops exactly as a sequential run.
+"""
+
+# Standard modules
+from datetime import timedelta
+
+import numpy
+
+# my modules
+from .region import Region
+
+
+# Relative slack added to the query square when looking for split points: a
+# pair on the edge of the square prevents a split rather than the opposite.
+SQUARE_SLACK = 1e-9
+
+
+def find_split_points(x, y, t, distance):
+    """Returns the indices k where SEQSCAN can safely restart from scratch.
+
+    Args:
+        x, y (array): projected coordinates of the points, in time order
+        t (array): timestamps of the points, in time order, as numbers
+        distance (float): the SEQSCAN distance
+
+    Returns:
+        numpy array of the indices k (0 < k < len(x)) such that no point
+        before k falls in the query square of a point from k on, and
+        timestamps strictly increase up to k.
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    size = len(x)
+    if size < 2:
+        return numpy.empty(0, dtype=numpy.int64)
+
+    # grid of cells at least as large as the query square: any point in the
+    # square of a point lies in one of the 3 x 3 cells around it
+    half_side = (distance + 1) * (1 + SQUARE_SLACK) + SQUARE_SLACK
+    cx = numpy.floor((x - x.min()) / half_side).astype(numpy.int64)
+    cy = numpy.floor((y - y.min()) / half_side).astype(numpy.int64)
+    stride = int(cy.max()) + 3
+    keys = (cx + 1) * stride + (cy + 1)
+
+    # first point of each cell
+    cells, first = numpy.unique(keys, return_index=True)
+
+    # earliest point seen in the cells around each point: it bounds from below
+    # the earliest point in its query square
+    earliest = numpy.arange(size)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            shifted = keys + dx * stride + dy
+            pos = numpy.minimum(numpy.searchsorted(cells, shifted), len(cells) - 1)
+            found = cells[pos] == shifted
+            candidate = numpy.where(found, first[pos], size)
+            earliest = numpy.minimum(earliest, numpy.where(candidate < numpy.arange(size), candidate, size))
+
+    # k is safe if no point from k on reaches before k
+    reach = numpy.minimum.accumulate(earliest[::-1])[::-1]
+    k = numpy.arange(size)
+    increasing = numpy.concatenate(([True], numpy.logical_and.accumulate(numpy.diff(t) > 0)))
+    safe = (reach >= k) & increasing
+    safe[0] = False
+    return numpy.flatnonzero(safe)
+
+
+def plan_segments(split_points, size, parts, min_size=1):
+    """Chooses among the split points to cut size points in about parts
+    segments of similar length.
+
+    Returns:
+        list of (start, stop) index ranges covering [0, size)
+    """
+    split_points = numpy.asarray(split_points)
+    bounds = [0]
+    for i in range(1, max(1, parts)):
+        target = size * i // parts
+        pos = numpy.searchsorted(split_points, target)
+        best = None
+        for j in (pos - 1, pos):
+            if 0 <= j < len(split_points):
+                k = int(split_points[j])
+                if best is None or abs(k - target) < abs(best - target):
+                    best = k
+        if best is not None and best - bounds[-1] >= min_size and size - best >= min_size:
+            bounds.append(best)
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+class SegmentRegion(Region):
+    """Final cluster of a segment, rebuilt in the process stitching the segments.
+
+    Unlike the Regions built while scanning, it is not registered in the
+    class-level logs: it only carries what the labelling and the export read.
+    """
+
+    def __init__(self, id, points, first_timestamp, last_timestamp):
+        self.id = id
+        self.next = self
+        self.hook = self
+        self.points = points
+        self.noise = 0
+        self.persistent = True
+        self._first = first_timestamp
+        self._last = last_timestamp
+
+    def first_timestamp(self):
+        return self._first
+
+    def last_timestamp(self):
+        return self._last
+
+
+def scan_segment(task):
+    """Runs the SEQSCAN loop on one segment, in a worker process.
+
+    Args:
+        task (tuple): (rows, distance, n_points, presence), rows being the
+            (lat, lon, time) of the points of the segment in time order
+
+    Returns:
+        the clusters found, as (sorted positions of their points in the
+        segment, first timestamp, last timestamp), in region id order
+    """
+    # imported here: the seqscan module imports this one
+    from .seqscan import SeqScan
+    from .data.trajectory import Trajectory
+
+    rows, distance, n_points, presence = task
+    seqscan = SeqScan(Trajectory(), None, None)
+    dataset = seqscan.scan_rows(rows, distance, n_points, presence)
+
+    position = {point: i for i, point in enumerate(dataset)}
+    clusters = []
+    for cluster in sorted(seqscan.clusters, key=lambda c: c.id):
+        clusters.append((sorted(position[p] for p in cluster.points),
+                         cluster.first_timestamp(), cluster.last_timestamp()))
+    seqscan.clearObjectMemory(dataset)
+    return clusters
+
+
+def stitch(dataset, segments, results):
+    """Rebuilds the clusters of the segments on the points of the whole dataset.
+
+    Region ids are renumbered so that they stay unique across segments.
+    """
+    clusters = set()
+    next_id = 0
+    for (start, stop), segment_clusters in zip(segments, results):
+        for positions, first, last in segment_clusters:
+            points = set(dataset[start + i] for i in positions)
+            clusters.add(SegmentRegion(next_id, points, first, last))
+            next_id += 1
+    return clusters
+
+
+def timestamps_as_numbers(dataset):
+    """Timestamps of the dataset points as seconds since the first one."""
+    if not dataset:
+        return numpy.empty(0)
+    origin = dataset[0].time
+    return numpy.array([(p.time - origin) / timedelta(seconds=1) for p in dataset])
@@ -23,6 +23,7 @@ from .data.point import Point as TrajectoryPoint
 
 # Standard modules
 import numpy
+import os
 import sys
 import math
 import time
@@ -31,6 +32,7 @@ import logging
 from datetime import datetime, timedelta
 from collections import defaultdict, OrderedDict
 import csv
+import pickle
 # my modules
 from .region import Region
 from .point import Point
@@ -40,12 +42,21 @@ from .rectangle import Rectangle
 
 from .data import Trajectory
 from .data import Point as TrajectoryPoint
+from .pipeline import write_rows
+from .segments import find_split_points, plan_segments, scan_segment, stitch, timestamps_as_numbers
+from .neighbors import spatial_candidates
+from .graph_store import dataset_fingerprint
+from .approx import approximate_result, CELL_FACTOR
+from .stationary import compress, expand_labels
+from .cache import CachedStop
+from concurrent.futures import ProcessPoolExecutor
 import json
 
 with open('./config.json') as f:
     config = json.load(f)
 TAG_COLUMN = config["CSV_columns"]["TAG_COLUMN"]
 CARTESIAN= config["is_cartesian"]
+TIME_UNIT = config["UNITS"]["TIME"]
 STOP_ID_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["STOP_LABEL"]
 START_TIME_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["START"]
 END_TIME_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["END"]
@@ -54,6 +65,12 @@ CENTROID_X_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["CARTESIAN_CENTROID_X"]
 CENTROID_Y_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["CARTESIAN_CENTROID_Y"]
 CENTROID_LAT_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["CENTROID_LAT"]
 CENTROID_LON_COLUMN = config["OUTPUT_STOPS_COLUMNS"]["CENTROID_LON"]
+if CARTESIAN:
+    SYMBOLIC_HEADER = [TAG_COLUMN, STOP_ID_COLUMN, START_TIME_COLUMN, END_TIME_COLUMN,
+                       CENTROID_X_COLUMN, CENTROID_Y_COLUMN]
+else:
+    SYMBOLIC_HEADER = [TAG_COLUMN, STOP_ID_COLUMN, START_TIME_COLUMN, END_TIME_COLUMN,
+                       CENTROID_LAT_COLUMN, CENTROID_LON_COLUMN]
 
 
 
@@ -66,6 +83,66 @@ NOISE='Noise'
 
 MOVE_LABEL = "MOVE"
 STOP_LABEL = "STOP"
+# columns of the classification output set from the label of a point
+LABEL_COLUMNS = ["cluster", "class", "type", "details"]
+
+# smallest segment worth a task of its own when a trajectory is split
+MIN_SEGMENT_SIZE = 1000
+# trajectories from this size on compute their spatial candidates in a thread
+PIPELINE_MIN_POINTS = 5000
+# number of points between two checks of the time budget
+BUDGET_CHECK_POINTS = 64
+# largest thinning of a degraded run: beyond it, stops are mostly lost
+MAX_THINNING = 8
+
+
+class TimeBudgetExceeded(Exception):
+    """Raised by SeqScan.run when a trajectory takes longer than its time budget.
+
+    Args:
+        done (int): number of points scanned within the budget
+        total (int): number of points of the trajectory
+    """
+
+    def __init__(self, done, total):
+        super().__init__('time budget exceeded after %d of %d points' % (done, total))
+        self.done = done
+        self.total = total
+
+    def thinning(self):
+        """Thinning factor for a degraded rerun expected to fit the budget.
+
+        The cost of a point grows with the neighbors it keeps, so the cost of
+        a trajectory is taken quadratic in its points: thinning by f divides
+        both the points and their neighbors by f, and the cost by f ** 2. The
+        rerun has to be 1.5 * total / done times cheaper than the full run,
+        hence f is the square root of that, at most MAX_THINNING.
+        """
+        return min(MAX_THINNING, max(2, math.ceil(math.sqrt(1.5 * self.total / max(1, self.done)))))
+
+
+def convert_time_to_s(delta, unit=TIME_UNIT):
+    """delta, in the time unit of the configuration, in seconds."""
+    if unit == "min":
+        return delta * 60
+    if unit == "d":
+        return delta * 3600 * 24
+    return delta
+
+
+def label_annotations(kind, cluster_counter):
+    """The cluster, class, type and details written to the classification
+    output for a (type, stop number) label (see SeqScan.point_labels())."""
+    if kind == "cluster":
+        return cluster_counter, "{}_{}".format(STOP_LABEL, cluster_counter), "cluster", \
+            "cluster # " + str(cluster_counter)
+    if kind == "excursion":
+        details = "of cluster " + str(cluster_counter)
+    elif kind == "transition":
+        details = "from cluster " + str(cluster_counter)
+    else:
+        details = "before/after clustering"
+    return -1, MOVE_LABEL, kind, details
 
 #logging.basicConfig(
 #    filename='execution_time.log',
@@ -76,8 +153,13 @@ STOP_LABEL = "STOP"
 class SeqScan():
     """Implementation of the SEQSCAN algorithm."""
     
-    def __init__(self, trajectory:Trajectory, output_path, output_path_symbolic, silent=True, multi_mode=0):
+    def __init__(self, trajectory:Trajectory, output_path, output_path_symbolic, silent=True, multi_mode=0, writer=None,
+                 cache=None, graphs=None):
         self.trajectory = trajectory
+        self.writer = writer            # AsyncWriter, None to write synchronously
+        self.cache = cache              # ResultCache, None to always cluster
+        self.graphs = graphs            # GraphStore, None to always search the neighborhoods
+        self.deadline = None            # time.perf_counter() limit of the scan, see run()
         self.silent = silent
         self.output_path=output_path
         self.output_path_symbolic=output_path_symbolic
@@ -157,127 +239,309 @@ class SeqScan():
         return None
 
     
-    def run(self, distance, n_points, presence):
+    def init_regions(self, presence):
+        """(Re)sets the class-level state of Region for a new scan."""
+        Region.threshold = timedelta(seconds=presence)
+        Region.counter = 0
+        Region.expansion_log   = set()
+        Region.expansion_noise = set()
+        Region.look_up_log   = set()
+        Region.look_up_noise = set()
+        Region.phase = Region.EXPANSION
+        Region.log = []
+
+    def run(self, distance, n_points, presence, max_processors=1, time_budget=None, thinning=1,
+            stationary_tolerance=None, min_interval=None, min_displacement=None):
         """Excecutes the SEQSCAN clustering algorithm on a single object.
+
+        With max_processors > 1 the trajectory is cut at the points where
+        clustering cannot carry over (see segments.py), the segments are
+        clustered in parallel and their clusters stitched back: labels and
+        stops are the same as with a sequential run.
+
+        With a ResultCache, a trajectory already clustered with the same
+        parameters is not clustered again: its stored labels and stops are
+        written instead.
+
+        With a time_budget (seconds), the sequential scan gives up by raising
+        TimeBudgetExceeded once the budget is spent. thinning > 1 runs a
+        cheaper, degraded SEQSCAN on one point out of thinning, with n_points
+        scaled down alike but kept at 2 or more; every point then takes the
+        label of the last kept point at or before it.
+
+        With a GraphStore, the neighbor graph of the trajectory is read from
+        it (or computed and stored) instead of searching the neighborhoods.
+
+        With a stationary_tolerance (in units of distance), the runs of
+        consecutive points within that distance of each other are collapsed
+        into weighted points before clustering (see stationary.py) and every
+        point takes the label of its weighted point. Such runs are clustered
+        sequentially and not cached.
+
+        With a min_interval (seconds) or a min_displacement (in units of
+        distance), the bursts of the trajectory are thinned first (see
+        Trajectory.thin()) and every point takes the label of the last kept
+        point at or before it; n_points then counts the kept points. Thinned
+        runs are not cached.
         """
         run_start_time = time.time()
-        self.dataset = self.load_datapoints(self.trajectory, self.is_cartesian)
-        progressInd = 0
+        self.deadline = time.perf_counter() + time_budget if time_budget is not None else None
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(self.trajectory, distance, n_points, presence, CARTESIAN)
+            cached = self.cache.get(cache_key, len(self.trajectory))
+            if cached is not None:
+                return self.exportCachedResult(*cached)
+            if thinning > 1 or stationary_tolerance is not None or min_interval or min_displacement:
+                cache_key = None    # degraded results are not cached
+
+        mapping = None
+        trajectory = self.trajectory
+        if min_interval or min_displacement:
+            trajectory, mapping = self.trajectory.thin(min_interval or None, min_displacement or None)
+            if not self.silent:
+                print(self.trajectory.tag_id, ': ', len(self.trajectory), ' points thinned to ', len(trajectory))
+        self.dataset = self.load_datapoints(trajectory, self.is_cartesian)
         self.featuresCount = len(self.dataset)
+        weights = None
+        if stationary_tolerance is not None:
+            self.dataset, weights = compress(self.dataset, stationary_tolerance, self.is_cartesian)
+            max_processors = 1      # segments are clustered without weights
+            if not self.silent:
+                print(self.trajectory.tag_id, ': ', self.featuresCount, ' points compressed to ', len(self.dataset))
+        full_dataset = self.dataset
+        if thinning > 1:
+            self.dataset = full_dataset[::thinning]
+            # a single neighbor, the point itself, would make every point dense
+            n_points = max(min(2, n_points), math.ceil(n_points / thinning))
+            # time ranges are runs of consecutive ids
+            for k, point in enumerate(self.dataset):
+                point.id = full_dataset[0].id + k
         try:
- 
+
             self.clusters = set()
 
-            # Region init
-            Region.threshold = timedelta(seconds=presence)
+            segments = self.split(distance, max_processors) if max_processors > 1 else []
+            if len(segments) > 1:
+                self.scan_segments(segments, distance, n_points, presence, max_processors)
+            else:
+                candidates = self.stored_candidates(distance) if thinning == 1 else None
+                self.scan(self.dataset, distance, n_points, presence, candidates=candidates)
 
-            # init
-            time_start = datetime.min
-            time_end   = datetime.min
+            run_end_time = time.time()
+            execution_time = run_end_time - run_start_time
+            #logging.info(f",{self.trajectory.tag_id},{len(self.trajectory)},{execution_time:.6f}")
+            #print(f"{self.trajectory.tag_id}: Function executed in {execution_time:.6f} seconds")
+            self._analyze(self.dataset)
 
-            active_cluster = None
+            labels = self.point_labels()
+            if thinning > 1:
+                labels = [labels[i // thinning] for i in range(len(full_dataset))]
+                self.dataset = full_dataset
+            symbolic = self.symbolic_rows()
+            if cache_key is not None:
+                self.cache.put(cache_key, labels, [row[2:4] + [tuple(row[4:6])] for row in symbolic[1]])
+            if weights is not None:
+                labels = expand_labels(labels, weights)
+            if mapping is not None:
+                labels = [labels[k] for k in mapping.tolist()]
+            if weights is not None or mapping is not None:
+                # one row per point of the input trajectory
+                points = sorted(self.trajectory, key=lambda p: p.timestamp)
+                return self.exportOutputFiles(labels, symbolic, ((p.lat, p.lon, p.timestamp) for p in points))
+            return self.exportOutputFiles(labels, symbolic)
 
-            # Region init
-            Region.counter = 0
-            Region.expansion_log   = set()
-            Region.expansion_noise = set()
-            Region.look_up_log   = set()
-            Region.look_up_noise = set()
-            Region.phase = Region.EXPANSION
-            Region.log = []
+        except MemoryError as error:
+            print("Out of memory while processing\n{}\n".format(error))
+            self.clearObjectMemory(self.dataset)
 
-            for point in self.dataset:
+        except TimeBudgetExceeded:
+            self.clearObjectMemory(full_dataset)
+            raise
 
-                square = Rectangle(point.geometry, point.geometry)
-                square = square.buffer(distance + 1)
+    def scan(self, dataset, distance, n_points, presence, pipeline=None, candidates=None):
+        """The SEQSCAN loop: adds the clusters found in dataset to self.clusters.
 
-                inner_square = Rectangle(point.geometry, point.geometry)
-                inner_square = inner_square.buffer(distance * 0.7)
+        With pipeline (by default for datasets of PIPELINE_MIN_POINTS points
+        or more, on multi-core machines) the spatial candidates of the upcoming points are computed by
+        a background thread (see neighbors.py) and the loop only keeps the
+        reachable ones, instead of scanning the noise set and querying the
+        regions of the time frame for each point.
 
-                if active_cluster is None:
-                    regions = Region.look_up_log
-                    noise   = Region.look_up_noise
-                else:
-                    regions = Region.expansion_log
-                    noise   = Region.expansion_noise
-
-                candidate_points = set(q for q
-                    in noise
-                    if square.contains_point(q.geometry)
-                )
-
-                for r in regions:
-                    if r.in_time_frame(time_start, time_end):
-                        r.query(square, candidate_points)
-
-
-                neighborhood = [q for q
-                    in candidate_points
-                    if (inner_square.contains_point(q.geometry) or 
-                        self.distance(point.geometry.array_rep[0], point.geometry.array_rep[1], q.geometry.array_rep[0], q.geometry.array_rep[1]) <= distance
-                    )
-                ]
-                neighborhood.insert(len(neighborhood), point)
-                
-                if active_cluster is not None and self.expand(
-                    active_cluster,
-                    point,
-                    neighborhood,
-                    n_points,
-                    time_start,
-                    point.time
-                ):
-                    time_end = point.time
+        candidates, when given, yields the spatial candidates of each point
+        already computed, e.g. by NeighborGraph.rows() for distance.
+        """
+        progressInd = 0
+        if candidates is not None:
+            spatial = iter(candidates)
+        else:
+            if pipeline is None:
+                pipeline = len(dataset) >= PIPELINE_MIN_POINTS and (os.cpu_count() or 1) > 1
+            spatial = spatial_candidates(dataset, distance) if pipeline else None
+        points_array = None
+        if spatial is not None:
+            points_array = numpy.empty(len(dataset), dtype=object)
+            points_array[:] = dataset
 
-                    Region.look_up_log = set()
-                    Region.look_up_noise = set()
+        # Region init
+        self.init_regions(presence)
 
-                    active_cluster =active_cluster.walk()
+        # init
+        time_start = datetime.min
+        time_end   = datetime.min
 
-                else:
-                    # filters the neighbors
-                    neigh = [n for n
-                        in neighborhood
-                        if time_end < n.time <= point.time
-                    ]
-
-                    next_cluster = self.find_cluster(
-                        point,
-                        neigh,
-                        n_points,
-                        time_end,
-                        point.time,
-                        active_cluster
-                    )
-                    if next_cluster is not None:
-                        if active_cluster is not None:
-                            self.add_cluster(active_cluster)
-                        time_start = time_end
-                        time_end = point.time
-                        active_cluster = next_cluster.walk()
-
-                        Region.expansion_log = Region.look_up_log
-                        Region.look_up_log = set()
-
-                        Region.expansion_noise = Region.look_up_noise
-                        Region.look_up_noise = set()
-                
-                progressInd +=1
-                self.update_progress((progressInd/self.featuresCount)*100)
+        active_cluster = None
 
-            run_end_time = time.time()
-            execution_time = run_end_time - run_start_time
-            #logging.info(f",{self.trajectory.tag_id},{len(self.trajectory)},{execution_time:.6f}")
-            #print(f"{self.trajectory.tag_id}: Function executed in {execution_time:.6f} seconds")
-            # unfinished business
+        for point in dataset:
+            indices = next(spatial) if spatial is not None else None
+            time_start, time_end, active_cluster, found = self.scan_point(
+                point, distance, n_points, time_start, time_end, active_cluster, points_array, indices
+            )
+
+            progressInd +=1
+            self.update_progress((progressInd/len(dataset))*100)
+            if (self.deadline is not None and progressInd % BUDGET_CHECK_POINTS == 0
+                    and time.perf_counter() > self.deadline):
+                raise TimeBudgetExceeded(progressInd, len(dataset))
+
+        # unfinished business
+        self.add_cluster(active_cluster)
+
+    def scan_point(self, point, distance, n_points, time_start, time_end, active_cluster, points_array=None,
+                   indices=None):
+        """One iteration of the SEQSCAN loop, on the next point in time order.
+
+        The candidate neighbors are the noise points and the points of the
+        regions of the time frame in the query square; with points_array,
+        indices are the positions of the earlier points in the square (see
+        reachable_candidates()). A cluster replaced by a new one is added to
+        self.clusters.
+
+        Returns:
+            the new (time_start, time_end, active_cluster), and True if a new
+            cluster became active
+        """
+        square = Rectangle(point.geometry, point.geometry)
+        square = square.buffer(distance + 1)
+
+        inner_square = Rectangle(point.geometry, point.geometry)
+        inner_square = inner_square.buffer(distance * 0.7)
+
+        if active_cluster is None:
+            regions = Region.look_up_log
+            noise   = Region.look_up_noise
+        else:
+            regions = Region.expansion_log
+            noise   = Region.expansion_noise
+
+        if points_array is None:
+            candidate_points = set(q for q
+                in noise
+                if square.contains_point(q.geometry)
+            )
+
+            for r in regions:
+                if r.in_time_frame(time_start, time_end):
+                    r.query(square, candidate_points)
+        else:
+            candidate_points = self.reachable_candidates(
+                points_array, indices, regions, noise, square, time_start, time_end
+            )
+
+
+        neighborhood = [q for q
+            in candidate_points
+            if (inner_square.contains_point(q.geometry) or 
+                self.distance(point.geometry.array_rep[0], point.geometry.array_rep[1], q.geometry.array_rep[0], q.geometry.array_rep[1]) <= distance
+            )
+        ]
+        neighborhood.insert(len(neighborhood), point)
+        
+        if active_cluster is not None and self.expand(
+            active_cluster,
+            point,
+            neighborhood,
+            n_points,
+            time_start,
+            point.time
+        ):
+            time_end = point.time
+
+            Region.look_up_log = set()
+            Region.look_up_noise = set()
+
+            return time_start, time_end, active_cluster.walk(), False
+
+        # filters the neighbors
+        neigh = [n for n
+            in neighborhood
+            if time_end < n.time <= point.time
+        ]
+
+        next_cluster = self.find_cluster(
+            point,
+            neigh,
+            n_points,
+            time_end,
+            point.time,
+            active_cluster
+        )
+        if next_cluster is None:
+            return time_start, time_end, active_cluster, False
+
+        if active_cluster is not None:
             self.add_cluster(active_cluster)
-            self._analyze(self.dataset)
 
-            return self.exportOutputFiles()
+        Region.expansion_log = Region.look_up_log
+        Region.look_up_log = set()
 
-        except MemoryError as error:
-            print("Out of memory while processing\n{}\n".format(error))
-            self.clearObjectMemory(self.dataset)
+        Region.expansion_noise = Region.look_up_noise
+        Region.look_up_noise = set()
+
+        return time_end, point.time, next_cluster.walk(), True
+
+    def reachable_candidates(self, dataset, indices, regions, noise, square, time_start, time_end):
+        """Returns the points among dataset[indices] (the earlier points in
+        square) that are noise or belong to a region of the time frame: the
+        points the noise scan and the region queries would have found.
+
+        Args:
+            dataset (numpy array of Point): the points, as an object array
+        """
+        frame = [r for r in regions if r.in_time_frame(time_start, time_end) and r.box.intersects(square)]
+        spatial = set(dataset[indices].tolist())
+        candidate_points = spatial & noise
+        for r in frame:
+            candidate_points |= spatial & r.points
+        return candidate_points
+
+    def stored_candidates(self, distance):
+        """The spatial candidates of the points of self.dataset, from the
+        GraphStore, or None without one."""
+        if self.graphs is None:
+            return None
+        key = dataset_fingerprint(self.dataset, CARTESIAN)
+        graph = self.graphs.graph(key, [p.geometry.x for p in self.dataset], [p.geometry.y for p in self.dataset],
+                                  distance)
+        return graph.rows()
+
+    def split(self, distance, parts):
+        """Returns the (start, stop) segments of self.dataset to cluster
+        independently, at most parts of them."""
+        x = [p.geometry.x for p in self.dataset]
+        y = [p.geometry.y for p in self.dataset]
+        split_points = find_split_points(x, y, timestamps_as_numbers(self.dataset), distance)
+        return plan_segments(split_points, len(self.dataset), parts, MIN_SEGMENT_SIZE)
+
+    def scan_segments(self, segments, distance, n_points, presence, max_processors):
+        """Clusters the segments in a process pool and stitches their clusters."""
+        tasks = [([(p.geometry.lat, p.geometry.lon, p.time) for p in self.dataset[start:stop]],
+                  distance, n_points, presence) for start, stop in segments]
+        with ProcessPoolExecutor(max_workers=min(max_processors, len(tasks))) as ex:
+            results = list(ex.map(scan_segment, tasks))
+
+        self.init_regions(presence)
+        self.clusters = stitch(self.dataset, segments, results)
 
     def clearObjectMemory(self, dataset):
         try:
@@ -341,89 +605,220 @@ class SeqScan():
             for point in cluster.points:
                 point.set_density_rank(densities_rank_dict[point.get_len_neighbors()])
 
-    def exportOutputFiles(self):
-        annotated_trajectory = Trajectory()
-
+    def point_labels(self):
+        """Returns the (type, stop number) of each point of the dataset, in
+        time order: type is "cluster", "excursion", "transition" or "noise";
+        the stop number is the one of the stop of the point, or of the last
+        stop before it."""
+        labels = []
         cluster_counter = 0
         current_cluster = -1
         for point in self.dataset:
-            p = TrajectoryPoint(point.geometry.lat, point.geometry.lon, point.time)
-            #if self.multi_mode==1 or self.multi_mode==2:
-            if self.trajectory.tag_id is not None:
-                p.annotations[TAG_COLUMN] = self.trajectory.tag_id
-
             if (point.cluster is None) and (point.next is not None) and (point.prev is not None):
                 if point.prev.id == point.next.id:
-                    p.annotations["cluster"] = -1
-                    p.annotations["class"] = MOVE_LABEL  # "EXCURSION"
-                    p.annotations["type"] = "excursion"
-                    p.annotations["details"] = "of cluster " + str(cluster_counter)
-
+                    labels.append(("excursion", cluster_counter))
                 else:
-                    p.annotations["cluster"] = -1
-                    p.annotations["class"] = MOVE_LABEL
-                    p.annotations["type"] = "transition"
-                    p.annotations["details"] = "from cluster " + str(cluster_counter)
+                    labels.append(("transition", cluster_counter))
 
             else:
                 if point.cluster is not None:
                     if point.cluster.id != current_cluster:
                         cluster_counter = cluster_counter + 1
                         current_cluster = point.cluster.id
-
-                    p.annotations["cluster"] = str(cluster_counter)
-                    p.annotations["class"] = "{}_{}".format(STOP_LABEL, cluster_counter)
-                    p.annotations["type"] = "cluster"
-                    p.annotations["details"] = "cluster # " + str(cluster_counter)
+                    labels.append(("cluster", cluster_counter))
 
                 else:
-                    p.annotations["cluster"] = -1
-                    p.annotations["class"] = MOVE_LABEL
-                    p.annotations["type"] = "noise"
-                    p.annotations["details"] = "before/after clustering"
+                    labels.append(("noise", cluster_counter))
+        return labels
+
+    def annotate(self, points, labels):
+        """Returns the annotated Trajectory of the (lat, lon, time) of the
+        points, in time order, and of their labels (see point_labels())."""
+        annotated_trajectory = Trajectory()
+
+        for (lat, lon, ts), (kind, cluster_counter) in zip(points, labels):
+            p = TrajectoryPoint(lat, lon, ts)
+            #if self.multi_mode==1 or self.multi_mode==2:
+            if self.trajectory.tag_id is not None:
+                p.annotations[TAG_COLUMN] = self.trajectory.tag_id
+
+            p.annotations.update(zip(LABEL_COLUMNS, label_annotations(kind, cluster_counter)))
 
             annotated_trajectory.add_point(p)
+        return annotated_trajectory
+
+    def exportOutputFiles(self, labels=None, symbolic=None, points=None):
+        """Writes the outputs; points are the (lat, lon, time) of the rows of
+        labels, by default those of self.dataset."""
+        if labels is None:
+            labels = self.point_labels()
+        if symbolic is None:
+            symbolic = self.symbolic_rows()
+        if points is None:
+            points = ((p.geometry.lat, p.geometry.lon, p.time) for p in self.dataset)
+        annotated_trajectory = self.annotate(points, labels)
 
         self.clearObjectMemory(self.dataset)
 
-        annotated_trajectory.export_to_csv(self.output_path, writing_mode=self.multi_mode)
+        annotated_trajectory.export_to_csv(self.output_path, writing_mode=self.multi_mode, writer=self.writer)
+        self.exportSymbolicTrajectory(self.output_path_symbolic, writing_mode=self.multi_mode, symbolic=symbolic)
+        return annotated_trajectory
+
+    def exportCachedResult(self, labels, stops):
+        """Writes the outputs of a result read from the cache, see run()."""
+        self.clusters = [CachedStop(first, last, centroid) for first, last, centroid in stops]
+        points = sorted(self.trajectory, key=lambda p: p.timestamp)
+        annotated_trajectory = self.annotate(((p.lat, p.lon, p.timestamp) for p in points), labels)
+
+        annotated_trajectory.export_to_csv(self.output_path, writing_mode=self.multi_mode, writer=self.writer)
         self.exportSymbolicTrajectory(self.output_path_symbolic, writing_mode=self.multi_mode)
         return annotated_trajectory
 
+    def scan_rows(self, rows, distance, n_points, presence, candidates=None):
+        """Clusters the points of rows, their (lat, lon, time) in time order,
+        without writing the outputs: self.dataset and self.clusters are then
+        labelled (see point_labels() and symbolic_rows()) until
+        clearObjectMemory(). candidates are as in scan(). Returns
+        self.dataset."""
+        self.dataset = [Point(FeaturePoint(lat, lon, self.is_cartesian), ts) for lat, lon, ts in rows]
+        self.clusters = set()
+        self.scan(self.dataset, distance, n_points, presence, candidates=candidates)
+        self._analyze(self.dataset)
+        return self.dataset
+
+    def result(self, distance, n_points, presence):
+        """Clusters the trajectory without writing the outputs. Returns the
+        labels (see point_labels()) and the (first, last, centroid) of the
+        stops, as stored by ResultCache."""
+        points = sorted(self.trajectory, key=lambda p: p.timestamp)
+        self.scan_rows(((p.lat, p.lon, p.timestamp) for p in points), distance, n_points, presence)
+        labels = self.point_labels()
+        stops = [tuple(row[2:4]) + (tuple(row[4:6]),) for row in self.symbolic_rows()[1]]
+        self.clearObjectMemory(self.dataset)
+        return labels, stops
+
+    def run_approximate(self, distance, n_points, presence, cell_factor=CELL_FACTOR):
+        """Approximate SEQSCAN on a grid of cells of side cell_factor *
+        distance (see approx.py): faster, with stops close to the exact ones.
+        The outputs have the same format as run()."""
+        points = sorted(self.trajectory, key=lambda p: p.timestamp)
+        labels, stops = approximate_result(points, distance, n_points, presence, self.is_cartesian, cell_factor)
+        return self.exportCachedResult(labels, stops)
+
+    def run_snapshot(self, distance, n_points, presence, snapshot_path):
+        """Clusters the trajectory incrementally and saves the state reached
+        at its end to snapshot_path, for resume() to carry on with points
+        appended later (see snapshot.py). The outputs are the same as run().
+        """
+        # imported here: these modules import this one
+        from .online import OnlineSeqScan
+        from .snapshot import Snapshot, row_offset
+
+        scan = OnlineSeqScan(distance, n_points, presence, tag_id=self.trajectory.tag_id)
+        points = sorted(self.trajectory, key=lambda p: p.timestamp)
+        events = scan.extend((p.lat, p.lon, p.timestamp) for p in points)
+        state = pickle.dumps(scan, protocol=pickle.HIGHEST_PROTOCOL)
+        final_points, final_stops = self._count_events(events)
+
+        annotated_trajectory = self.exportEvents(events + scan.close(), writing_mode=0)
+        offsets = [row_offset(self.output_path, 0, 1 + final_points),
+                   row_offset(self.output_path_symbolic, 0, 1 + final_stops)]
+        params = {"distance": distance, "n_points": n_points, "presence": presence, "cartesian": CARTESIAN}
+        Snapshot(state, params, len(points), final_points, final_stops, offsets).save(snapshot_path)
+        return annotated_trajectory
 
-    def exportSymbolicTrajectory(self, path, writing_mode=0):
+    def resume(self, snapshot_path):
+        """Carries on the run that saved snapshot_path, the trajectory holding
+        the points appended since, with the parameters of the snapshot.
 
-        if writing_mode==0 or writing_mode==1:
-            with open(path, "w", newline='') as f:
-                writer = csv.writer(f)
-                if CARTESIAN:
-                    writer.writerow([TAG_COLUMN,STOP_ID_COLUMN, START_TIME_COLUMN, END_TIME_COLUMN,
-                                     CENTROID_X_COLUMN, CENTROID_Y_COLUMN])  # Write header
-                else:
-                    writer.writerow([TAG_COLUMN, STOP_ID_COLUMN, START_TIME_COLUMN, END_TIME_COLUMN,
-                                     CENTROID_LAT_COLUMN, CENTROID_LON_COLUMN])  # Write header
-
-                i=1
-                clusters_list=sorted(self.clusters, key=lambda cluster: cluster.first_timestamp())
-                for cluster in clusters_list:
-                    c=cluster.compute_centroid()
-                    writer.writerow([self.trajectory.tag_id, "STOP_"+str(i),
-                                     cluster.first_timestamp(), cluster.last_timestamp(),
-                                     c[0], c[1]])
-                    i+=1
-
-        elif writing_mode==2:
-            with open(path, "a", newline='') as f:
-                writer = csv.writer(f)
-                i = 1
-                clusters_list = sorted(self.clusters, key=lambda cluster: cluster.first_timestamp())
-                for cluster in clusters_list:
-                    c = cluster.compute_centroid()
-                    writer.writerow(
-                        [self.trajectory.tag_id, "STOP_" + str(i),
+        The outputs of that run are cut after their last final row and
+        completed with the rows of the points whose label was not final and
+        of the new points; the snapshot is updated. Returns the annotated
+        trajectory of the rows written.
+
+        Raises:
+            ValueError if the snapshot is of another version or coordinate
+            system, if the outputs do not match it, or if a new point is
+            before the last point of the snapshot: the whole trajectory must
+            then be run again
+        """
+        from .snapshot import Snapshot, row_offset, cut_outputs
+
+        snapshot = Snapshot.load(snapshot_path)
+        if snapshot.params["cartesian"] != CARTESIAN:
+            raise ValueError("the snapshot %s was made with is_cartesian=%s" % (snapshot_path,
+                                                                               snapshot.params["cartesian"]))
+        scan = snapshot.scan()
+        points = sorted(self.trajectory, key=lambda p: p.timestamp)
+        if points and scan.last_time is not None and points[0].timestamp < scan.last_time:
+            raise ValueError("the new points start at %s, before the end of the snapshot %s" % (
+                points[0].timestamp, scan.last_time))
+
+        events = scan.extend((p.lat, p.lon, p.timestamp) for p in points)
+        state = pickle.dumps(scan, protocol=pickle.HIGHEST_PROTOCOL)
+        final_points, final_stops = self._count_events(events)
+
+        cut_outputs([self.output_path, self.output_path_symbolic], snapshot.offsets)
+        annotated_trajectory = self.exportEvents(events + scan.close(), writing_mode=2)
+        offsets = [row_offset(self.output_path, snapshot.offsets[0], final_points),
+                   row_offset(self.output_path_symbolic, snapshot.offsets[1], final_stops)]
+        Snapshot(state, snapshot.params, snapshot.points + len(points), snapshot.final_points + final_points,
+                 snapshot.final_stops + final_stops, offsets).save(snapshot_path)
+        return annotated_trajectory
+
+    @staticmethod
+    def _count_events(events):
+        """Numbers of labels and of stop ends among the events of an online scan."""
+        from .online import LABEL, STOP_END
+        return sum(e.kind == LABEL for e in events), sum(e.kind == STOP_END for e in events)
+
+    def exportEvents(self, events, writing_mode=0, writing_mode_symbolic=None):
+        """Writes the labels and stop ends of the events of an online scan
+        (see online.py) to the outputs, synchronously; the symbolic output
+        with writing_mode_symbolic, by default writing_mode. The
+        classification output is only written with labels. Returns the
+        annotated trajectory of the labels."""
+        from .online import LABEL, STOP_END
+
+        labels = [e for e in events if e.kind == LABEL]
+        stops = [e for e in events if e.kind == STOP_END]
+        self.clusters = [CachedStop(e.first, e.last, e.centroid) for e in stops]
+        annotated_trajectory = self.annotate((e.point for e in labels), ((e.label, e.stop) for e in labels))
+        if labels:
+            annotated_trajectory.export_to_csv(self.output_path, writing_mode=writing_mode)
+
+        if writing_mode_symbolic is None:
+            writing_mode_symbolic = writing_mode
+        header, _ = self.symbolic_rows()
+        rows = [[self.trajectory.tag_id, "STOP_" + str(e.stop), e.first, e.last, e.centroid[0], e.centroid[1]]
+                for e in stops]
+        write_rows(self.output_path_symbolic, writing_mode_symbolic, header, rows, newline='', lineterminator='\r\n')
+        return annotated_trajectory
+
+    def symbolic_rows(self):
+        """Returns the csv header and rows of the symbolic trajectory."""
+        header = list(SYMBOLIC_HEADER)
+
+        rows = []
+        i = 1
+        clusters_list = sorted(self.clusters, key=lambda cluster: cluster.first_timestamp())
+        for cluster in clusters_list:
+            c = cluster.compute_centroid()
+            rows.append([self.trajectory.tag_id, "STOP_" + str(i),
                          cluster.first_timestamp(), cluster.last_timestamp(),
                          c[0], c[1]])
-                    i += 1
+            i += 1
+        return header, rows
+
+    def exportSymbolicTrajectory(self, path, writing_mode=0, symbolic=None):
+        """Writes the symbolic trajectory; symbolic is the (header, rows) of
+        symbolic_rows(), computed when None."""
+        header, rows = symbolic if symbolic is not None else self.symbolic_rows()
+
+        if self.writer is None:
+            write_rows(path, writing_mode, header, rows, newline='', lineterminator='\r\n')
+        else:
+            self.writer.submit(path, writing_mode, header, rows, newline='', lineterminator='\r\n')
 
 
     def _haversine_distance(self, lat1, lon1, lat2, lon2):
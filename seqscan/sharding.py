@@ -0,0 +1,307 @@
+"""Multi-node runs: deterministic partition of a bulk run into N shards.
+
+Each node runs the same bulk command with its own shard i/N. Tags (input file
+mode) or input files (folder mode) are assigned to shards by a stable hash,
+so every node agrees on the partition without talking to the others. A shard
+writes self-contained outputs next to the requested ones plus a manifest
+describing them; merge_manifests() then rebuilds the files a single-node run
+writes, once every shard is done.
+"""
+
+# Standard modules
+import csv
+import glob
+import json
+import os
+import shutil
+import zlib
+
+from .shards import _merge
+
+
+MANIFEST_VERSION = 1
+
+
+class ShardSpec():
+    """The shard i of N of a bulk run.
+
+    Args:
+        index (int): the shard number, from 0 to count - 1
+        count (int): the number of shards
+    """
+
+    def __init__(self, index, count):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError("invalid shard %s/%s: expected 0 <= i < N" % (index, count))
+        self.index = index
+        self.count = count
+
+    def __repr__(self):
+        return '%d/%d' % (self.index, self.count)
+
+    @staticmethod
+    def parse(value):
+        """Returns the ShardSpec of value: "i/N", (i, N), a ShardSpec or None."""
+        if value is None or isinstance(value, ShardSpec):
+            return value
+        if isinstance(value, str):
+            parts = value.split('/')
+            if len(parts) != 2:
+                raise ValueError("invalid shard %r: expected i/N" % value)
+            value = parts
+        index, count = value
+        return ShardSpec(int(index), int(count))
+
+    @staticmethod
+    def key_hash(key):
+        """Stable hash of a tag or file name, the same on every node."""
+        return zlib.crc32(str(key).encode('utf-8'))
+
+    def owns(self, key):
+        """True if the tag or input file name key belongs to this shard."""
+        return ShardSpec.key_hash(key) % self.count == self.index
+
+    def output_path(self, path):
+        """Path of the shard's version of an output file:
+        out/seq.csv -> out/seq.shard1of4.csv"""
+        root, ext = os.path.splitext(path)
+        return '%s.shard%dof%d%s' % (root, self.index, self.count, ext)
+
+    def manifest_path(self, output_file=None, output_folder=None):
+        """Where the shard writes its manifest: next to the output file, or
+        inside the output folder."""
+        if output_file is not None:
+            return os.path.splitext(self.output_path(output_file))[0] + '.manifest.json'
+        return os.path.join(output_folder, 'shard%dof%d.manifest.json' % (self.index, self.count))
+
+
+class ShardManifest():
+    """Description of the outputs written by one shard.
+
+    Args:
+        kind (str): the runner, e.g. "seqscan" or "statistics"
+        shard (ShardSpec): the shard
+        mode (str): "file" (one output file per kind of output) or "folder"
+            (one output file per input file)
+        input_path (str): the input file or folder
+        params (dict): the run parameters, identical on every shard
+        targets (dict): file mode: {output name: path of the single-node
+            file}; folder mode: {"folder": output folder}
+        outputs (dict): file mode: {output name: path of the shard file}
+        units (list): one dict per trajectory (file mode) or input file
+            (folder mode) of the shard, with its "index" in the whole run, its
+            "tag" or "file", and the "lines" it wrote in each output (file
+            mode, when known) or the "files" it wrote (folder mode)
+    """
+
+    def __init__(self, kind, shard, mode, input_path, params, targets, outputs=None, units=None):
+        self.kind = kind
+        self.shard = shard
+        self.mode = mode
+        self.input_path = input_path
+        self.params = params
+        self.targets = targets
+        self.outputs = outputs if outputs is not None else {}
+        self.units = units if units is not None else []
+        self.path = None
+
+    def to_dict(self):
+        return {
+            "version": MANIFEST_VERSION,
+            "kind": self.kind,
+            "shard": [self.shard.index, self.shard.count],
+            "mode": self.mode,
+            "input": self.input_path,
+            "params": self.params,
+            "targets": self.targets,
+            "outputs": self.outputs,
+            "units": self.units,
+        }
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, default=str)
+        self.path = path
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError("%s: unsupported manifest version %s" % (path, data.get("version")))
+        manifest = ShardManifest(data["kind"], ShardSpec.parse(data["shard"]), data["mode"], data["input"],
+                                 data["params"], data["targets"], data["outputs"], data["units"])
+        manifest.path = path
+        return manifest
+
+    def resolve(self, path):
+        """Paths in the manifest are relative to its directory, so that the
+        outputs of a node can be copied elsewhere together with it."""
+        if os.path.isabs(path):
+            return path
+        return os.path.join(os.path.dirname(self.path) if self.path else '', path)
+
+
+def relative_to(path, manifest_path):
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(manifest_path)))
+
+
+def find_manifests(output_file=None, output_folder=None):
+    """Manifests of the shards of a run, found next to its output file or in
+    its output folder."""
+    if output_file is not None:
+        root, ext = os.path.splitext(output_file)
+        pattern = glob.escape(root) + '.shard*of*.manifest.json'
+    else:
+        pattern = os.path.join(glob.escape(output_folder), 'shard*of*.manifest.json')
+    return sorted(glob.glob(pattern))
+
+
+def merge_manifests(manifest_paths, output_file=None, output_folder=None, remove=False):
+    """Combines the outputs of all the shards of a run into the files a
+    single-node run writes.
+
+    Args:
+        manifest_paths (list of str): one manifest per shard, all shards of
+            the run
+        output_file (str, optional): file mode: the main output, instead of
+            the one the shards were asked for; the other outputs keep their
+            name relative to it (e.g. symbolic_<name>)
+        output_folder (str, optional): folder mode: where to gather the
+            per-file outputs, instead of the requested output folder
+        remove (bool): delete the shard files and manifests once merged
+
+    Returns:
+        dict {output name: merged path} in file mode, the output folder in
+        folder mode
+
+    Raises:
+        ValueError if the manifests do not describe all the shards of a
+        single run.
+    """
+    manifests = [ShardManifest.load(p) for p in manifest_paths]
+    if not manifests:
+        raise ValueError("no shard manifest to merge")
+
+    first = manifests[0]
+    for m in manifests[1:]:
+        for field in ('kind', 'mode', 'input_path', 'params', 'targets'):
+            if getattr(m, field) != getattr(first, field):
+                raise ValueError("%s and %s are not shards of the same run (%s differs)" % (
+                    first.path, m.path, field))
+        if m.shard.count != first.shard.count:
+            raise ValueError("%s and %s are not shards of the same run (shard count differs)" % (
+                first.path, m.path))
+    found = sorted(m.shard.index for m in manifests)
+    if found != list(range(first.shard.count)):
+        missing = sorted(set(range(first.shard.count)) - set(found))
+        raise ValueError("shards %s of %d are missing or duplicated" % (missing or found, first.shard.count))
+
+    if first.mode == 'file':
+        result = _merge_files(manifests, output_file)
+    else:
+        result = _merge_folders(manifests, output_folder)
+
+    if remove:
+        for m in manifests:
+            for name, path in m.outputs.items():
+                path = m.resolve(path)
+                if os.path.exists(path):
+                    os.remove(path)
+            os.remove(m.path)
+    return result
+
+
+def _merge_files(manifests, output_file):
+    first = manifests[0]
+    targets = dict(first.targets)
+    if output_file is not None:
+        main = next(iter(targets))
+        directory, base = os.path.split(targets[main])
+        renamed = {}
+        for name, path in targets.items():
+            # keep the names of secondary outputs relative to the main one
+            renamed[name] = os.path.join(os.path.dirname(output_file),
+                                         os.path.basename(path).replace(base, os.path.basename(output_file)))
+        targets = renamed
+
+    for name, target in targets.items():
+        directory = os.path.dirname(target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with_lines = all(all(name in u.get("lines", {}) for u in m.units) for m in manifests)
+        sources = []
+        for m in manifests:
+            if name not in m.outputs or not m.units:
+                continue
+            path = m.resolve(m.outputs[name])
+            if not os.path.exists(path):
+                raise ValueError("%s: missing output %s" % (m.path, path))
+            units = sorted(m.units, key=lambda u: u["index"])
+            sources.append((path, units))
+        if not sources:
+            continue
+
+        if with_lines:
+            _merge([(path, [(u["index"], u["lines"][name]) for u in units]) for path, units in sources], target)
+        else:
+            _merge_by_tag(sources, target)
+    return targets
+
+
+def _merge_by_tag(sources, output_path):
+    """Merges csv files whose rows start with the tag, one row per unit, in
+    any order inside each file (e.g. appended by parallel workers)."""
+    header = None
+    rows = []
+    for path, units in sources:
+        order = {}
+        for u in units:
+            order.setdefault(str(u["tag"]), []).append(u["index"])
+        with open(path, 'rb') as f:
+            file_header = f.readline()
+            if header is None:
+                header = file_header
+            for line in f:
+                if not line.strip():
+                    continue
+                tag = next(csv.reader([line.decode('utf-8')]))[0]
+                indices = order.get(tag)
+                index = indices.pop(0) if indices else float('inf')
+                rows.append((index, len(rows), line))
+    if header is None:
+        return
+    rows.sort()
+    with open(output_path, 'wb') as out:
+        out.write(header)
+        for index, k, line in rows:
+            out.write(line)
+
+
+def _merge_folders(manifests, output_folder):
+    target = output_folder if output_folder is not None else manifests[0].targets["folder"]
+    os.makedirs(target, exist_ok=True)
+    for m in manifests:
+        for u in m.units:
+            for relative in u.get("files", []):
+                source = m.resolve(relative)
+                destination = os.path.join(target, relative)
+                if os.path.abspath(source) != os.path.abspath(destination):
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    shutil.copyfile(source, destination)
+    return target
+
+
+def write_manifest(path, kind, shard, mode, input_path, params, targets, outputs, units):
+    """Saves the manifest of a shard at path, with the output paths made
+    relative to it. Returns the ShardManifest."""
+    outputs = {name: relative_to(p, path) for name, p in outputs.items() if os.path.exists(p)}
+    for u in units:
+        if "files" in u:
+            u["files"] = [relative_to(p, path) for p in u["files"]]
+    manifest = ShardManifest(kind, shard, mode, input_path, params, targets, outputs, units)
+    manifest.save(path)
+    return manifest
@@ -0,0 +1,147 @@
+"""Per-worker output shards and their ordered merge."""
+
+# Standard modules
+import os
+import heapq
+import json
+
+
+class Shard():
+    """Output files written by one worker task.
+
+    Each unit (trajectory) written to the shard is recorded by its RunSummary,
+    holding its index in the whole run and the number of classification and
+    symbolic rows it produced, so that shards can later be merged back in unit
+    order.
+
+    Args:
+        path (str): the classification shard file
+        path_symbolic (str): the symbolic shard file
+        journal (str, optional): file where every unit is recorded once its
+            rows are on disk, for resumable runs (see seqscan/checkpoint.py)
+    """
+
+    def __init__(self, path, path_symbolic, journal=None):
+        self.path = path
+        self.path_symbolic = path_symbolic
+        self.journal = journal
+        self.units = []             # RunSummary of each unit, in writing order
+        self.cancelled = []         # indices of the units over their time budget, not written
+        self.has_header = False     # True once a unit wrote the csv headers
+
+    def add_unit(self, summary):
+        self.units.append(summary)
+
+    def checkpoint(self, summary):
+        """Appends summary to the journal, with the sizes of the shard files
+        once its rows are written: a shard cut short can then be truncated
+        back to its last complete unit."""
+        append_journal(self.journal, journal_entry(
+            summary, sizes=[os.path.getsize(self.path), os.path.getsize(self.path_symbolic)]))
+
+    def next_writing_mode(self):
+        """writing_mode for the next unit: header only for the first one."""
+        return 2 if self.has_header else 1
+
+    def remove(self):
+        for path in (self.path, self.path_symbolic):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def journal_entry(summary, **fields):
+    """Journal entry of a unit: its RunSummary numbers and the given fields."""
+    return dict({"index": summary.index, "tag": summary.tag_id, "points": summary.points, "stops": summary.stops,
+                 "runtime": summary.runtime}, **fields)
+
+
+def append_journal(path, entry):
+    """Appends entry to the journal at path, as one json line flushed to disk."""
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry, default=_json_value) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(path):
+    """Returns the entries of a journal, ignoring a last line cut short."""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+    return entries
+
+
+def _json_value(value):
+    # numpy scalars (tags, counts) as their python value
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def shard_path(path, k):
+    """Returns the path of the k-th shard of the output file path."""
+    return "%s.shard%04d" % (path, k)
+
+
+def merge_shards(shards, output_path, output_path_symbolic, remove=True):
+    """Merges the shards into the final outputs, ordering units by index.
+
+    The result is the file that a sequential run over the units, in index
+    order, would have written.
+
+    Args:
+        shards (list of Shard): the shards to merge
+        output_path (str): the classification output
+        output_path_symbolic (str): the symbolic output
+        remove (bool): delete the shard files once merged
+    """
+    shards = [s for s in shards if s.has_header]
+    _merge([(s.path, [(u.index, u.points) for u in s.units]) for s in shards], output_path)
+    _merge([(s.path_symbolic, [(u.index, u.stops) for u in s.units]) for s in shards], output_path_symbolic)
+    for s in shards:
+        for u in s.units:
+            u.output_path = output_path
+        if remove:
+            s.remove()
+
+
+def _merge(sources, output_path):
+    """k-way merge of csv files made of a header and blocks of lines.
+
+    Args:
+        sources (list): (path, [(unit index, number of lines), ...]) for each
+            file, blocks listed in increasing unit index
+        output_path (str): the merged file, which may be one of the sources:
+            it is written aside and replaced at the end
+    """
+    files = [open(path, 'rb') for path, blocks in sources]
+    tmp = '%s.%d.tmp' % (output_path, os.getpid())
+    try:
+        with open(tmp, 'wb') as out:
+            heap = []
+            for k, f in enumerate(files):
+                header = f.readline()
+                if k == 0:
+                    out.write(header)
+                blocks = iter(sources[k][1])
+                block = next(blocks, None)
+                if block is not None:
+                    heap.append((block[0], k, block[1], blocks))
+            heapq.heapify(heap)
+
+            while heap:
+                index, k, lines, blocks = heapq.heappop(heap)
+                f = files[k]
+                for _ in range(lines):
+                    out.write(f.readline())
+                block = next(blocks, None)
+                if block is not None:
+                    heapq.heappush(heap, (block[0], k, block[1], blocks))
+    finally:
+        for f in files:
+            f.close()
+    os.replace(tmp, output_path)
@@ -0,0 +1,115 @@
+"""Snapshots of the SEQSCAN state at the end of a trajectory.
+
+SeqScan.run_snapshot() clusters a trajectory incrementally (see online.py)
+and saves, next to its outputs, the state reached after its last point: the
+points whose label is not final yet (those after the last stop that ended),
+the regions and noise of the active time context and the counters. When
+points are appended to the trajectory later, SeqScan.resume() loads the
+snapshot and only processes the new points: the outputs are cut after their
+last final row and completed, and are the same as a run on the whole
+trajectory.
+
+Snapshots are versioned: a snapshot of another version, or of another
+coordinate system, is refused and the trajectory must be run again.
+"""
+
+# Standard modules
+import os
+import pickle
+
+
+# bump when the snapshot format or the state it holds change
+SNAPSHOT_VERSION = 2
+
+
+class Snapshot():
+    """State of an incremental SEQSCAN at the end of a trajectory.
+
+    Args:
+        state (bytes): the pickled OnlineSeqScan, before close()
+        params (dict): distance, n_points, presence (seconds) and cartesian
+        points (int): number of points processed
+        final_points (int): number of points whose label is final, i.e. of
+            classification rows that appended points cannot change
+        final_stops (int): number of stops that ended, i.e. of final
+            symbolic rows
+        offsets (list of int): size of the classification and symbolic
+            outputs up to their final rows (header included)
+    """
+
+    def __init__(self, state, params, points, final_points, final_stops, offsets):
+        self.state = state
+        self.params = params
+        self.points = points
+        self.final_points = final_points
+        self.final_stops = final_stops
+        self.offsets = offsets
+
+    def scan(self):
+        """The OnlineSeqScan to carry on with."""
+        return pickle.loads(self.state)
+
+    def save(self, path):
+        """Writes the snapshot atomically."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump({
+                "version": SNAPSHOT_VERSION,
+                "state": self.state,
+                "params": self.params,
+                "points": self.points,
+                "final_points": self.final_points,
+                "final_stops": self.final_stops,
+                "offsets": self.offsets,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        """Reads a snapshot.
+
+        Raises:
+            ValueError if the snapshot is of another version
+        """
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("unsupported snapshot version %s in %s" % (
+                data.get("version") if isinstance(data, dict) else None, path))
+        return Snapshot(data["state"], data["params"], data["points"], data["final_points"], data["final_stops"],
+                        data["offsets"])
+
+    def __repr__(self):
+        return 'Snapshot(points=%d, final_points=%d, final_stops=%d, params=%s)' % (
+            self.points, self.final_points, self.final_stops, self.params)
+
+
+def row_offset(path, offset, rows):
+    """Offset in path of the end of the rows lines starting at offset."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for _ in range(rows):
+            line = f.readline()
+            if not line:
+                raise ValueError("%s has less rows than expected" % path)
+            offset += len(line)
+    return offset
+
+
+def cut_outputs(paths, offsets):
+    """Truncates each output file to its offset, before appending the rows
+    that follow.
+
+    Raises:
+        ValueError if an output is missing or shorter than its offset: the
+        outputs are not the ones of the snapshot
+    """
+    for path, offset in zip(paths, offsets):
+        if not os.path.exists(path) or os.path.getsize(path) < offset:
+            raise ValueError("%s does not hold the rows of the snapshot" % path)
+    for path, offset in zip(paths, offsets):
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
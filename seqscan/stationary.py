@@ -0,0 +1,83 @@
+"""Run-length compression of stationary positions.
+
+High-frequency sensors record long runs of identical or near-identical
+positions while the object stands still, and SEQSCAN keeps each of them as a
+Point with its own neighbor set. compress() collapses every run of
+consecutive points within tolerance of the first point of the run into one
+weighted Point: at the mean position of the run, timestamped by its first
+point, covering the time span of the run up to its last point and standing
+for its number of points.
+
+SEQSCAN honours the weights: a point is dense when the weights of its
+neighbors reach n_points (see Point.is_dense()), and a weighted point adds
+the whole span of its run to the presence of its regions (see
+Region.expand()), as the run of points it stands for would. expand_labels()
+gives each original point the label of its weighted point.
+
+With a tolerance far below the SEQSCAN distance, the points of a run are all
+neighbors of each other and the stops are the ones of the full trajectory,
+their ends at most moved to the ends of a run.
+"""
+
+# Standard modules
+import numpy
+
+# my modules
+from .point import Point
+from .feature_point import FeaturePoint
+
+
+def stationary_runs(x, y, tolerance):
+    """Index of the first point of each run of points within tolerance of
+    the first point of the run.
+
+    Args:
+        x, y (list): projected coordinates of the points, in time order
+        tolerance (float): max distance to the first point of the run
+    """
+    if not x:
+        return []
+    starts = [0]
+    ax, ay = x[0], y[0]
+    limit = tolerance * tolerance
+    for i in range(1, len(x)):
+        dx = x[i] - ax
+        dy = y[i] - ay
+        if dx * dx + dy * dy > limit:
+            starts.append(i)
+            ax, ay = x[i], y[i]
+    return starts
+
+
+def compress(dataset, tolerance, cartesian):
+    """Collapses the stationary runs of dataset (SEQSCAN Points, in time
+    order) into weighted Points.
+
+    Returns:
+        the weighted Points, in time order, and the number of points of
+        dataset each of them stands for (numpy array)
+    """
+    x = [p.geometry.x for p in dataset]
+    y = [p.geometry.y for p in dataset]
+    starts = stationary_runs(x, y, tolerance)
+    bounds = list(zip(starts, starts[1:] + [len(dataset)]))
+    lat = numpy.array([p.geometry.lat for p in dataset], dtype=numpy.float64)
+    lon = numpy.array([p.geometry.lon for p in dataset], dtype=numpy.float64)
+
+    compressed = []
+    for start, stop in bounds:
+        if stop - start == 1:
+            point = dataset[start]
+            compressed.append(Point(point.geometry, point.time))
+        else:
+            geometry = FeaturePoint(float(lat[start:stop].mean()), float(lon[start:stop].mean()), cartesian)
+            compressed.append(Point(geometry, dataset[start].time, weight=stop - start,
+                                    end_time=dataset[stop - 1].time))
+    weights = numpy.diff(numpy.array(starts + [len(dataset)], dtype=numpy.int64))
+    return compressed, weights
+
+
+def expand_labels(labels, weights):
+    """The labels of the original points, from the labels of the weighted
+    points and their weights."""
+    return [labels[k] for k in numpy.repeat(numpy.arange(len(weights)), weights).tolist()]
@@ -0,0 +1,261 @@
+"""Routing of a stream of interleaved points of many tags to online SEQSCANs.
+
+A StreamRouter keeps one OnlineSeqScan per tag. Only the max_tags most
+recently used ones stay in memory: the least recently used are pickled to a
+spill directory (one file per tag) and loaded back when a point of their tag
+arrives, so that memory stays bounded whatever the number of tags.
+
+Records are (tag, lat, lon, timestamp) tuples, read from csv lines having the
+columns of the input files (see csv_records()): from a file followed as it
+grows (follow_file()) or from clients of a Unix socket (socket_records()).
+EventWriter writes the events to the classification and symbolic outputs.
+"""
+
+# Standard modules
+import csv
+import hashlib
+import os
+import pickle
+import socket
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# my modules
+from .online import OnlineSeqScan
+from .seqscan import SeqScan
+from .data.trajectory import Trajectory
+
+import json
+
+with open('./config.json') as f:
+    config = json.load(f)
+TAG_COLUMN = config["CSV_columns"]["TAG_COLUMN"]
+TIME_COLUMN = config["CSV_columns"]["TIME_COLUMN"]
+X_COLUMN = config["CSV_columns"]["X_COLUMN"]
+Y_COLUMN = config["CSV_columns"]["Y_COLUMN"]
+TIMESTAMP_FORMAT = config["TIMESTAMP_FORMAT"]
+
+
+# default number of tag states kept in memory
+DEFAULT_MAX_TAGS = 1000
+# seconds between two reads of a followed file that has no new line
+POLL_INTERVAL = 0.5
+
+SPILL_SUFFIX = '.state'
+
+
+class StreamRouter():
+    """Routes the points of many tags to their OnlineSeqScan.
+
+    Args:
+        distance, n_points, presence: the SEQSCAN parameters, presence in
+            seconds (see OnlineSeqScan)
+        spill_dir (str): where the states of idle tags are spilled; spill
+            files left by an earlier router are removed
+        max_tags (int): number of tag states kept in memory
+        max_context (float, optional): see OnlineSeqScan
+    """
+
+    def __init__(self, distance, n_points, presence, spill_dir, max_tags=DEFAULT_MAX_TAGS, max_context=None):
+        self.distance = distance
+        self.n_points = n_points
+        self.presence = presence
+        self.spill_dir = spill_dir
+        self.max_tags = max(1, max_tags)
+        self.max_context = max_context
+        self.states = OrderedDict()     # tag -> OnlineSeqScan, least recently used first
+        self.spills = 0
+        self.reloads = 0
+
+        os.makedirs(spill_dir, exist_ok=True)
+        for path in self.spilled():
+            os.remove(path)
+
+    def route(self, tag, lat, lon, timestamp):
+        """Pushes a point of tag; returns the events it triggers."""
+        return self.state(tag).push(lat, lon, timestamp)
+
+    def state(self, tag):
+        """The OnlineSeqScan of tag, from memory, from its spill file or new,
+        as the most recently used one."""
+        scan = self.states.get(tag)
+        if scan is not None:
+            self.states.move_to_end(tag)
+            return scan
+
+        path = self.spill_path(tag)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                scan = pickle.load(f)
+            os.remove(path)
+            self.reloads += 1
+        else:
+            scan = OnlineSeqScan(self.distance, self.n_points, self.presence, tag_id=tag,
+                                 max_context=self.max_context)
+        self.states[tag] = scan
+        while len(self.states) > self.max_tags:
+            self.spill(*self.states.popitem(last=False))
+        return scan
+
+    def spill(self, tag, scan):
+        """Writes the state of tag to its spill file."""
+        path = self.spill_path(tag)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(scan, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.spills += 1
+
+    def spill_path(self, tag):
+        return os.path.join(self.spill_dir, hashlib.sha1(repr(tag).encode('utf-8')).hexdigest() + SPILL_SUFFIX)
+
+    def spilled(self):
+        """Paths of the spill files."""
+        return [e.path for e in os.scandir(self.spill_dir) if e.name.endswith(SPILL_SUFFIX)]
+
+    def close(self):
+        """Ends the stream of every tag, in memory or spilled. Yields the last
+        events of each tag, one list per tag."""
+        while self.states:
+            tag, scan = self.states.popitem(last=False)
+            yield scan.close()
+        for path in self.spilled():
+            with open(path, 'rb') as f:
+                scan = pickle.load(f)
+            os.remove(path)
+            yield scan.close()
+
+    def run(self, records, on_events):
+        """Routes every (tag, lat, lon, timestamp) of records, then ends the
+        streams; on_events(events) receives each non-empty list of events."""
+        count = 0
+        for tag, lat, lon, timestamp in records:
+            try:
+                events = self.route(tag, lat, lon, timestamp)
+            except ValueError as error:
+                print('Skipping a point of ', tag, ': ', error)
+                continue
+            if events:
+                on_events(events)
+            count += 1
+        for events in self.close():
+            if events:
+                on_events(events)
+        return count
+
+
+def csv_records(lines, ts_format=TIMESTAMP_FORMAT):
+    """Yields the (tag, lat, lon, timestamp) of csv lines whose first line is
+    the header, with the columns of the input files. Malformed lines are
+    skipped."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    try:
+        tag, x, y, t = (header.index(c) for c in (TAG_COLUMN, X_COLUMN, Y_COLUMN, TIME_COLUMN))
+    except ValueError:
+        print('The stream header ', header, ' lacks one of the columns ', [TAG_COLUMN, X_COLUMN, Y_COLUMN, TIME_COLUMN])
+        return
+    for row in reader:
+        try:
+            yield row[tag], float(row[x]), float(row[y]), datetime.strptime(row[t], ts_format)
+        except (IndexError, ValueError) as error:
+            print('Skipping the malformed line ', row, ': ', error)
+
+
+def follow_file(path, from_start=True, poll_interval=POLL_INTERVAL, idle_timeout=None):
+    """Yields the complete lines of path as it grows, like tail -f.
+
+    Args:
+        from_start (bool): start with the lines already there; otherwise only
+            the header and the lines appended from now on
+        idle_timeout (float, optional): stop after that many seconds without
+            a new line; follow forever when None
+    """
+    with open(path, newline='') as f:
+        header = f.readline()
+        while not header.endswith('\n'):
+            # the header is still being written
+            time.sleep(poll_interval)
+            header += f.readline()
+        yield header
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        partial = ''
+        last = time.monotonic()
+        while True:
+            line = f.readline()
+            if line:
+                partial += line
+                if partial.endswith('\n'):
+                    yield partial
+                    partial = ''
+                    last = time.monotonic()
+                continue
+            if idle_timeout is not None and time.monotonic() - last > idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+
+def socket_records(path, connections=None, ts_format=TIMESTAMP_FORMAT):
+    """Listens on the Unix socket path and yields the records sent by its
+    clients, one connection after the other; each connection sends csv lines
+    starting with a header (see csv_records()).
+
+    Args:
+        connections (int, optional): stop after that many connections; serve
+            forever when None
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+        server.listen(1)
+        served = 0
+        while connections is None or served < connections:
+            connection, _ = server.accept()
+            with connection, connection.makefile('r', newline='') as lines:
+                yield from csv_records(lines, ts_format)
+            served += 1
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class EventWriter():
+    """Appends the events of online scans to the classification output (one
+    row per LABEL, as written by SeqScan) and to the symbolic output (one row
+    per STOP_END).
+
+    Args:
+        output_path (str): the classification output, overwritten
+        output_path_symbolic (str): the symbolic output, overwritten
+    """
+
+    def __init__(self, output_path, output_path_symbolic):
+        self.output_path = output_path
+        self.output_path_symbolic = output_path_symbolic
+        self.writing_mode = 0
+        self.writing_mode_symbolic = 0
+        self.labels = 0
+        self.stops = 0
+
+    def __call__(self, events):
+        self.write(events)
+
+    def write(self, events):
+        labels, stops = SeqScan._count_events(events)
+        if not labels and not stops:
+            return
+        # events come from a single tag
+        seqscan = SeqScan(Trajectory(tag_id=events[0].tag_id), self.output_path, self.output_path_symbolic)
+        seqscan.exportEvents(events, self.writing_mode, self.writing_mode_symbolic)
+        if labels:
+            self.writing_mode = 2
+        self.writing_mode_symbolic = 2
+        self.labels += labels
+        self.stops += stops
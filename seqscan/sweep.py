@@ -0,0 +1,105 @@
+"""Parameter sweeps of SEQSCAN over a single trajectory.
+
+Tuning SEQSCAN means clustering the same trajectory with many (distance,
+n_points, presence) settings. Most of the cost of a run, the spatial
+candidate search, only depends on the distance: sweep() computes the
+NeighborGraph of the largest distance once, restricts it to each smaller one
+(see neighbors.py) and runs every setting on it, in a process pool when
+max_processors > 1, each worker receiving the trajectory and the graph once.
+The result is a comparison table with one row per setting.
+"""
+
+# Standard modules
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# my modules
+from .neighbors import NeighborGraph
+from .seqscan import SeqScan
+from .data.trajectory import Trajectory
+
+
+SWEEP_COLUMNS = ["distance", "n_points", "presence", "stops", "clustered_points", "clustered_ratio",
+                 "total_duration", "mean_duration", "median_duration", "max_duration", "runtime"]
+
+
+# State of a pool worker (or of the process, without a pool), set by
+# _init_worker: the (lat, lon, time) of the points and their graphs, by
+# distance: the one of the largest distance and the last one restricted.
+_rows = None
+_graphs = None
+
+
+def _init_worker(rows, graph):
+    global _rows, _graphs
+    _rows = rows
+    _graphs = {graph.distance: graph} if graph is not None else None
+
+
+def _graph(distance):
+    graph = _graphs.get(distance)
+    if graph is None:
+        largest = _graphs[max(_graphs)]
+        graph = largest.restrict(distance)
+        _graphs.clear()
+        _graphs[largest.distance] = largest
+        _graphs[distance] = graph
+    return graph
+
+
+def evaluate(setting):
+    """Clusters the trajectory of the worker with one (distance, n_points,
+    presence) setting, presence in seconds. Returns its row of the table."""
+    distance, n_points, presence = setting
+    start = time.perf_counter()
+    seqscan = SeqScan(Trajectory(), None, None)
+    dataset = seqscan.scan_rows(_rows, distance, n_points, presence, candidates=_graph(distance).rows())
+
+    clustered = sum(kind == "cluster" for kind, _ in seqscan.point_labels())
+    durations = pd.Series([(c.last_timestamp() - c.first_timestamp()).total_seconds() for c in seqscan.clusters],
+                          dtype=float)
+    seqscan.clearObjectMemory(dataset)
+    return [distance, n_points, presence, len(durations), clustered, clustered / len(dataset) if dataset else 0.0,
+            durations.sum(), durations.mean(), durations.median(), durations.max(), time.perf_counter() - start]
+
+
+def sweep(trajectory, distances, n_values, presences, max_processors=1):
+    """Runs SEQSCAN on trajectory with every combination of the parameters.
+
+    Args:
+        trajectory (Trajectory): the trajectory
+        distances, n_values, presences (iterable): the values of distance,
+            n_points and presence (seconds) to combine
+        max_processors (int): processes evaluating the settings
+
+    Returns:
+        a DataFrame of SWEEP_COLUMNS, one row per setting by decreasing
+        distance: the number of stops, of clustered points and their ratio,
+        the total, mean, median and max stop durations (seconds) and the
+        runtime of the setting (seconds)
+    """
+    distances = sorted(set(distances), reverse=True)
+    settings = [(distance, n_points, presence) for distance in distances for n_points in n_values
+                for presence in presences]
+    if not settings:
+        raise ValueError("a sweep needs at least one value of each parameter")
+
+    seqscan = SeqScan(trajectory, None, None)
+    dataset = seqscan.load_datapoints(trajectory, seqscan.is_cartesian)
+    rows = [(p.geometry.lat, p.geometry.lon, p.time) for p in dataset]
+    graph = NeighborGraph.build([p.geometry.x for p in dataset], [p.geometry.y for p in dataset], distances[0])
+    del dataset
+
+    if max_processors > 1 and len(settings) > 1:
+        with ProcessPoolExecutor(max_workers=min(max_processors, len(settings)), initializer=_init_worker,
+                                 initargs=(rows, graph)) as ex:
+            results = list(ex.map(evaluate, settings))
+    else:
+        _init_worker(rows, graph)
+        try:
+            results = [evaluate(setting) for setting in settings]
+        finally:
+            _init_worker(None, None)
+    return pd.DataFrame(results, columns=SWEEP_COLUMNS)
@@ -0,0 +1,17 @@
+"""Test setup: the modules read ./config.json when imported, so the tests
+run from a scratch directory holding the configuration of the repository."""
+
+# Standard modules
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT = os.path.join(ROOT, 'input')
+
+_workdir = tempfile.mkdtemp(prefix='seqscan-tests-')
+for name in ('config.json', '.\\config.json'):
+    shutil.copy(os.path.join(ROOT, 'config.JSON'), os.path.join(_workdir, name))
+os.chdir(_workdir)
+sys.path.insert(0, ROOT)
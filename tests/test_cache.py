@@ -0,0 +1,38 @@
+# Standard modules
+import os
+from datetime import datetime
+
+import conftest  # noqa: F401
+from seqscan.cache import ResultCache, SCAN_INTERVAL
+
+LABELS = [("cluster", 1)] * 50
+STOPS = [(datetime(2020, 1, 1), datetime(2020, 1, 2), (1.0, 2.0))]
+
+
+def test_puts_do_not_scan_the_directory_each_time(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    scans = []
+    entries = cache.entries
+    cache.entries = lambda: scans.append(1) or entries()
+    for i in range(4 * SCAN_INTERVAL):
+        cache.put('%040x' % i, LABELS, STOPS)
+    assert len(scans) <= 5
+    assert cache.usage == (sum(size for used, size, path in entries()), 4 * SCAN_INTERVAL)
+
+
+def test_budget_kept(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=20)
+    for i in range(100):
+        cache.put('%040x' % i, LABELS, STOPS)
+        assert len(cache.entries()) <= 20
+
+
+def test_recently_used_entry_kept(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=10)
+    for i in range(10):
+        cache.put('%040x' % i, LABELS, STOPS)
+        os.utime(cache.path('%040x' % i), (i, i))
+    assert cache.get('%040x' % 0, len(LABELS)) is not None
+    cache.put('%040x' % 100, LABELS, STOPS)
+    kept = set(os.path.basename(path)[:-4] for used, size, path in cache.entries())
+    assert '%040x' % 0 in kept and '%040x' % 100 in kept and '%040x' % 1 not in kept
@@ -0,0 +1,29 @@
+# Standard modules
+import os
+
+import pandas as pd
+
+from conftest import INPUT
+from main_runSeqScan import mainRun
+
+
+def test_resume_complete_run_with_appended_tag(tmp_path):
+    rows = pd.read_csv(os.path.join(INPUT, 'atc_7traj.csv'))
+    last = rows['person_id'].iloc[-1]
+    partial = tmp_path / 'partial.csv'
+    full = tmp_path / 'full.csv'
+    rows[rows['person_id'] != last].to_csv(partial, index=False)
+    rows.to_csv(full, index=False)
+
+    # complete a resumable run, then append a tag to its input and resume
+    out = tmp_path / 'out' / 'out.csv'
+    mainRun().run_ss_multi_mode(1000, 10, 5, input_file=str(partial), output_file=str(out), resume=True)
+    os.replace(full, partial)
+    mainRun().run_ss_multi_mode(1000, 10, 5, input_file=str(partial), output_file=str(out), resume=True)
+
+    expected = tmp_path / 'expected.csv'
+    mainRun().run_ss_multi_mode(1000, 10, 5, input_file=str(partial), output_file=str(expected))
+    assert out.read_bytes() == expected.read_bytes()
+    # centroids are sums over sets of points: equal up to rounding
+    pd.testing.assert_frame_equal(pd.read_csv(out.parent / 'symbolic_out.csv'),
+                                  pd.read_csv(tmp_path / 'symbolic_expected.csv'))
@@ -0,0 +1,33 @@
+# Standard modules
+import os
+
+import pandas as pd
+
+from conftest import INPUT
+from seqscan.frame import seqscan_dataframe, TAG_COLUMN, TIME_COLUMN, X_COLUMN, Y_COLUMN
+from seqscan.seqscan import SeqScan, LABEL_COLUMNS
+from test_time_budget import stops_and_moves
+
+
+def test_labels_as_in_the_classification_output(tmp_path):
+    trajectory = stops_and_moves(stops=3)
+    SeqScan(trajectory, str(tmp_path / 'out.csv'), str(tmp_path / 'symbolic.csv')).run(20, 5, 60)
+    expected = pd.read_csv(tmp_path / 'out.csv')
+
+    df = pd.DataFrame({TAG_COLUMN: 1, TIME_COLUMN: [p.timestamp for p in trajectory],
+                       X_COLUMN: [p.lat for p in trajectory], Y_COLUMN: [p.lon for p in trajectory]})
+    labels, stops = seqscan_dataframe(df, 20, 5, 60)
+
+    assert len(stops) == 3
+    pd.testing.assert_frame_equal(labels, expected[LABEL_COLUMNS])
+
+
+def test_rows_without_tag(tmp_path):
+    df = pd.read_csv(os.path.join(INPUT, 'atc_7traj.csv'))
+    tagless = df.index[100]
+    df.loc[tagless, TAG_COLUMN] = float('nan')
+    labels, _ = seqscan_dataframe(df, 1000, 10, 5)
+
+    assert labels.loc[tagless].isna().all()
+    assert labels.drop(index=tagless).notna().all().all()
+    assert str(labels['cluster'].dtype) == 'Int64'
@@ -0,0 +1,31 @@
+import conftest  # noqa: F401
+from seqscan.seqscan import SeqScan
+from seqscan.online import OnlineSeqScan, LABEL, STOP_END
+from test_time_budget import stops_and_moves
+
+
+def batch(trajectory):
+    """The point labels and the stop times of a batch run."""
+    seqscan = SeqScan(trajectory, None, None)
+    seqscan.scan_rows(((p.lat, p.lon, p.timestamp) for p in trajectory), 20, 5, 60)
+    _, rows = seqscan.symbolic_rows()
+    return seqscan.point_labels(), [tuple(row[2:4]) for row in rows]
+
+
+def test_online_as_batch():
+    trajectory = stops_and_moves()
+    scan = OnlineSeqScan(20, 5, 60, tag_id=1)
+    events = []
+    held = 0
+    for p in trajectory:
+        events += scan.push(p.lat, p.lon, p.timestamp)
+        held = max(held, len(scan))
+    events += scan.close()
+
+    labels = [(e.label, e.stop) for e in events if e.kind == LABEL]
+    stops = [(e.first, e.last) for e in events if e.kind == STOP_END]
+    assert (labels, stops) == batch(trajectory)
+    # the state holds the points of the active time context only: a stop
+    # ends once the next one is found, so at most two stays and their walks
+    assert held <= 2 * (300 + 60) < len(trajectory)
+    assert len(scan) == 0
@@ -0,0 +1,38 @@
+import conftest  # noqa: F401
+import seqscan.seqscan as seqscan_module
+from seqscan.seqscan import SeqScan
+from test_time_budget import stops_and_moves
+
+
+def clustered(trajectory, scan):
+    """The point labels and the stop times of a SeqScan clustered by scan."""
+    seqscan = SeqScan(trajectory, None, None)
+    seqscan.dataset = seqscan.load_datapoints(trajectory, seqscan.is_cartesian)
+    seqscan.clusters = set()
+    scan(seqscan)
+    seqscan._analyze(seqscan.dataset)
+    _, rows = seqscan.symbolic_rows()
+    return seqscan.point_labels(), [row[2:4] for row in rows]
+
+
+def test_segments_as_sequential_run(monkeypatch):
+    monkeypatch.setattr(seqscan_module, 'MIN_SEGMENT_SIZE', 50)
+    trajectory = stops_and_moves()
+    segments = []
+
+    def scan_segments(seqscan):
+        segments.extend(seqscan.split(20, 4))
+        seqscan.scan_segments(segments, 20, 5, 60, 4)
+
+    labels, stops = clustered(trajectory, scan_segments)
+    assert len(segments) == 4
+    assert (labels, stops) == clustered(trajectory, lambda seqscan: seqscan.scan(seqscan.dataset, 20, 5, 60))
+    assert len(stops) == 8
+
+
+def test_pipeline_as_sequential_scan():
+    trajectory = stops_and_moves()
+    labels, stops = clustered(trajectory, lambda seqscan: seqscan.scan(seqscan.dataset, 20, 5, 60, pipeline=True))
+    assert (labels, stops) == clustered(
+        trajectory, lambda seqscan: seqscan.scan(seqscan.dataset, 20, 5, 60, pipeline=False))
+    assert len(stops) == 8
@@ -0,0 +1,29 @@
+# Standard modules
+import os
+
+import pytest
+
+from conftest import INPUT
+from main_runSeqScan import mainRun
+
+TRAJECTORY = os.path.join(INPUT, 'atc_7traj', '10001800.csv')
+
+
+@pytest.mark.parametrize('option', [dict(snapshot='run.snap'), dict(max_processors=2), dict(cache_dir='cache'),
+                                    dict(graph_dir='graphs'), dict(approximate=True),
+                                    dict(stationary_tolerance=0), dict(min_interval=10)])
+def test_windowed_mode_refuses_other_options(tmp_path, option):
+    with pytest.raises(ValueError, match='window_rows does not support ' + next(iter(option))):
+        mainRun().run_ss_single_mode(1000, 10, 5, TRAJECTORY, str(tmp_path / 'out.csv'),
+                                     str(tmp_path / 'symbolic_out.csv'), window_rows=1000, **option)
+    assert not os.path.exists(tmp_path / 'out.csv')
+
+
+@pytest.mark.parametrize('option', [dict(max_processors=2), dict(cache_dir='cache'), dict(graph_dir='graphs'),
+                                    dict(approximate=True), dict(stationary_tolerance=0), dict(min_displacement=5)])
+def test_snapshot_refuses_other_options(tmp_path, option):
+    with pytest.raises(ValueError, match='snapshot does not support ' + next(iter(option))):
+        mainRun().run_ss_single_mode(1000, 10, 5, TRAJECTORY, str(tmp_path / 'out.csv'),
+                                     str(tmp_path / 'symbolic_out.csv'), snapshot=str(tmp_path / 'run.snap'),
+                                     **option)
+    assert not os.path.exists(tmp_path / 'run.snap')
@@ -0,0 +1,24 @@
+import pandas as pd
+
+import conftest  # noqa: F401
+from seqscan.seqscan import SeqScan
+from seqscan.data import Trajectory
+from test_time_budget import stops_and_moves
+
+
+def test_resume_as_full_run(tmp_path):
+    trajectory = stops_and_moves()
+    points = list(trajectory)
+    output, symbolic = str(tmp_path / 'out.csv'), str(tmp_path / 'symbolic_out.csv')
+    snapshot = str(tmp_path / 'run.snap')
+    # cut in the middle of a stay: its labels are not final at the snapshot
+    SeqScan(Trajectory(points[:1500], tag_id=1), output, symbolic).run_snapshot(20, 5, 60, snapshot)
+    SeqScan(Trajectory(points[1500:2200], tag_id=1), output, symbolic).resume(snapshot)
+    SeqScan(Trajectory(points[2200:], tag_id=1), output, symbolic).resume(snapshot)
+
+    SeqScan(trajectory, str(tmp_path / 'full.csv'), str(tmp_path / 'symbolic_full.csv')).run(20, 5, 60)
+    assert (tmp_path / 'out.csv').read_bytes() == (tmp_path / 'full.csv').read_bytes()
+    stops = pd.read_csv(symbolic)
+    assert len(stops) == 8
+    # centroids are sums over sets of points: equal up to rounding
+    pd.testing.assert_frame_equal(stops, pd.read_csv(tmp_path / 'symbolic_full.csv'))
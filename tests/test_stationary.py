@@ -0,0 +1,81 @@
+# Standard modules
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import conftest  # noqa: F401
+from seqscan.seqscan import SeqScan
+from seqscan.point import Point
+from seqscan.feature_point import FeaturePoint
+from seqscan.region import LeafRegion
+from seqscan.stationary import compress
+from seqscan.data import Trajectory, Point as TrajectoryPoint
+
+
+def standing_still(stops=4, stay=200, walk=40, seed=1):
+    """A trajectory sampled every second whose positions change now and then
+    during the stays: the sensor records runs of identical positions."""
+    rng = random.Random(seed)
+    t = datetime(2024, 1, 1)
+    x = 0.0
+    points = []
+    for _ in range(stops):
+        position = (x, 0.0)
+        for _ in range(stay):
+            t += timedelta(seconds=1)
+            if rng.random() < 0.2:
+                position = (x + rng.gauss(0, 2), rng.gauss(0, 2))
+            points.append(TrajectoryPoint(*position, t))
+        for _ in range(walk):
+            t += timedelta(seconds=1)
+            x += 30
+            points.append(TrajectoryPoint(x, 0.0, t))
+    return Trajectory(points, tag_id=1)
+
+
+def test_runs_of_identical_positions():
+    trajectory = standing_still()
+    dataset = SeqScan(trajectory, None, None).load_datapoints(trajectory, True)
+    compressed, weights = compress(dataset, 0, True)
+    assert len(compressed) < len(dataset) / 2
+    assert weights.sum() == len(dataset)
+
+
+def run_files(tmp_path, name, **kwargs):
+    output = tmp_path / (name + '.csv')
+    symbolic = tmp_path / ('symbolic_' + name + '.csv')
+    SeqScan(standing_still(), str(output), str(symbolic)).run(20, 5, 60, **kwargs)
+    return output.read_bytes(), pd.read_csv(symbolic)
+
+
+def test_tolerance_zero_as_exact_run(tmp_path):
+    labels, stops = run_files(tmp_path, 'exact')
+    compressed_labels, compressed_stops = run_files(tmp_path, 'compressed', stationary_tolerance=0)
+    assert len(stops) == 4
+    assert compressed_labels == labels
+    # centroids are sums over other sets of points: equal up to rounding
+    pd.testing.assert_frame_equal(compressed_stops, stops)
+
+
+def test_weighted_points():
+    t = datetime(2024, 1, 1)
+    single = Point(FeaturePoint(0.0, 0.0, True), t)
+    weighted = Point(FeaturePoint(4.0, 0.0, True), t + timedelta(seconds=1), weight=3,
+                     end_time=t + timedelta(seconds=50))
+    single.neighbors.add(weighted)
+    # the neighbors count for their weights, the point itself included
+    assert single.is_dense(4, t - timedelta(seconds=1))
+    assert not single.is_dense(5, t - timedelta(seconds=1))
+    # only the neighbors in the time frame count
+    assert not single.is_dense(4, t)
+
+    SeqScan(Trajectory(tag_id=1), None, None).init_regions(40)
+    region = LeafRegion(single)
+    region.expand(single)
+    assert not region.is_persistent()
+    region.expand(weighted)
+    # the weighted point adds its span, up to its end_time
+    assert region.presence() == timedelta(seconds=50)
+    assert region.is_persistent()
+    assert region.compute_centroid() == (3.0, 0.0)
@@ -0,0 +1,24 @@
+import conftest  # noqa: F401
+from seqscan.online import LABEL, STOP_END
+from seqscan.stream import StreamRouter
+from test_online import batch
+from test_time_budget import stops_and_moves
+
+
+def test_spilled_tags_as_batch(tmp_path):
+    trajectories = {tag: stops_and_moves(stops=4, seed=tag) for tag in (1, 2, 3)}
+    router = StreamRouter(20, 5, 60, str(tmp_path / 'spill'), max_tags=1)
+    events = []
+    # bursts of a few points of each tag in turn: each switch spills a state
+    for start in range(0, len(trajectories[1]), 60):
+        for tag, points in trajectories.items():
+            for p in points[start:start + 60]:
+                events += router.route(tag, p.lat, p.lon, p.timestamp)
+    for last in router.close():
+        events += last
+    assert router.spills > 50 and router.reloads > 50
+
+    for tag, points in trajectories.items():
+        labels = [(e.label, e.stop) for e in events if e.kind == LABEL and e.tag_id == tag]
+        stops = [(e.first, e.last) for e in events if e.kind == STOP_END and e.tag_id == tag]
+        assert (labels, stops) == batch(points)
@@ -0,0 +1,50 @@
+# Standard modules
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import conftest  # noqa: F401
+from seqscan.seqscan import SeqScan, TimeBudgetExceeded, MAX_THINNING
+from seqscan.data import Trajectory, Point
+
+
+def stops_and_moves(stops=8, stay=300, walk=60, seed=1):
+    """A trajectory sampled every second: stays of stay points with some
+    jitter, separated by walks of walk points."""
+    rng = random.Random(seed)
+    t = datetime(2024, 1, 1)
+    x = y = 0.0
+    points = []
+    for _ in range(stops):
+        for _ in range(stay):
+            t += timedelta(seconds=1)
+            points.append(Point(x + rng.gauss(0, 2), y + rng.gauss(0, 2), t))
+        for _ in range(walk):
+            t += timedelta(seconds=1)
+            x += 30
+            points.append(Point(x, y, t))
+    return Trajectory(points, tag_id=1)
+
+
+def run_stops(trajectory, tmp_path, name, **kwargs):
+    SeqScan(trajectory, str(tmp_path / (name + '.csv')), str(tmp_path / ('symbolic_' + name + '.csv'))).run(
+        20, 5, 60, **kwargs)
+    stops = pd.read_csv(tmp_path / ('symbolic_' + name + '.csv'), parse_dates=['start_time', 'end_time'])
+    return list(zip(stops['start_time'], stops['end_time']))
+
+
+def test_thinning_bounded():
+    assert TimeBudgetExceeded(4, 1939).thinning() == MAX_THINNING
+    assert TimeBudgetExceeded(64, 1939).thinning() == 7
+    assert TimeBudgetExceeded(900, 1000).thinning() == 2
+
+
+def test_degraded_run_finds_the_stops(tmp_path):
+    trajectory = stops_and_moves()
+    full = run_stops(trajectory, tmp_path, 'full')
+    degraded = run_stops(trajectory, tmp_path, 'degraded',
+                         thinning=TimeBudgetExceeded(4, len(trajectory)).thinning())
+    assert len(full) == 8
+    for start, end in full:
+        assert any(s < end and start < e for s, e in degraded)
@@ -0,0 +1,45 @@
+# Standard modules
+import random
+from datetime import datetime, timedelta
+
+import conftest  # noqa: F401
+from seqscan.data import Trajectory, Point
+
+
+def burst(stay=1200, walk=20, jitter=300, step=1000, seed=1):
+    """A 1 Hz burst: a stay of stay points with some jitter, then a walk of
+    walk points moving step apart."""
+    rng = random.Random(seed)
+    t = datetime(2024, 1, 1)
+    points = []
+    for _ in range(stay):
+        t += timedelta(seconds=1)
+        points.append(Point(rng.uniform(-jitter, jitter), rng.uniform(-jitter, jitter), t))
+    for i in range(walk):
+        t += timedelta(seconds=1)
+        points.append(Point(1000 + i * step, 0, t))
+    return Trajectory(points, tag_id=1)
+
+
+def test_thin_drops_the_jitter_of_a_stay():
+    trajectory = burst()
+    thinned, mapping = trajectory.thin(min_displacement=2000)
+    # the stay keeps its first point; the walk one point every 2 steps
+    assert len(thinned) == 1 + 10
+    assert len(mapping) == len(trajectory)
+    for i, point in enumerate(trajectory):
+        kept = thinned[mapping[i]]
+        assert kept.timestamp <= point.timestamp
+        if kept.timestamp == point.timestamp:
+            assert (kept.lat, kept.lon) == (point.lat, point.lon)
+
+
+def test_thin_measures_from_the_last_kept_point():
+    t = datetime(2024, 1, 1)
+    points = [Point(x, 0, t + timedelta(seconds=i)) for i, x in enumerate([0, 6, 3, 9, 12, 16, 19, 30])]
+    thinned, mapping = Trajectory(points, tag_id=1).thin(min_displacement=10)
+    assert [p.lat for p in thinned] == [0, 12, 30]
+    assert mapping.tolist() == [0, 0, 0, 0, 1, 1, 1, 2]
+    # a point kept for its time slot is the new origin of the displacement
+    thinned, _ = Trajectory(points, tag_id=1).thin(min_interval=3, min_displacement=10)
+    assert [p.lat for p in thinned] == [0, 9, 19, 30]